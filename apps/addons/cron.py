@@ -1,6 +1,7 @@
 import array
 import itertools
 import logging
+import multiprocessing
 import operator
 import os
 import subprocess
@@ -20,12 +21,14 @@ from celeryutils import task
 import waffle
 
 import amo
-from amo.utils import chunked
+from amo.utils import chunked, SwapTable
 from addons import search
 from addons.models import Addon, FrozenAddon, AppSupport
 from files.models import File
-from lib.es.utils import raise_if_reindex_in_progress
+from lib.es.utils import (raise_if_reindex_in_progress, reindex_changed,
+                          reindex_objects, translated_since)
 from stats.models import UpdateCount
+from versions.models import Version
 
 log = logging.getLogger('z.cron')
 task_log = logging.getLogger('z.task')
@@ -365,53 +368,26 @@ def recs():
     except Exception:
         log.error('Could not call ps', exc_info=True)
 
-    sim = recommend.similarity  # Locals are faster.
-    sims, start, timers = {}, [time.time()], {'calc': [], 'sql': []}
-
-    def write_recs():
-        calc = time.time()
-        timers['calc'].append(calc - start[0])
-        try:
-            _dump_recs(sims)
-        except Exception:
-            recs_log.error('Error dumping recommendations. SQL issue.',
-                           exc_info=True)
-        sims.clear()
-        timers['sql'].append(time.time() - calc)
-        start[0] = time.time()
-
-    for idx, (addon, collections) in enumerate(addons.iteritems(), 1):
-        xs = [(other, sim(collections, cs))
-              for other, cs in addons.iteritems()]
-        # Sort by similarity and keep the top N.
-        others = sorted(xs, key=operator.itemgetter(1), reverse=True)
-        sims[addon] = [(k, v) for k, v in others[:11] if k != addon]
-
-        if idx % 50 == 0:
-            write_recs()
-    else:
-        write_recs()
+    # Only pairs of add-ons sharing a collection are compared, spread over
+    # a pool of processes. The table is rebuilt from scratch in a shadow
+    # copy, so the live one isn't locked while we write.
+    start = time.time()
+    processes = multiprocessing.cpu_count()
+    try:
+        with SwapTable('addon_recommendations',
+                       ['addon_id', 'other_addon_id', 'score']) as table:
+            for addon, others in recommend.top_similar(addons, 10,
+                                                       processes=processes):
+                for other, score in others:
+                    table.add((addon, other, score))
+    except Exception:
+        recs_log.error('Error dumping recommendations. SQL issue.',
+                       exc_info=True)
+        return
 
     avg_len = sum(len(v) for v in addons.itervalues()) / float(len(addons))
     recs_log.info('%s addons: average length: %.2f' % (len(addons), avg_len))
-    recs_log.info('Processing time: %.2fs' % sum(timers['calc']))
-    recs_log.info('SQL time: %.2fs' % sum(timers['sql']))
-
-
-def _dump_recs(sims):
-    # Dump a dictionary of {addon: (other_addon, score)} into the
-    # addon_recommendations table.
-    cursor = connections['default'].cursor()
-    addons = sims.keys()
-    vals = [(addon, other, score) for addon, others in sims.items()
-                                  for other, score in others]
-    cursor.execute('BEGIN')
-    cursor.execute('DELETE FROM addon_recommendations WHERE addon_id IN %s',
-                   [addons])
-    cursor.executemany("""
-        INSERT INTO addon_recommendations (addon_id, other_addon_id, score)
-        VALUES (%s, %s, %s)""", vals)
-    cursor.execute('COMMIT')
+    recs_log.info('Processing and SQL time: %.2fs' % (time.time() - start))
 
 
 def _group_addons(qs):
@@ -443,30 +419,103 @@ def give_personas_versions():
         log.info('Gave versions to %s personas.' % cursor.rowcount)
 
 
+def changed_addons(since, addon_type=None):
+    """
+    Ids of the add-ons that were modified since `since`, or whose versions,
+    files or translations were.
+    """
+    addons = Addon.with_deleted.all()
+    if addon_type:
+        addons = addons.filter(type=addon_type)
+    ids = set(addons.filter(modified__gte=since)
+                    .values_list('id', flat=True))
+    ids.update(Version.with_deleted.filter(modified__gte=since)
+                                   .values_list('addon', flat=True))
+    ids.update(File.objects.filter(modified__gte=since)
+                           .values_list('version__addon', flat=True))
+    ids.update(translated_since(addons, since))
+    if addon_type:
+        # Versions and files were not filtered by type.
+        ids = set(id for chunk in chunked(sorted(ids), 1000)
+                  for id in addons.filter(id__in=chunk)
+                                  .values_list('id', flat=True))
+    return ids
+
+
 @cronjobs.register
-def reindex_addons(index=None, aliased=True, addon_type=None):
+def reindex_addons(index=None, aliased=True, addon_type=None, inline=False,
+                   since=None):
+    """
+    With `inline`, index everything from this process instead of sending
+    chunks to celery. With `since`, only index the add-ons that changed
+    since then and unindex the ones that went away.
+    """
     from . import tasks
-    # Make sure our mapping is up to date.
-    search.setup_mapping(index, aliased)
     ids = (Addon.objects.values_list('id', flat=True)
            .filter(_current_version__isnull=False,
                    status__in=amo.VALID_STATUSES,
                    disabled_by_user=False))
     if addon_type:
         ids = ids.filter(type=addon_type)
-    ts = [tasks.index_addons.subtask(args=[chunk], kwargs=dict(index=index))
-          for chunk in chunked(sorted(list(ids)), 150)]
-    TaskSet(ts).apply_async()
+    if since:
+        reindex_changed('reindex_addons', tasks.index_addons, ids,
+                        changed_addons(since, addon_type), index, inline)
+        return
+    # Make sure our mapping is up to date.
+    search.setup_mapping(index, aliased)
+    reindex_objects('reindex_addons', tasks.index_addons, Addon, list(ids),
+                    index, inline)
 
 
 @cronjobs.register
-def reindex_apps(index=None, aliased=True):
+def reindex_apps(index=None, aliased=True, inline=False, since=None):
     """Apps do get indexed by `reindex_addons`, but run this for apps only."""
     from . import tasks
-    search.setup_mapping(index, aliased)
     ids = (Addon.objects.values_list('id', flat=True)
            .filter(type=amo.ADDON_WEBAPP, status__in=amo.VALID_STATUSES,
                    disabled_by_user=False))
-    ts = [tasks.index_addons.subtask(args=[chunk], kwargs=dict(index=index))
-          for chunk in chunked(sorted(list(ids)), 150)]
+    if since:
+        reindex_changed('reindex_apps', tasks.index_addons, ids,
+                        changed_addons(since, amo.ADDON_WEBAPP), index,
+                        inline)
+        return
+    search.setup_mapping(index, aliased)
+    reindex_objects('reindex_apps', tasks.index_addons, Addon, list(ids),
+                    index, inline)
+
+
+@cronjobs.register
+def build_theme_updates():
+    """
+    Rebuild the documents services/theme_update.py serves, for every theme.
+    They are rebuilt as themes change, this fills the cache from scratch.
+    """
+    if not settings.SERVICES_THEME_UPDATE_TIMEOUT:
+        return
+    from . import tasks
+    ids = (Addon.objects.filter(type=amo.ADDON_PERSONA,
+                                status=amo.STATUS_PUBLIC,
+                                disabled_by_user=False)
+           .values_list('id', flat=True))
+    ts = [tasks.build_theme_update.subtask(args=[chunk])
+          for chunk in chunked(ids, 100)]
     TaskSet(ts).apply_async()
+
+
+@cronjobs.register
+def build_update_index():
+    """Rebuild the snapshot services/update.py answers update pings from."""
+    path = settings.SERVICES_UPDATE_INDEX
+    if not path:
+        return
+    # Build it from the same connection the service uses so the snapshot
+    # holds exactly the values the SQL path would have returned.
+    from services import update, update_index
+    start = time.time()
+    conn = update.mypool.connect()
+    try:
+        count = update_index.build(conn.cursor(), path, amo.STATUS_DELETED)
+    finally:
+        conn.close()
+    log.info('Built update index with %s addons in %.2fs.' %
+             (count, time.time() - start))
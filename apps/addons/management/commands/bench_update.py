@@ -0,0 +1,80 @@
+import os
+import tempfile
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+import amo
+from addons.models import Addon
+
+
+class Command(BaseCommand):
+    """
+    Compare requests/sec of services/update.py answering from the database
+    against answering from the compiled update index.
+
+    Both modes answer the same pings and the outputs are compared, so this
+    doubles as a check that the index is byte-identical to the SQL path.
+    """
+    help = 'Benchmark the update service with and without the update index.'
+    option_list = BaseCommand.option_list + (
+        make_option('--addons', action='store', type='int', dest='addons',
+                    default=500, help='Number of add-ons to ping for.'),
+        make_option('--requests', action='store', type='int',
+                    dest='requests', default=5000,
+                    help='Number of pings per mode.'),
+        make_option('--app-version', action='store', type='string',
+                    dest='app_version', default='17.0',
+                    help='appVersion sent by the fake clients.'),
+    )
+
+    def handle(self, *args, **options):
+        from services import update, update_index
+
+        guids = list(Addon.objects.filter(status=amo.STATUS_PUBLIC,
+                                          disabled_by_user=False)
+                                  .exclude(guid=None)
+                                  .exclude(type=amo.ADDON_WEBAPP)
+                                  .values_list('guid', flat=True)
+                                  [:options['addons']])
+        if not guids:
+            raise CommandError('No add-ons to ping for.')
+        pings = [{'reqVersion': '1', 'id': guid, 'version': '0.1',
+                  'appID': amo.FIREFOX.guid,
+                  'appVersion': options['app_version'],
+                  'appOS': 'Linux'}
+                 for guid in guids]
+        pings = [pings[i % len(pings)] for i in xrange(options['requests'])]
+
+        fd, path = tempfile.mkstemp(suffix='.idx')
+        os.close(fd)
+        try:
+            conn = update.mypool.connect()
+            start = time.time()
+            count = update_index.build(conn.cursor(), path,
+                                       amo.STATUS_DELETED)
+            conn.close()
+            self.stdout.write('Built index of %s add-ons in %.2fs.\n' %
+                              (count, time.time() - start))
+            index = update_index.UpdateIndex(path)
+
+            results = {}
+            for mode, idx in (('sql', None), ('index', index)):
+                output = []
+                start = time.time()
+                for data in pings:
+                    output.append(update.Update(data, index=idx).get_rdf())
+                took = time.time() - start
+                results[mode] = output
+                self.stdout.write('%s: %s requests in %.2fs, %.0f req/s\n' %
+                                  (mode, len(pings), took, len(pings) / took))
+        finally:
+            os.unlink(path)
+
+        different = sum(1 for a, b in zip(results['sql'], results['index'])
+                        if a != b)
+        if different:
+            raise CommandError('%s responses differ between the modes.' %
+                               different)
+        self.stdout.write('All responses are identical.\n')
@@ -50,7 +50,7 @@ from translations.query import order_by_translation
 from users.models import UserForeignKey, UserProfile
 from users.utils import find_users
 from versions.compare import version_int
-from versions.models import Version
+from versions.models import ApplicationsVersions, Version
 
 from . import query, signals
 
@@ -1629,6 +1629,46 @@ def watch_disabled(old_attr={}, new_attr={}, instance=None, sender=None, **kw):
             f.hide_disabled_file()
 
 
+def invalidate_update_cache(sender=None, instance=None, **kw):
+    """Bump the generation of the responses cached by the update service."""
+    if kw.get('raw'):
+        return
+    cache.add(amo.UPDATE_KEYVERSION, 1)
+    cache.incr(amo.UPDATE_KEYVERSION)
+
+
+@Addon.on_change
+def watch_update_fields(old_attr={}, new_attr={}, instance=None, sender=None,
+                        **kw):
+    fields = ('status', 'disabled_by_user', 'guid', 'type', 'premium_type')
+    if any(old_attr.get(f) != new_attr.get(f) for f in fields):
+        invalidate_update_cache()
+
+
+@Addon.on_change
+def watch_theme_update(old_attr={}, new_attr={}, instance=None, sender=None,
+                       **kw):
+    """Rebuild the documents services/theme_update.py serves a theme from."""
+    if (instance.type != amo.ADDON_PERSONA or
+        not settings.SERVICES_THEME_UPDATE_TIMEOUT):
+        return
+    # Editing a theme bumps `modified`, see `EditThemeForm.save`.
+    fields = ('status', 'disabled_by_user', 'slug', 'modified', 'name_id',
+              'summary_id')
+    if any(old_attr.get(f) != new_attr.get(f) for f in fields):
+        from . import tasks
+        tasks.build_theme_update.delay([instance.id])
+
+
+for _sender in (File, Version, ApplicationsVersions):
+    dbsignals.post_save.connect(invalidate_update_cache, sender=_sender,
+                                dispatch_uid='update_cache_%s' %
+                                _sender._meta.db_table)
+    dbsignals.post_delete.connect(invalidate_update_cache, sender=_sender,
+                                  dispatch_uid='update_cache_%s' %
+                                  _sender._meta.db_table)
+
+
 def attach_devices(addons):
     addon_dict = dict((a.id, a) for a in addons if a.type == amo.ADDON_WEBAPP)
     devices = (AddonDeviceType.objects.filter(addon__in=addon_dict)
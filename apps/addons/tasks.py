@@ -21,7 +21,7 @@ from versions.models import Version
 from . import cron, search  # NOQA
 from .models import (Addon, attach_categories, attach_devices, attach_prices,
                      attach_tags, attach_translations, CompatOverride,
-                     IncompatibleVersions, Preview)
+                     IncompatibleVersions, invalidate_update_cache, Preview)
 
 
 log = logging.getLogger('z.task')
@@ -110,7 +110,8 @@ def index_addons(ids, **kw):
     log.info('Indexing addons %s-%s. [%s]' % (ids[0], ids[-1], len(ids)))
     transforms = (attach_categories, attach_devices, attach_prices,
                   attach_tags, attach_translations)
-    index_objects(ids, Addon, search, kw.pop('index', None), transforms)
+    index_objects(ids, Addon, search, kw.pop('index', None), transforms,
+                  kw.pop('checkpoint', None))
 
 
 @task
@@ -265,6 +266,8 @@ def update_incompatible_appversions(data, **kw):
     # Increment namespace cache of compat versions.
     for addon_id in addon_ids:
         cache_ns_key('d2c-versions:%s' % addon_id, increment=True)
+    if addon_ids:
+        invalidate_update_cache()
 
 
 def make_checksum(header_path, footer_path):
@@ -291,6 +294,19 @@ def rereviewqueuetheme_checksum(rqt, **kw):
         rqt.save()
 
 
+@task
+def build_theme_update(ids, **kw):
+    """Rebuild the documents services/theme_update.py serves themes from."""
+    if not settings.SERVICES_THEME_UPDATE_TIMEOUT:
+        return
+    from services import theme_update
+    cursor = connection.cursor()
+    for addon_id in ids:
+        count = theme_update.store(cursor, addon_id)
+        log.info('Built %s theme update documents for %s.' %
+                 (count, addon_id))
+
+
 @task
 @write
 def save_theme(header, footer, addon, **kw):
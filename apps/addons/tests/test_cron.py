@@ -12,6 +12,7 @@ from django.core.management.base import CommandError
 from files.models import File, Platform
 from lib.es.management.commands.reindex import flag_database, unflag_database
 from stats.models import UpdateCount
+from translations.models import Translation
 from versions.models import Version
 
 
@@ -263,3 +264,50 @@ class TestReindex(amo.tests.ESTestCase):
             self.refresh()
             eq_(sorted(a.id for a in Addon.search()),
                 sorted(a.id for a in self.apps + self.addons))
+
+    def test_since(self):
+        cron.reindex_addons()
+        self.refresh()
+        gone = self.addons[0]
+        Addon.objects.filter(id=gone.id).update(status=amo.STATUS_DELETED)
+        cron.reindex_addons(
+            since=datetime.datetime.now() - datetime.timedelta(minutes=5))
+        self.refresh()
+        eq_(sorted(a.id for a in Addon.search()),
+            sorted(a.id for a in self.apps + self.addons[1:]))
+
+
+class TestChangedAddons(amo.tests.TestCase):
+    fixtures = ['base/addon_3615']
+
+    def setUp(self):
+        old = datetime.datetime(2012, 1, 1)
+        for model in (Addon.with_deleted, Version.with_deleted, File.objects,
+                      Translation.objects):
+            model.update(modified=old)
+        self.since = datetime.datetime(2013, 1, 1)
+
+    def test_nothing(self):
+        eq_(cron.changed_addons(self.since), set())
+
+    def test_addon(self):
+        Addon.objects.filter(id=3615).update(modified=self.since)
+        eq_(cron.changed_addons(self.since), set([3615]))
+
+    def test_version(self):
+        Version.objects.filter(addon=3615).update(modified=self.since)
+        eq_(cron.changed_addons(self.since), set([3615]))
+
+    def test_file(self):
+        File.objects.filter(version__addon=3615).update(modified=self.since)
+        eq_(cron.changed_addons(self.since), set([3615]))
+
+    def test_translation(self):
+        addon = Addon.objects.get(id=3615)
+        Translation.objects.filter(id=addon.name_id).update(
+            modified=self.since)
+        eq_(cron.changed_addons(self.since), set([3615]))
+
+    def test_type(self):
+        Version.objects.filter(addon=3615).update(modified=self.since)
+        eq_(cron.changed_addons(self.since, amo.ADDON_WEBAPP), set())
@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
 import json
 from StringIO import StringIO
+from wsgiref.handlers import format_date_time
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db import connection
 
 import mock
 from nose import SkipTest
 from nose.tools import eq_
 
+import amo
 import amo.tests
 from addons.models import Addon
 from services import theme_update
@@ -22,6 +25,8 @@ class TestWSGIApplication(amo.tests.TestCase):
 
     @mock.patch('services.theme_update.ThemeUpdate')
     def test_wsgi_application_200(self, ThemeUpdate_mock):
+        ThemeUpdate_mock.return_value.get_document.return_value = (
+            '{}', '"etag"', 0)
         urls = {
             '/themes/update-check/5': ['en-US', 5, None],
             '/en-US/themes/update-check/5': ['en-US', 5, None],
@@ -133,3 +138,123 @@ class TestThemeUpdate(amo.tests.TestCase):
 
         self.check_good(
             json.loads(self.get_update('en-US', 813, 'src=gp').get_json()))
+
+
+def fake_update(locale, id_, qs, cursor=None):
+    update = mock.Mock()
+    update.get_document.return_value = (
+        '%s %s %s' % (locale, id_, qs), '"%s-%s"' % (locale, id_), 1000)
+    return update
+
+
+@mock.patch.object(theme_update, 'DOC_TIMEOUT', 60)
+class TestThemeUpdateDocuments(amo.tests.TestCase):
+    fixtures = ['addons/persona']
+
+    def setUp(self):
+        cache.clear()
+        self.addon = Addon.objects.get()
+        self.addon.name = {'fr': u'Ma Persona'}
+        self.addon.save()
+        self.start_response = mock.Mock()
+
+    @mock.patch('services.theme_update.ThemeUpdate', fake_update)
+    def store(self):
+        return theme_update.store(connection.cursor(), self.addon.id)
+
+    def test_store(self):
+        eq_(self.store(), 4)
+        eq_(theme_update.get_document('fr', 15663, None)[0], 'fr 15663 None')
+        eq_(theme_update.get_document('en-US', 15663, None)[0],
+            'en-US 15663 None')
+        eq_(theme_update.get_document('fr', 813, 'src=gp')[0],
+            'fr 813 src=gp')
+
+    def test_fallback(self):
+        self.store()
+        # No name in German, like the SQL it falls back to en-US.
+        eq_(theme_update.get_document('de', 15663, None)[0],
+            'en-US 15663 None')
+        eq_(theme_update.get_document('../', 15663, None)[0],
+            'en-US 15663 None')
+
+    def test_case_goes_to_db(self):
+        self.store()
+        eq_(theme_update.get_document('FR', 15663, None), None)
+
+    def test_not_stored(self):
+        eq_(theme_update.get_document('en-US', 15663, None), None)
+
+    @mock.patch.object(theme_update, 'DOC_TIMEOUT', 0)
+    def test_off(self):
+        self.store()
+        eq_(theme_update.get_document('en-US', 15663, None), None)
+
+    def test_not_public(self):
+        self.store()
+        with mock.patch('services.theme_update.ThemeUpdate') as update:
+            update.return_value.get_document.return_value = None
+            eq_(theme_update.store(connection.cursor(), self.addon.id), 0)
+        eq_(theme_update.get_document('en-US', 15663, None), None)
+        eq_(theme_update.get_document('en-US', 813, 'src=gp'), None)
+
+    def call(self, **environ):
+        environ.update({'wsgi.input': StringIO(),
+                        'PATH_INFO': '/fr/themes/update-check/15663'})
+        with mock.patch('services.theme_update.ThemeUpdate') as update:
+            output = theme_update.application(environ, self.start_response)
+            assert not update.called
+        return self.start_response.call_args[0], output
+
+    def test_application(self):
+        self.store()
+        (status, headers), output = self.call()
+        eq_(status, '200 OK')
+        eq_(output, ['fr 15663 None'])
+        headers = dict(headers)
+        eq_(headers['ETag'], '"fr-15663"')
+        eq_(headers['Last-Modified'], format_date_time(1000))
+
+    def test_etag(self):
+        self.store()
+        (status, headers), output = self.call(HTTP_IF_NONE_MATCH='"fr-15663"')
+        eq_(status, '304 Not Modified')
+        eq_(output, [''])
+        assert 'Content-Length' not in dict(headers)
+        eq_(self.call(HTTP_IF_NONE_MATCH='"nope"')[0][0], '200 OK')
+
+    def test_if_modified_since(self):
+        self.store()
+        eq_(self.call(HTTP_IF_MODIFIED_SINCE=format_date_time(1000))[0][0],
+            '304 Not Modified')
+        eq_(self.call(HTTP_IF_MODIFIED_SINCE=format_date_time(999))[0][0],
+            '200 OK')
+
+
+@mock.patch.object(settings, 'SERVICES_THEME_UPDATE_TIMEOUT', 60)
+@mock.patch('addons.tasks.build_theme_update.delay')
+class TestThemeUpdateRebuild(amo.tests.TestCase):
+    fixtures = ['addons/persona']
+
+    def setUp(self):
+        self.addon = Addon.objects.get()
+
+    def test_status(self, delay):
+        self.addon.update(status=amo.STATUS_DISABLED)
+        delay.assert_called_with([15663])
+
+    def test_edited(self, delay):
+        self.addon.save()
+        assert delay.called
+
+    def test_other_fields(self, delay):
+        self.addon.update(average_daily_users=5)
+        assert not delay.called
+
+    @mock.patch('addons.tasks.connection')
+    @mock.patch('services.theme_update.store')
+    def test_task(self, store, connection, delay):
+        from addons.tasks import build_theme_update
+        store.return_value = 2
+        build_theme_update([15663])
+        store.assert_called_with(connection.cursor.return_value, 15663)
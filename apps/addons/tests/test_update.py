@@ -1,21 +1,24 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime, timedelta
 from email import utils
+import os
+import tempfile
 import urllib
 import urlparse
 
 from django.db import connection
 from django.utils.encoding import smart_str
 
+import mock
 from nose.tools import eq_
 
 import amo
 import amo.tests
 from addons.models import (Addon, CompatOverride, CompatOverrideRange,
-                           IncompatibleVersions)
+                           IncompatibleVersions, invalidate_update_cache)
 from applications.models import Application, AppVersion
 from files.models import File
-from services import update
+from services import host, update, update_index, utils as services_utils
 import settings_local
 from versions.models import ApplicationsVersions, Version
 
@@ -818,3 +821,251 @@ class TestResponse(amo.tests.TestCase):
         data['appVersion'] = '5.0.1'
         upd = self.get(data)
         eq_(upd.get_rdf(), upd.get_no_updates_rdf())
+
+
+class TestResponseCache(amo.tests.TestCase):
+
+    def setUp(self):
+        self.cache = update.ResponseCache(2, 60, 0)
+        self.data = {'reqVersion': 1, 'id': 'guid', 'version': '1.0',
+                     'appID': amo.FIREFOX.guid, 'appVersion': '17.0'}
+
+    def key(self, **kw):
+        data = dict(self.data, **kw)
+        return self.cache.key(data, 'strict')
+
+    def test_key(self):
+        eq_(self.key(), self.key())
+        assert self.key() != self.key(appVersion='18.0')
+        assert self.key() != self.cache.key(self.data, 'normal')
+
+    def test_disabled(self):
+        self.cache.size = 0
+        eq_(self.key(), None)
+
+    def test_watermark_not_cached(self):
+        eq_(self.key(**{amo.WATERMARK_KEY: 'a@b.com'}), None)
+
+    def test_invalidate(self):
+        key = self.key()
+        invalidate_update_cache()
+        assert self.key() != key
+
+    @mock.patch('services.update.time')
+    def test_version_checked_every_interval(self, time):
+        self.cache.check = 5
+        time.return_value = 1000
+        key = self.key()
+        invalidate_update_cache()
+        time.return_value = 1004
+        eq_(self.key(), key)
+        time.return_value = 1005
+        assert self.key() != key
+
+    def test_get_set(self):
+        key = self.key()
+        eq_(self.cache.get(key), None)
+        self.cache.set(key, 'rdf')
+        eq_(self.cache.get(key), 'rdf')
+
+    def test_lru(self):
+        one, two, three = [self.key(id=guid) for guid in 'abc']
+        self.cache.set(one, '1')
+        self.cache.set(two, '2')
+        eq_(self.cache.get(one), '1')
+        self.cache.set(three, '3')
+        eq_(self.cache.get(one), '1')
+        eq_(self.cache.get(two), None)
+        eq_(self.cache.get(three), '3')
+
+    @mock.patch('services.update.time')
+    def test_expires(self, time):
+        time.return_value = 1000
+        key = self.key()
+        self.cache.set(key, 'rdf')
+        time.return_value = 1061
+        eq_(self.cache.get(key), None)
+
+
+class TestTemplate(amo.tests.TestCase):
+
+    def test_render(self):
+        data = {'type': 'extension', 'guid': 'guid', 'version': 1,
+                'appguid': amo.FIREFOX.guid, 'min': '3.0', 'max': '4.0',
+                'url': u'http://\xf8', 'if_update': '', 'if_hash': ''}
+        eq_(update.good_template.render(data), update.good_rdf % data)
+
+
+_Update = update.Update
+
+
+class UpdateIndexMixin(object):
+    """
+    Runs the tests of the class it's mixed into against the update index,
+    which is rebuilt from the database for every `Update`.
+    """
+
+    def setUp(self):
+        super(UpdateIndexMixin, self).setUp()
+        fd, self.index_path = tempfile.mkstemp()
+        os.close(fd)
+        patcher = mock.patch.object(update, 'Update', self.indexed_update)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        os.unlink(self.index_path)
+        super(UpdateIndexMixin, self).tearDown()
+
+    def indexed_update(self, data, compat_mode='strict'):
+        update_index.build(connection.cursor(), self.index_path,
+                           amo.STATUS_DELETED)
+        index = update_index.UpdateIndex(self.index_path)
+        return _Update(data, compat_mode, index=index)
+
+
+class TestDataValidateIndex(UpdateIndexMixin, TestDataValidate):
+    pass
+
+
+class TestLookupIndex(UpdateIndexMixin, TestLookup):
+    pass
+
+
+class TestDefaultToCompatIndex(UpdateIndexMixin, TestDefaultToCompat):
+    pass
+
+
+class TestResponseIndex(UpdateIndexMixin, TestResponse):
+    pass
+
+
+class TestUpdateIndex(amo.tests.TestCase):
+    fixtures = ['base/addon_3615']
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'update.idx')
+        self.build()
+
+    def build(self):
+        return update_index.build(connection.cursor(), self.path,
+                                  amo.STATUS_DELETED)
+
+    def test_lookup_is_case_insensitive(self):
+        index = update_index.UpdateIndex(self.path)
+        guid = Addon.objects.get(pk=3615).guid
+        eq_(index.get(guid.upper())['addon'][0], 3615)
+
+    def test_deleted(self):
+        Addon.objects.get(pk=3615).update(status=amo.STATUS_DELETED)
+        self.build()
+        eq_(len(update_index.UpdateIndex(self.path)), 0)
+
+    def test_missing(self):
+        os.unlink(self.path)
+        eq_(update_index.get_index(self.path, interval=0), None)
+
+    def test_hot_swap(self):
+        index = update_index.get_index(self.path, interval=0)
+        eq_(len(index), 1)
+        eq_(update_index.get_index(self.path, interval=0), index)
+
+        Addon.objects.get(pk=3615).update(status=amo.STATUS_DELETED)
+        self.build()
+        swapped = update_index.get_index(self.path, interval=0)
+        assert swapped is not index
+        eq_(len(swapped), 0)
+
+    def test_corrupt_keeps_current(self):
+        index = update_index.get_index(self.path, interval=0)
+        with open(self.path + '.new', 'wb') as fp:
+            fp.write('garbage')
+        os.rename(self.path + '.new', self.path)
+        eq_(update_index.get_index(self.path, interval=0), index)
+
+
+    @mock.patch.object(update, 'response_cache', update.ResponseCache(0, 0))
+    def test_application(self):
+        data = {'id': Addon.objects.get(pk=3615).guid, 'version': '2.0.58',
+                'reqVersion': 1, 'appID': amo.FIREFOX.guid,
+                'appVersion': '3.7a1pre'}
+        db = update.Update(data)
+        db.cursor = connection.cursor()
+        expected = db.get_rdf()
+        assert 'updateLink' in expected
+
+        update_index._current.update(index=None, checked=0)
+        self.addCleanup(update_index._current.update, index=None, checked=0)
+        start_response = mock.Mock()
+        with mock.patch.multiple(settings_local, create=True,
+                                 SERVICES_UPDATE_INDEX=self.path,
+                                 SERVICES_UPDATE_INDEX_CHECK=0):
+            with mock.patch.object(update, 'mypool') as mypool:
+                output = update.application(
+                    {'QUERY_STRING': urllib.urlencode(data)}, start_response)
+        eq_(output, [expected])
+        eq_(start_response.call_args[0][0], '200 OK')
+        assert not mypool.connect.called
+
+
+class TestServicesPool(amo.tests.TestCase):
+
+    def setUp(self):
+        self.shared = mock.Mock()
+        self.pool = services_utils.AppPool(self.shared, 'update', 1)
+
+    def test_limit(self):
+        conn = self.pool.connect()
+        assert not self.pool.semaphore.acquire(False)
+        conn.close()
+        assert self.pool.semaphore.acquire(False)
+
+    def test_close_once(self):
+        conn = self.pool.connect()
+        conn.close()
+        conn.close()
+        eq_(self.shared.connect.return_value.close.call_count, 1)
+
+    def test_garbage_collected(self):
+        self.pool.connect()
+        assert self.pool.semaphore.acquire(False)
+
+    def test_proxies(self):
+        self.pool.connect().cursor()
+        assert self.shared.connect.return_value.cursor.called
+
+    def test_connect_fails(self):
+        self.shared.connect.side_effect = ValueError
+        self.assertRaises(ValueError, self.pool.connect)
+        assert self.pool.semaphore.acquire(False)
+
+    def test_no_limit(self):
+        pool = services_utils.AppPool(self.shared, 'update')
+        eq_(pool.connect(), self.shared.connect.return_value)
+
+    @mock.patch.object(services_utils.settings, 'SERVICES_DATABASE_LIMITS',
+                       {'limited': 3})
+    def test_get_pool(self):
+        limited = services_utils.get_pool('limited')
+        assert limited is services_utils.get_pool('limited')
+        assert limited.semaphore is not None
+        assert services_utils.get_pool('unlimited').semaphore is None
+        assert (limited.shared is
+                services_utils.get_pool('unlimited').shared)
+
+
+class TestServicesHost(amo.tests.TestCase):
+
+    def test_mounts(self):
+        for path, app in (('/services/status/', host.verify),
+                          ('/verify/', host.verify),
+                          ('/en-US/themes/update-check/5', host.theme_update),
+                          ('/themes/update-check/5', host.theme_update),
+                          ('/update/VersionCheck.php', host.update),
+                          ('/pfs.php', host.pfs)):
+            eq_(host.get_app(path), app.application)
+
+    def test_not_found(self):
+        start_response = mock.Mock()
+        eq_(host.application({'PATH_INFO': '/nope'}, start_response), [''])
+        eq_(start_response.call_args[0][0], '404 Not Found')
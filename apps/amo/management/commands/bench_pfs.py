@@ -0,0 +1,54 @@
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from amo.management.commands._pfs_legacy import legacy_output, requests
+from services import pfs
+
+
+class Command(BaseCommand):
+    """
+    Compare the CPU time services/pfs.py takes per request with the old
+    chain of if-else and regexes, with the compiled rules and with the rules
+    and a warm cache of the rendered RDF.
+
+    Every mode answers the same requests and the outputs are compared, so
+    this also checks the table gives byte-identical responses.
+    """
+    help = 'Benchmark the plugin finder service.'
+    option_list = BaseCommand.option_list + (
+        make_option('--requests', action='store', type='int',
+                    dest='requests', default=50000,
+                    help='Number of requests per mode.'),
+    )
+
+    def handle(self, *args, **options):
+        every = list(requests())
+        random.seed(0)
+        sample = [random.choice(every) for i in xrange(options['requests'])]
+
+        different = sum(1 for data in every
+                        if not same(legacy_output(data), pfs.render(data)))
+        if different:
+            raise CommandError('%s of %s responses differ.' %
+                               (different, len(every)))
+        self.stdout.write('All %s responses are identical.\n' % len(every))
+
+        pfs.rdf_cache.size = max(pfs.rdf_cache.size, len(every))
+        for data in every:
+            pfs.get_output(data)
+        modes = (('if-else', legacy_output), ('compiled', pfs.render),
+                 ('cached', pfs.get_output))
+        for mode, func in modes:
+            start = time.clock()
+            for data in sample:
+                func(data)
+            took = time.clock() - start
+            self.stdout.write('%s: %.1fus of CPU per request\n' %
+                              (mode, took * 1000000 / len(sample)))
+
+
+def same(a, b):
+    return a == b and type(a) == type(b)
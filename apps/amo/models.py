@@ -299,19 +299,22 @@ class SearchMixin(object):
     def index(cls, document, id=None, bulk=False, force_insert=False,
               index=None):
         """Wrapper around pyes.ES.index."""
+        index = index or cls._get_index()
         search.get_es().index(
-            document, index=index or cls._get_index(),
-            doc_type=cls._meta.db_table, id=id, bulk=bulk,
-            force_insert=force_insert)
+            document, index=index, doc_type=cls._meta.db_table, id=id,
+            bulk=bulk, force_insert=force_insert)
+        search.invalidate(index)
 
     @classmethod
     def unindex(cls, id, index=None):
         es = search.get_es()
+        index = index or cls._get_index()
         try:
-            es.delete(index or cls._get_index(), cls._meta.db_table, id)
+            es.delete(index, cls._meta.db_table, id)
         except pyes.exceptions.NotFoundException:
             # Item wasn't found, whatevs.
             pass
+        search.invalidate(index)
 
     @classmethod
     def search(cls, index=None):
@@ -1,7 +1,10 @@
+import hashlib
+import json
 import logging
 from operator import itemgetter
 
 from django.conf import settings as dj_settings
+from django.core.cache import cache
 
 from django_statsd.clients import statsd
 from elasticutils import S as EU_S
@@ -75,6 +78,27 @@ def get_es(hosts=None, default_indexes=None, timeout=None, dump_curl=None,
     return es
 
 
+def _namespace(index):
+    # amo.utils imports this module.
+    from amo.utils import cache_ns_key
+    return 'es:%s' % index, cache_ns_key
+
+
+def _refreshing_key(index):
+    return 'es:%s:refreshing' % index
+
+
+def invalidate(index):
+    """
+    Drop the cached results of searches on `index`. What was just indexed
+    only shows up in searches once ES refreshes the index, so results
+    aren't cached again for ES_REFRESH_INTERVAL seconds.
+    """
+    namespace, cache_ns_key = _namespace(index)
+    cache_ns_key(namespace, increment=True)
+    cache.set(_refreshing_key(index), 1, dj_settings.ES_REFRESH_INTERVAL)
+
+
 class ES(object):
 
     def __init__(self, type_, index):
@@ -83,6 +107,7 @@ class ES(object):
         self.steps = []
         self.start = 0
         self.stop = None
+        self.timeout = None
         self.as_list = self.as_dict = False
         self._results_cache = None
 
@@ -93,6 +118,16 @@ class ES(object):
             new.steps.append(next_step)
         new.start = self.start
         new.stop = self.stop
+        new.timeout = self.timeout
+        return new
+
+    def cache(self, timeout=None):
+        """
+        Keep the raw results in the cache for `timeout` seconds, or until
+        something gets indexed in or removed from the index.
+        """
+        new = self._clone()
+        new.timeout = timeout or dj_settings.ES_CACHE_TIMEOUT
         return new
 
     def values(self, *fields):
@@ -257,8 +292,22 @@ class ES(object):
             self._results_cache = ResultClass(self.type, hits, self.fields)
         return self._results_cache
 
+    def _cache_key(self, qs):
+        namespace, cache_ns_key = _namespace(self.index)
+        body = json.dumps(qs, sort_keys=True, default=unicode)
+        digest = hashlib.md5('%s:%s' % (self.type._meta.db_table, body))
+        return 'es:results:%s:%s' % (cache_ns_key(namespace),
+                                     digest.hexdigest())
+
     def raw(self):
         qs = self._build_query()
+        if self.timeout:
+            key = self._cache_key(qs)
+            hits = cache.get(key)
+            if hits is not None:
+                statsd.incr('search.es.cache.hit')
+                return hits
+            statsd.incr('search.es.cache.miss')
         es = get_es()
         try:
             with statsd.timer('search.es.timer') as timer:
@@ -268,6 +317,8 @@ class ES(object):
             raise
         statsd.timing('search.es.took', hits['took'])
         log.debug('[%s] [%s] %s' % (hits['took'], timer.ms, qs))
+        if self.timeout and not cache.get(_refreshing_key(self.index)):
+            cache.set(key, hits, self.timeout)
         return hits
 
     def __iter__(self):
@@ -13,7 +13,8 @@ from nose.tools import eq_, assert_raises, raises
 
 from amo.utils import (cache_ns_key, escape_all, find_language,
                        LocalFileStorage, no_translation, resize_image,
-                       rm_local_tmp_dir, slugify, slug_validator, to_language)
+                       rm_local_tmp_dir, slugify, slug_validator, SwapTable,
+                       to_language)
 from product_details import product_details
 
 u = u'Ελληνικά'
@@ -247,3 +248,68 @@ def test_escape_all():
     ]
     for val, expected in s:
         yield check, val, expected
+
+
+class TestSwapTable(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('amo.utils.connections')
+        self.connections = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cursor = self.connections.__getitem__.return_value.cursor()
+        self.cursor.fetchone.return_value = (
+            'recs', 'CREATE TABLE `recs` (\n  `a` int(11) NOT NULL,\n'
+            '  CONSTRAINT `a_refs_id_1` FOREIGN KEY (`a`) '
+            'REFERENCES `addons` (`id`)\n) ENGINE=InnoDB')
+
+    def sql(self):
+        return [c[0][0] for c in self.cursor.execute.call_args_list]
+
+    def test_swap(self):
+        with SwapTable('recs', ['a', 'b'], batch_size=2) as table:
+            for row in [(1, 2), (3, 4), (5, 6)]:
+                table.add(row)
+        sql = self.sql()
+        eq_(sql[:3], ['DROP TABLE IF EXISTS `recs_shadow`',
+                      'SHOW CREATE TABLE `recs`',
+                      'CREATE TABLE `recs_shadow` (\n  `a` int(11) NOT NULL,\n'
+                      '  CONSTRAINT `a_refs_id_1_s` FOREIGN KEY (`a`) '
+                      'REFERENCES `addons` (`id`)\n) ENGINE=InnoDB'])
+        eq_(sql[3], 'INSERT INTO `recs_shadow` (`a`, `b`) '
+                    'VALUES (%s, %s), (%s, %s)')
+        eq_(self.cursor.execute.call_args_list[3][0][1], [1, 2, 3, 4])
+        eq_(sql[4], 'INSERT INTO `recs_shadow` (`a`, `b`) VALUES (%s, %s)')
+        eq_(sql[5:], ['RENAME TABLE `recs` TO `recs_old`, '
+                      '`recs_shadow` TO `recs`',
+                      'DROP TABLE `recs_old`'])
+        eq_(table.rows, 3)
+
+    def test_constraints_swapped_back(self):
+        self.cursor.fetchone.return_value = (
+            'recs', 'CREATE TABLE `recs` (CONSTRAINT `a_refs_id_1_s` '
+            'FOREIGN KEY (`a`) REFERENCES `addons` (`id`))')
+        with SwapTable('recs', ['a']):
+            pass
+        eq_(self.sql()[2], 'CREATE TABLE `recs_shadow` (CONSTRAINT '
+                           '`a_refs_id_1` FOREIGN KEY (`a`) REFERENCES '
+                           '`addons` (`id`))')
+
+    def test_error_drops_shadow(self):
+        with assert_raises(ValueError):
+            with SwapTable('recs', ['a']) as table:
+                table.add((1,))
+                raise ValueError
+        sql = self.sql()
+        eq_(sql[-1], 'DROP TABLE IF EXISTS `recs_shadow`')
+        assert not any(s.startswith(('INSERT', 'RENAME')) for s in sql)
+
+    def test_infile(self):
+        with SwapTable('recs', ['a', 'b'], infile=True) as table:
+            table.add((1, u'\xe9\tx'))
+            table.add((None, 'a\\b\n'))
+            with open(table._file.name) as fp:
+                table._file.flush()
+                eq_(fp.read(), '1\t\xc3\xa9\\tx\n\\N\ta\\\\b\\n\n')
+        sql = self.sql()
+        eq_(sql[3], 'LOAD DATA LOCAL INFILE %s INTO TABLE `recs_shadow` '
+                    '(`a`, `b`)')
@@ -1,8 +1,14 @@
+import re
+
 import amo
 import amo.tests
+from amo.management.commands._pfs_legacy import (legacy_output, requests,
+                                                 WMP)
+from services import pfs
 from services.pfs import get_output
 
 from  pyquery import PyQuery as pq
+from nose.tools import eq_
 
 
 class TestPfs(amo.tests.TestCase):
@@ -14,3 +20,114 @@ class TestPfs(amo.tests.TestCase):
                   'licenseURL', 'needsRestart']:
             res = get_output({k: 'fooo<script>alert("foo")</script>;'})
             assert not pq(res)('script')
+
+
+class TestPfsRules(amo.tests.TestCase):
+
+    def setUp(self):
+        self.data = {'mimetype': 'application/x-shockwave-flash',
+                     'appID': '{ec8030f7-c20a-464f-9b0e-13a3a9e97384}',
+                     'appVersion': '2008052906', 'clientOS': 'Windows NT 5.1',
+                     'chromeLocale': 'en-US'}
+
+    def get(self, field, **kw):
+        data = dict(self.data, **kw)
+        return re.search('<pfs:%s>(.*)</pfs:%s>' % (field, field),
+                         pfs.render(data)).group(1)
+
+    def test_flash(self):
+        eq_(self.get('name'), 'Adobe Flash Player')
+        eq_(self.get('guid'), '{4cfaef8a-a6c9-41a0-8e6f-967eb8f49143}')
+        eq_(self.get('needsRestart'), 'false')
+
+    def test_flash_linux(self):
+        eq_(self.get('name', clientOS='Linux x86_64'), 'Adobe Flash Player')
+        eq_(self.get('guid', clientOS='Linux x86_64'), '-1')
+        eq_(self.get('guid', clientOS='sunos 5.10'), '-1')
+
+    def test_not_found(self):
+        eq_(self.get('name', mimetype='application/x-foo'), '-1')
+        eq_(self.get('name', clientOS='FreeBSD'), '-1')
+
+    def test_missing_field(self):
+        del self.data['chromeLocale']
+        eq_(self.get('name'), '-1')
+        eq_(self.get('requestedMimetype'), 'application/x-shockwave-flash')
+
+    def test_shockwave_locale(self):
+        eq_(self.get('licenseURL', mimetype='application/x-director'),
+            'http://www.adobe.com/go/eula_shockwaveplayer')
+        eq_(self.get('licenseURL', mimetype='application/x-director',
+                     chromeLocale='ja-JP'),
+            'http://www.adobe.com/go/eula_shockwaveplayer_jp')
+
+    def test_java(self):
+        for mimetype in ['application/x-java-vm',
+                         'application/x-java-applet;version=1.4.2',
+                         'application/x-java-bean;jpi-version=1.5']:
+            eq_(self.get('name', mimetype=mimetype),
+                'Java Runtime Environment')
+        eq_(self.get('name', mimetype='application/x-java-bean;version=1.6'),
+            '-1')
+
+    def test_wmp(self):
+        eq_(self.get('name', mimetype='video/x-ms-wmv'),
+            'Windows Media Player')
+        eq_(self.get('name', mimetype='video/x-ms-wmv',
+                     clientOS='Intel Mac OS X 10.8'), 'Flip4Mac')
+        eq_(self.get('name', mimetype='video/x-ms-wmv',
+                     clientOS='Linux i686'), '-1')
+
+    def test_wmp_mimetypes(self):
+        for mimetype in WMP:
+            eq_(self.get('name', mimetype=mimetype), 'Windows Media Player')
+
+    def test_divx(self):
+        eq_(self.get('XPILocation', mimetype='video/divx'),
+            'http://download.divx.com/player/DivXWebPlayer.xpi')
+        eq_(self.get('XPILocation', mimetype='video/divx',
+                     clientOS='PPC Mac OS X 10.4'),
+            'http://download.divx.com/player/DivXWebPlayerMac.xpi')
+
+
+class TestPfsLegacy(amo.tests.TestCase):
+
+    def test_same_output(self):
+        # The table doesn't list the mimetypes, the old regexes matched them.
+        for data in requests():
+            eq_(pfs.render(data), legacy_output(data))
+
+
+class TestPfsCache(amo.tests.TestCase):
+
+    def setUp(self):
+        self.cache = pfs.rdf_cache
+        pfs.rdf_cache = pfs.RDFCache(2)
+        self.data = {'mimetype': 'video/divx', 'appID': '{ec8030f7}',
+                     'appVersion': '2008052906', 'clientOS': 'Windows NT 5.1',
+                     'chromeLocale': 'en-US'}
+
+    def tearDown(self):
+        pfs.rdf_cache = self.cache
+
+    def test_cached(self):
+        output = get_output(self.data)
+        eq_(output, pfs.render(self.data))
+        eq_(pfs.rdf_cache.get(pfs.rdf_cache.key(self.data)), output)
+        # The app doesn't change the response, it shares the entry.
+        eq_(get_output(dict(self.data, appID='{other}')), output)
+        eq_(len(pfs.rdf_cache.data), 1)
+
+    def test_missing_field(self):
+        get_output(self.data)
+        data = dict(self.data)
+        del data['appVersion']
+        eq_(get_output(data), pfs.render(data))
+        eq_(len(pfs.rdf_cache.data), 2)
+
+    def test_size(self):
+        for os in ['Windows NT 5.1', 'Linux', 'PPC Mac OS X']:
+            get_output(dict(self.data, clientOS=os))
+        eq_(len(pfs.rdf_cache.data), 2)
+        assert (pfs.rdf_cache.key(self.data)
+                not in pfs.rdf_cache.data)
@@ -1,4 +1,5 @@
 from django.core import paginator
+from django.core.cache import cache
 
 import mock
 from nose import SkipTest
@@ -48,6 +49,77 @@ class TestNoESIndexing(amo.tests.TestCase):
         assert issubclass(es.__class__, mock.Mock)
 
 
+class TestESCache(amo.tests.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('amo.search.get_es')
+        self.es = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.es.search.return_value = {'took': 1, 'hits': {'total': 0,
+                                                           'hits': []}}
+
+    def test_not_cached(self):
+        Addon.search().raw()
+        Addon.search().raw()
+        eq_(self.es.search.call_count, 2)
+
+    @mock.patch('amo.search.statsd')
+    def test_cached(self, statsd):
+        eq_(Addon.search().cache().filter(type=1).raw(),
+            self.es.search.return_value)
+        eq_(Addon.search().cache().filter(type=1).raw(),
+            self.es.search.return_value)
+        eq_(self.es.search.call_count, 1)
+        eq_([c[0][0] for c in statsd.incr.call_args_list],
+            ['search.es.cache.miss', 'search.es.cache.hit'])
+
+    def test_clone(self):
+        qs = Addon.search().cache(10)
+        eq_(qs.filter(type=1)[:5].timeout, 10)
+        eq_(Addon.search().timeout, None)
+
+    def test_different_query(self):
+        Addon.search().cache().filter(type=1).raw()
+        Addon.search().cache().filter(type=2).raw()
+        Addon.search().cache().filter(type=1)[:10].raw()
+        eq_(self.es.search.call_count, 3)
+
+    def test_different_index(self):
+        Addon.search().cache().raw()
+        Addon.search(index='other').cache().raw()
+        eq_(self.es.search.call_count, 2)
+
+    def test_invalidate(self):
+        Addon.search().cache().raw()
+        amo.search.invalidate(Addon._get_index())
+        Addon.search().cache().raw()
+        eq_(self.es.search.call_count, 2)
+
+    def test_not_cached_while_refreshing(self):
+        amo.search.invalidate(Addon._get_index())
+        Addon.search().cache().raw()
+        Addon.search().cache().raw()
+        eq_(self.es.search.call_count, 2)
+        cache.delete('es:%s:refreshing' % Addon._get_index())
+        Addon.search().cache().raw()
+        Addon.search().cache().raw()
+        eq_(self.es.search.call_count, 3)
+
+    def test_index_invalidates(self):
+        Addon.search().cache().raw()
+        Addon.index({'id': 1}, id=1)
+        Addon.search().cache().raw()
+        Addon.unindex(1)
+        Addon.search().cache().raw()
+        eq_(self.es.search.call_count, 3)
+
+    def test_other_index_not_invalidated(self):
+        Addon.search().cache().raw()
+        amo.search.invalidate('other')
+        Addon.search().cache().raw()
+        eq_(self.es.search.call_count, 1)
+
+
 class TestES(amo.tests.ESTestCase):
     test_es = True
 
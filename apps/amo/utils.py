@@ -12,6 +12,7 @@ import os
 import random
 import re
 import shutil
+import tempfile
 import time
 import unicodedata
 import urllib
@@ -28,6 +29,7 @@ from django.core.files.storage import (FileSystemStorage,
                                        default_storage as storage)
 from django.core.serializers import json
 from django.core.validators import ValidationError, validate_slug
+from django.db import connections
 from django.core.mail import EmailMessage, EmailMultiAlternatives
 from django.forms.fields import Field
 from django.http import HttpRequest
@@ -1109,3 +1111,123 @@ def find_language(locale):
         return locale
 
     return None
+
+
+class SwapTable(object):
+    """
+    Rebuild a whole derived table without locking the live one: rows are
+    streamed into a shadow copy which is then atomically renamed over it.
+
+        with SwapTable('addon_recommendations',
+                       ['addon_id', 'other_addon_id', 'score']) as table:
+            for row in rows:
+                table.add(row)
+
+    Rows are inserted `batch_size` at a time with multi-row INSERTs, or with
+    `infile=True` spooled to a temp file and sent with LOAD DATA LOCAL
+    INFILE, which needs `local_infile` on the connection. If anything
+    raises the shadow table is dropped and the live one is left alone.
+
+    The shadow is created from SHOW CREATE TABLE, foreign keys included.
+    Constraint names are unique per database, so the shadow's get a `_s`
+    suffix, or lose it if the live table already had it from the last swap.
+    """
+
+    def __init__(self, table, columns, using='default', batch_size=1000,
+                 infile=False):
+        self.table = table
+        self.columns = list(columns)
+        self.using = using
+        self.batch_size = batch_size
+        self.infile = infile
+        self.shadow = '%s_shadow' % table
+        self.old = '%s_old' % table
+        self.rows = 0
+        self.elapsed = 0
+        self._batch = []
+        self._file = None
+
+    def __enter__(self):
+        self.start = time.time()
+        self.cursor = connections[self.using].cursor()
+        self.cursor.execute('DROP TABLE IF EXISTS `%s`' % self.shadow)
+        self.cursor.execute('SHOW CREATE TABLE `%s`' % self.table)
+        self.cursor.execute(self._shadow_sql(self.cursor.fetchone()[1]))
+        if self.infile:
+            self._file = tempfile.NamedTemporaryFile(prefix=self.table,
+                                                     suffix='.tsv')
+        return self
+
+    def _shadow_sql(self, create):
+        """The CREATE TABLE of the live table, for the shadow."""
+        def constraint(match):
+            name = match.group(1)
+            if name.endswith('_s'):
+                name = name[:-2]
+            else:
+                # MySQL identifiers are at most 64 characters long.
+                name = name[:62] + '_s'
+            return 'CONSTRAINT `%s`' % name
+
+        create = create.replace('CREATE TABLE `%s`' % self.table,
+                                'CREATE TABLE `%s`' % self.shadow, 1)
+        return re.sub(r'CONSTRAINT `([^`]+)`', constraint, create)
+
+    def add(self, row):
+        self.rows += 1
+        if self._file:
+            self._file.write('\t'.join(self._escape(v) for v in row) + '\n')
+            return
+        self._batch.append(row)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def _escape(self, value):
+        if value is None:
+            return r'\N'
+        if isinstance(value, float):
+            return repr(value)
+        value = smart_str(value)
+        for char, escaped in (('\\', r'\\'), ('\t', r'\t'), ('\n', r'\n')):
+            value = value.replace(char, escaped)
+        return value
+
+    def flush(self):
+        if not self._batch:
+            return
+        row = '(%s)' % ', '.join(['%s'] * len(self.columns))
+        self.cursor.execute(
+            'INSERT INTO `%s` (%s) VALUES %s' % (
+                self.shadow, ', '.join('`%s`' % c for c in self.columns),
+                ', '.join([row] * len(self._batch))),
+            list(itertools.chain(*self._batch)))
+        self._batch = []
+
+    def __exit__(self, exc_type, exc_value, tb):
+        try:
+            if exc_type is not None:
+                self.cursor.execute('DROP TABLE IF EXISTS `%s`' % self.shadow)
+                return
+            self._load()
+            # RENAME TABLE swaps both in one atomic step.
+            self.cursor.execute('RENAME TABLE `%s` TO `%s`, `%s` TO `%s`' %
+                                (self.table, self.old, self.shadow,
+                                 self.table))
+            self.cursor.execute('DROP TABLE `%s`' % self.old)
+        finally:
+            if self._file:
+                self._file.close()
+        self.elapsed = time.time() - self.start
+        log.info('Loaded %s rows into %s in %.2fs (%.0f rows/sec).' %
+                 (self.rows, self.table, self.elapsed,
+                  self.rows / self.elapsed if self.elapsed else 0))
+
+    def _load(self):
+        if not self._file:
+            self.flush()
+            return
+        self._file.flush()
+        self.cursor.execute(
+            "LOAD DATA LOCAL INFILE %%s INTO TABLE `%s` (%s)" %
+            (self.shadow, ', '.join('`%s`' % c for c in self.columns)),
+            [self._file.name])
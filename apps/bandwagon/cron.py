@@ -12,6 +12,7 @@ import amo
 from amo.utils import chunked, slugify
 from bandwagon.models import (Collection, SyncedCollection, CollectionUser,
                               CollectionVote, CollectionWatcher)
+from lib.es.utils import reindex_changed, reindex_objects, translated_since
 import cronjobs
 
 task_log = commonware.log.getLogger('z.task')
@@ -184,10 +185,16 @@ def _drop_collection_recs(**kw):
 
 
 @cronjobs.register
-def reindex_collections(index=None, aliased=True):
+def reindex_collections(index=None, aliased=True, inline=False, since=None):
     from . import tasks
     ids = (Collection.objects.exclude(type=amo.COLLECTION_SYNCHRONIZED)
            .values_list('id', flat=True))
-    taskset = [tasks.index_collections.subtask(args=[chunk], kwargs=dict(index=index))
-               for chunk in chunked(sorted(list(ids)), 150)]
-    TaskSet(taskset).apply_async()
+    if since:
+        changed = set(Collection.objects.filter(modified__gte=since)
+                                        .values_list('id', flat=True))
+        changed.update(translated_since(Collection.objects.all(), since))
+        reindex_changed('reindex_collections', tasks.index_collections, ids,
+                        changed, index, inline)
+        return
+    reindex_objects('reindex_collections', tasks.index_collections,
+                    Collection, list(ids), index, inline)
@@ -106,7 +106,8 @@ def collection_watchers(*ids, **kw):
 def index_collections(ids, **kw):
     log.debug('Indexing collections %s-%s [%s].' % (ids[0], ids[-1], len(ids)))
     index = kw.pop('index', None)
-    index_objects(ids, Collection, search, index, [attach_translations])
+    index_objects(ids, Collection, search, index, [attach_translations],
+                  kw.pop('checkpoint', None))
 
 
 def attach_translations(collections):
@@ -0,0 +1,12 @@
+import logging
+
+from celeryutils import task
+
+log = logging.getLogger('z.task')
+
+
+@task
+def build_blocklist(apiver, app, generation, **kw):
+    from .views import build_blocklist
+    log.info('Building blocklist %s for %s.' % (apiver, app))
+    build_blocklist(apiver, app, generation)
@@ -4,12 +4,15 @@ from xml.dom import minidom
 
 from django.conf import settings
 from django.core.cache import cache
+from django.utils.http import http_date
 
+import mock
 from nose.tools import eq_
 
 import amo
 import amo.tests
 from amo.urlresolvers import reverse
+from blocklist import tasks, views
 from blocklist.models import (BlocklistApp, BlocklistCA, BlocklistDetail,
                               BlocklistGfx, BlocklistItem, BlocklistPlugin)
 
@@ -517,3 +520,81 @@ class BlocklistCATest(BlocklistViewTest):
         dom = minidom.parseString(r.content)
         ca = dom.getElementsByTagName('caBlocklistEntry')[0]
         eq_(base64.b64decode(ca.childNodes[0].toxml()), self.ca.data)
+
+
+class BlocklistCompiledTest(BlocklistViewTest):
+
+    def setUp(self):
+        super(BlocklistCompiledTest, self).setUp()
+        self.plugin, self.app = self.create_blplugin(
+            app_guid=amo.FIREFOX.guid, app_min='3.0', app_max='4.0',
+            name='flash', details=self.details)
+
+    def test_etag(self):
+        r = self.client.get(self.fx4_url)
+        etag = r['ETag']
+        r = self.client.get(self.fx4_url, HTTP_IF_NONE_MATCH=etag)
+        eq_(r.status_code, 304)
+        eq_(r['ETag'], etag)
+        eq_(r.content, '')
+
+        self.plugin.update(name='shockwave')
+        r = self.client.get(self.fx4_url, HTTP_IF_NONE_MATCH=etag)
+        eq_(r.status_code, 200)
+        assert r['ETag'] != etag
+
+    def test_last_modified(self):
+        r = self.client.get(self.fx4_url)
+        last_modified = r['Last-Modified']
+        eq_(self.client.get(self.fx4_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+                .status_code, 304)
+        eq_(self.client.get(self.fx4_url,
+                            HTTP_IF_MODIFIED_SINCE=http_date(0)).status_code,
+            200)
+
+    def test_etag_wins(self):
+        r = self.client.get(self.fx4_url)
+        r = self.client.get(self.fx4_url, HTTP_IF_NONE_MATCH='"nope"',
+                            HTTP_IF_MODIFIED_SINCE=r['Last-Modified'])
+        eq_(r.status_code, 200)
+
+    def test_built_once_for_all_appvers(self):
+        with mock.patch('blocklist.views.CompiledBlocklist',
+                        wraps=views.CompiledBlocklist) as compiled:
+            for appver, blocked in (('2.0', False), ('3.5', True),
+                                    ('3.6', True), ('5.0', False)):
+                url = reverse('blocklist', args=[2, amo.FIREFOX.guid, appver])
+                content = self.client.get(url).content
+                eq_('<pluginItems>' in content, blocked)
+                eq_('flash' in content, blocked)
+        eq_(compiled.call_count, 1)
+
+    def test_same_as_unfiltered(self):
+        url = reverse('blocklist', args=[2, amo.FIREFOX.guid, '3.5'])
+        blocklist = views.CompiledBlocklist(2, amo.FIREFOX.guid, 1)
+        content = self.client.get(url).content
+        eq_(content, blocklist.render(None)[0])
+        eq_(content.count(views.MARK), 0)
+
+    def test_lastupdate_follows_appver(self):
+        self.plugin.update(modified=datetime(2030, 1, 1))
+        in_range = reverse('blocklist', args=[2, amo.FIREFOX.guid, '3.5'])
+        out_of_range = reverse('blocklist', args=[2, amo.FIREFOX.guid, '2.0'])
+        ms = views.to_ms(datetime(2030, 1, 1))
+        eq_(self.dom(in_range).getElementsByTagName('blocklist')[0]
+                .getAttribute('lastupdate'), str(ms))
+        assert (self.dom(out_of_range).getElementsByTagName('blocklist')[0]
+                    .getAttribute('lastupdate') != str(ms))
+
+    @mock.patch('blocklist.tasks.build_blocklist.delay')
+    def test_stale_while_building(self, delay):
+        self.client.get(self.fx4_url)
+        self.plugin.update(name='shockwave')
+        for i in range(2):
+            content = self.client.get(self.fx4_url).content
+            assert 'flash' in content
+            assert 'shockwave' not in content
+        eq_(delay.call_count, 1)
+        apiver, app, generation = delay.call_args[0]
+        tasks.build_blocklist(apiver, app, generation)
+        assert 'shockwave' in self.client.get(self.fx4_url).content
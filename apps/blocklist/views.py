@@ -5,13 +5,16 @@ from datetime import datetime
 from operator import attrgetter
 import time
 
+from django import http
 from django.core.cache import cache
 from django.db.models import Q, signals as db_signals
 from django.shortcuts import get_object_or_404
 from django.utils.cache import patch_cache_control
 from django.utils.encoding import smart_str
+from django.utils.http import http_date, parse_http_date_safe
 
 import jingo
+import jinja2
 
 from amo.utils import sorted_groupby
 from amo.tasks import flush_front_end_cache_urls
@@ -23,49 +26,183 @@ from .models import (BlocklistApp, BlocklistCA, BlocklistDetail, BlocklistGfx,
 App = collections.namedtuple('App', 'guid min max')
 BlItem = collections.namedtuple('BlItem', 'rows os modified block_id')
 
+KEYVERSION = 'blocklist:keyversion'
+# Blocklists are rebuilt when something changes, this only bounds how long
+# an unused one stays around.
+BLOCKLIST_TIMEOUT = 60 * 60 * 24
+MARK = u'\x00'
+
 
 def blocklist(request, apiver, app, appver):
-    key = 'blocklist:%s:%s:%s' % (apiver, app, appver)
-    # Use md5 to make sure the memcached key is clean.
-    key = hashlib.md5(smart_str(key)).hexdigest()
-    cache.add('blocklist:keyversion', 1)
-    version = cache.get('blocklist:keyversion')
-    response = cache.get(key, version=version)
-    if response is None:
-        response = _blocklist(request, apiver, app, appver)
-        cache.set(key, response, 60 * 60, version=version)
+    blocklist = get_blocklist(int(apiver), app)
+    body, last_update = blocklist.render(appver)
+    etag = '"%s"' % hashlib.md5(body).hexdigest()
+    # last_update is in milliseconds.
+    last_modified = last_update // 1000
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if if_none_match:
+        not_modified = (etag in [e.strip() for e in if_none_match.split(',')]
+                        or if_none_match.strip() == '*')
+    else:
+        not_modified = (if_modified_since is not None and
+                        if_modified_since >= last_modified)
+
+    if not_modified:
+        response = http.HttpResponseNotModified()
+    else:
+        response = http.HttpResponse(body, content_type='text/xml')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
     patch_cache_control(response, max_age=60 * 60)
     return response
 
 
-def _blocklist(request, apiver, app, appver):
-    apiver = int(apiver)
-    items = get_items(apiver, app, appver)[0]
-    plugins = get_plugins(apiver, app, appver)
-    gfxs = BlocklistGfx.objects.filter(Q(guid__isnull=True) | Q(guid=app))
-    cas = None
+def get_generation():
+    cache.add(KEYVERSION, 1)
+    return cache.get(KEYVERSION)
+
+
+def blocklist_key(apiver, app):
+    # Use md5 to make sure the memcached key is clean.
+    key = hashlib.md5(smart_str('%s:%s' % (apiver, app))).hexdigest()
+    return 'blocklist:%s' % key
+
+
+def get_blocklist(apiver, app):
+    """
+    Return the `CompiledBlocklist` of (apiver, app).
+
+    When the blocklist changed, the one we've got keeps being served while
+    celery builds the new one, so an edit doesn't make every client render
+    the template.
+    """
+    generation = get_generation()
+    key = blocklist_key(apiver, app)
+    blocklist = cache.get(key)
+    if blocklist is None:
+        blocklist = build_blocklist(apiver, app, generation)
+    elif blocklist.generation != generation:
+        # Only ask for it once.
+        if cache.add('%s:building:%s' % (key, generation), 1, 60):
+            from . import tasks
+            tasks.build_blocklist.delay(apiver, app, generation)
+            # It's done already if celery runs tasks eagerly.
+            blocklist = cache.get(key) or blocklist
+    return blocklist
+
+
+def build_blocklist(apiver, app, generation):
+    blocklist = CompiledBlocklist(apiver, app, generation)
+    cache.set(blocklist_key(apiver, app), blocklist, BLOCKLIST_TIMEOUT)
+    return blocklist
+
 
-    try:
-        cas = BlocklistCA.objects.all()[0]
-        cas = base64.b64encode(cas.data)
-    except IndexError:
-        pass
+def mark(name):
+    return jinja2.Markup(u'%s%s%s' % (MARK, name, MARK))
 
-    # Find the latest created/modified date across all sections.
-    all_ = list(items.values()) + list(plugins) + list(gfxs)
-    last_update = max(x.modified for x in all_) if all_ else datetime.now()
+
+def to_ms(dt):
     # The client expects milliseconds, Python's time returns seconds.
-    last_update = int(time.mktime(last_update.timetuple()) * 1000)
-    data = dict(items=items, plugins=plugins, gfxs=gfxs, apiver=apiver,
-                appguid=app, appver=appver, last_update=last_update, cas=cas)
-    return jingo.render(request, 'blocklist/blocklist.xml', data,
-                        content_type='text/xml')
+    return int(time.mktime(dt.timetuple()) * 1000)
+
+
+class CompiledBlocklist(object):
+    """
+    The blocklist of an (apiver, app), rendered once for all the appvers.
+
+    Before API version 3, plugins outside of the appver's range are left
+    out. The template marks where each plugin starts and ends so that
+    `render` can cut them out of the output instead of rendering it again.
+    """
+
+    def __init__(self, apiver, app, generation):
+        self.apiver = apiver
+        self.generation = generation
+        items = get_items(apiver, app)[0]
+        plugins = get_plugins(apiver, app)
+        gfxs = list(BlocklistGfx.objects.filter(Q(guid__isnull=True) |
+                                                Q(guid=app)))
+        cas = None
+
+        try:
+            cas = BlocklistCA.objects.all()[0]
+            cas = base64.b64encode(cas.data)
+        except IndexError:
+            pass
+
+        # Find the latest created/modified date across all sections, the
+        # plugins are added in depending on the appver.
+        all_ = list(items.values()) + gfxs
+        self.modified = max(to_ms(x.modified) for x in all_) if all_ else 0
+        self.created = to_ms(datetime.now())
+        self.plugins = [(p.app_min, p.app_max, to_ms(p.modified))
+                        for p in plugins]
+
+        data = dict(items=items, plugins=plugins, gfxs=gfxs, apiver=apiver,
+                    appguid=app, last_update=mark('last_update'), cas=cas,
+                    mark=mark)
+        xml = jingo.env.get_template('blocklist/blocklist.xml').render(data)
+
+        # A list of (owner, text), the owner being None for what's always
+        # there, 'plugins' for the plugins section and the index of each
+        # plugin.
+        self.segments = []
+        owner = None
+        for index, token in enumerate(xml.split(MARK)):
+            if not index % 2:
+                self.segments.append((owner, token.encode('utf-8')))
+            elif token == 'last_update':
+                self.segments.append(('last_update', ''))
+            elif token == '/plugins':
+                owner = None
+            elif token == 'plugins':
+                owner = 'plugins'
+            else:
+                owner = int(token)
+
+    def render(self, appver):
+        """Return the XML for `appver` and its last update, in ms."""
+        plugins = range(len(self.plugins))
+        if self.apiver < 3 and appver is not None:
+            plugins = filter_plugins(self.plugins, appver)
+        keep = set(plugins)
+        if plugins:
+            keep.add('plugins')
+
+        modified = [self.modified] + [self.plugins[i][2] for i in plugins]
+        last_update = max(modified) or self.created
+        out = []
+        for owner, text in self.segments:
+            if owner == 'last_update':
+                out.append(str(last_update))
+            elif owner is None or owner in keep:
+                out.append(text)
+        return ''.join(out), last_update
+
+
+def filter_plugins(plugins, appver):
+    """
+    Indexes of the (app_min, app_max, ...) `plugins` blocked for `appver`.
+    API versions < 3 ignore targetApplication entries for plugins so only
+    block the plugin if the appver is within the block range.
+    """
+    def between(ver, min, max):
+        if not (min and max):
+            return True
+        return version_int(min) < ver < version_int(max)
+    app_version = version_int(appver)
+    return [i for i, plugin in enumerate(plugins)
+            if between(app_version, plugin[0], plugin[1])]
 
 
 def clear_blocklist(*args, **kw):
-    # Something in the blocklist changed; invalidate all responses.
-    cache.add('blocklist:keyversion', 1)
-    cache.incr('blocklist:keyversion')
+    # Something in the blocklist changed, the next request for each
+    # blocklist rebuilds it.
+    cache.add(KEYVERSION, 1)
+    cache.incr(KEYVERSION)
     flush_front_end_cache_urls.delay(['/blocklist/*'])
 
 
@@ -112,15 +249,11 @@ def get_plugins(apiver, app, appver=None):
                .extra(select={'app_guid': 'blapps.guid',
                               'app_min': 'blapps.min',
                               'app_max': 'blapps.max'}))
+    plugins = list(plugins)
     if apiver < 3 and appver is not None:
-        def between(ver, min, max):
-            if not (min and max):
-                return True
-            return version_int(min) < ver < version_int(max)
-        app_version = version_int(appver)
-        plugins = [p for p in plugins if between(app_version, p.app_min,
-                                                 p.app_max)]
-    return list(plugins)
+        ranges = [(p.app_min, p.app_max) for p in plugins]
+        plugins = [plugins[i] for i in filter_plugins(ranges, appver)]
+    return plugins
 
 
 def blocked_list(request, apiver=3):
@@ -206,9 +206,9 @@ def es_extensions(request, category=None, template=None):
         and category and category.count > 4):
         return category_landing(request, category)
 
-    qs = (Addon.search().filter(type=TYPE, app=request.APP.id,
-                                is_disabled=False,
-                                status__in=amo.REVIEWED_STATUSES))
+    qs = (Addon.search().cache()
+          .filter(type=TYPE, app=request.APP.id, is_disabled=False,
+                  status__in=amo.REVIEWED_STATUSES))
     filter = ESAddonFilter(request, qs, key='sort', default='popular')
     qs, sorting = filter.qs, filter.field
     src = 'cb-btn-%s' % sorting
@@ -1,3 +1,4 @@
+import hashlib
 import re
 from datetime import datetime
 
@@ -401,6 +402,54 @@ WATERMARK_KEY = 'purchaser'
 WATERMARK_KEY_HASH = '%s-hash' % WATERMARK_KEY
 WATERMARK_KEYS = (WATERMARK_KEY, WATERMARK_KEY_HASH)
 
+# Bumped to invalidate the responses cached by services/update.py.
+UPDATE_KEYVERSION = 'update:keyversion'
+
+# Install and purchase state cached by services/verify.py, by add-on id and
+# md5 of the install uuid. See `mkt.webapps.models.invalidate_verify_cache`.
+VERIFY_KEY = 'verify:%s:%s'
+
+
+def verify_key(addon_id, uuid):
+    """The VERIFY_KEY of the install `uuid` of `addon_id`."""
+    uuid = unicode(uuid).encode('utf-8')
+    return VERIFY_KEY % (addon_id, hashlib.md5(uuid).hexdigest())
+
+
+# Decoded receipts cached by services/verify.py, by sha1 of the receipt.
+VERIFY_RECEIPT_KEY = 'verify:receipt:%s'
+
+# Theme update documents served by services/theme_update.py, by the kind of
+# id ('addon' or 'gp'), the id and the locale, and the locales a theme has a
+# document for.
+THEME_UPDATE_KEY = 'theme-update:%s:%s:%s'
+THEME_UPDATE_LOCALES_KEY = 'theme-update:%s:%s'
+
+# Ids of the apps excluded from a region, by key version and region id, and
+# the key version, bumped when exclusions or content flags change. See
+# `mkt.webapps.models.Webapp.get_excluded_in`.
+EXCLUDED_REGIONS_KEY = 'excluded-regions:%s:%s'
+EXCLUDED_REGIONS_KEYVERSION = 'excluded-regions:keyversion'
+
+# OAuth consumers and access tokens of the API, by md5 of their key. See
+# `mkt.api.models.get_access`. And the redis keys of the nonces seen, by md5
+# of the nonce, its timestamp and the keys it was sent with.
+OAUTH_ACCESS_KEY = 'oauth:access:%s'
+OAUTH_TOKEN_KEY = 'oauth:token:%s'
+OAUTH_NONCE_KEY = 'oauth:nonce:%s'
+
+# Requests counted by the API throttle, by resource name, md5 of the
+# identifier and window. See `mkt.api.throttle.SlidingWindowThrottle`.
+API_THROTTLE_KEY = 'api:throttle:%s:%s:%s'
+
+# The sha256 of archives, by md5 of their path, size and mtime. See
+# `files.utils.ExtractionCache`.
+ARCHIVE_HASH_KEY = 'files:sha256:%s'
+
+# The ETag and Last-Modified of the manifests of hosted apps, by app id. See
+# `mkt.webapps.tasks.update_manifests`.
+MANIFEST_VALIDATORS_KEY = 'manifest:validators:%s'
+
 # Types of SiteEvent
 SITE_EVENT_OTHER = 1
 SITE_EVENT_EXCEPTION = 2
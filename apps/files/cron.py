@@ -11,6 +11,7 @@ import cronjobs
 import commonware.log
 
 from files.models import FileValidation
+from files.utils import extraction_cache
 
 log = commonware.log.getLogger('z.cron')
 
@@ -21,10 +22,16 @@ def cleanup_extracted_file():
     root = os.path.join(settings.TMP_PATH, 'file_viewer')
     for path in os.listdir(root):
         full = os.path.join(root, path)
-        age = time.time() - os.stat(full)[stat.ST_ATIME]
+        # Links to trees that were evicted from the cache are old too.
+        age = time.time() - (os.stat(full) if os.path.exists(full)
+                             else os.lstat(full))[stat.ST_ATIME]
         if (age) > (60 * 60):
             log.debug('Removing extracted files: %s, %dsecs old.' % (full, age))
-            shutil.rmtree(full)
+            if os.path.islink(full):
+                # The tree itself stays in the extraction cache.
+                os.unlink(full)
+            else:
+                shutil.rmtree(full)
             # Nuke out the file and diff caches when the file gets removed.
             id = os.path.basename(path)
             try:
@@ -37,6 +44,21 @@ def cleanup_extracted_file():
             cache.delete('%s:memoize:%s:%s' % (settings.CACHE_PREFIX,
                                                'file-viewer', key.hexdigest()))
 
+    log.info('Removing archive indexes for file viewer.')
+    root = settings.ARCHIVE_INDEX_PATH
+    for path in os.listdir(root) if os.path.exists(root) else []:
+        full = os.path.join(root, path)
+        try:
+            age = time.time() - os.stat(full)[stat.ST_ATIME]
+            if age > 60 * 60:
+                os.remove(full)
+        except OSError:
+            # Removed by another run.
+            pass
+
+    log.info('Evicting from the extraction cache.')
+    extraction_cache.cleanup()
+
 
 @cronjobs.register
 def cleanup_validation_results():
@@ -1,8 +1,10 @@
 import codecs
+import hashlib
 import json
 import mimetypes
 import os
 import stat
+import uuid
 
 from django.conf import settings
 from django.core.files.storage import default_storage as storage
@@ -12,13 +14,14 @@ from django.template.defaultfilters import filesizeformat
 
 import jinja2
 import commonware.log
+import waffle
 from jingo import register, env
 from tower import ugettext as _
 
 import amo
-from amo.utils import memoize, Message, rm_local_tmp_dir
+from amo.utils import memoize, rm_local_tmp_dir
 from amo.urlresolvers import reverse
-from files.utils import extract_xpi, get_md5
+from files.utils import ArchiveIndex, extraction_cache, get_md5
 from validator.testcases.packagelayout import (blacklisted_extensions,
                                                blacklisted_magic_numbers)
 
@@ -65,6 +68,9 @@ class FileViewer(object):
     Provide access to a storage-managed file by copying it locally and
     extracting info from it. `src` is a storage-managed path and `dest` is a
     local temp path.
+
+    With the zip-file-viewer switch on, archives aren't extracted: their
+    files are listed from an `ArchiveIndex` and read straight from `src`.
     """
 
     def __init__(self, file_obj, is_webapp=False):
@@ -74,20 +80,33 @@ class FileViewer(object):
         self.src = file_obj.file_path
         self.dest = os.path.join(settings.TMP_PATH, 'file_viewer',
                                  str(file_obj.pk))
+        self.zip_native = (waffle.switch_is_active('zip-file-viewer') and
+                           not self.src.endswith('.xml'))
         self._files, self.selected = None, None
+        self._index = None
 
     def __str__(self):
         return str(self.file.id)
 
-    def _extraction_cache_key(self):
-        return ('%s:file-viewer:extraction-in-progress:%s' %
-                (settings.CACHE_PREFIX, self.file.id))
+    @property
+    def index(self):
+        if self._index is None or self._index.source != self.src:
+            self._index = ArchiveIndex(self.src)
+        return self._index
 
     def extract(self):
         """
         Will make all the directories and expand the files.
         Raises error on nasty files.
         """
+        if self.zip_native:
+            try:
+                self.index.entries
+            except Exception, err:
+                task_log.error('Error (%s) indexing %s' % (err, self.src))
+                raise
+            return
+
         try:
             os.makedirs(os.path.dirname(self.dest))
         except OSError, err:
@@ -103,13 +122,27 @@ class FileViewer(object):
                                           self.file.filename), 'w'))
         else:
             try:
-                extract_xpi(self.src, self.dest, expand=True)
+                tree = extraction_cache.extract(self.src, expand=True)
             except Exception, err:
                 task_log.error('Error (%s) extracting %s' % (err, self.src))
                 raise
+            self._link(tree)
+
+    def _link(self, tree):
+        """Points `dest` at the `tree` shared through the extraction cache."""
+        if os.path.isdir(self.dest) and not os.path.islink(self.dest):
+            # Extracted before there was a cache.
+            rm_local_tmp_dir(self.dest)
+        # Renamed in place, so that `dest` is never missing nor half done.
+        tmp = '%s.%s' % (self.dest, uuid.uuid4().hex)
+        os.symlink(tree, tmp)
+        os.rename(tmp, self.dest)
 
     def cleanup(self):
-        if os.path.exists(self.dest):
+        if os.path.islink(self.dest):
+            # The tree may be shared, the cache evicts it when it's unused.
+            os.unlink(self.dest)
+        elif os.path.exists(self.dest):
             rm_local_tmp_dir(self.dest)
 
     def is_search_engine(self):
@@ -118,19 +151,28 @@ class FileViewer(object):
 
     def is_extracted(self):
         """If the file has been extracted or not."""
-        return (os.path.exists(self.dest) and not
-                Message(self._extraction_cache_key()).get())
-
-    def _is_binary(self, mimetype, path):
-        """Uses the filename to see if the file can be shown in HTML or not."""
+        if self.zip_native:
+            # Nothing to extract, as long as the archive was indexed.
+            return self.index.is_indexed()
+        if os.path.islink(self.dest):
+            extraction_cache.touch(os.readlink(self.dest))
+        return os.path.exists(self.dest)
+
+    def _is_binary(self, mimetype, path, head=None):
+        """
+        Uses the filename to see if the file can be shown in HTML or not.
+        `head` is the start of the file, it's read from `path` if not given.
+        """
         # Re-use the blacklisted data from amo-validator to spot binaries.
         ext = os.path.splitext(path)[1][1:]
         if ext in blacklisted_extensions:
             return True
 
-        if os.path.exists(path) and not os.path.isdir(path):
+        if head is None and os.path.exists(path) and not os.path.isdir(path):
             with storage.open(path, 'r') as rfile:
-                bytes = tuple(map(ord, rfile.read(4)))
+                head = rfile.read(4)
+        if head:
+            bytes = tuple(map(ord, head))
             if any(bytes[:len(x)] == x for x in blacklisted_magic_numbers):
                 return True
 
@@ -171,17 +213,20 @@ class FileViewer(object):
             self.selected['msg'] = msg
             return ''
 
-        with storage.open(self.selected['full'], 'r') as opened:
-            cont = opened.read()
-            codec = 'utf-16' if cont.startswith(codecs.BOM_UTF16) else 'utf-8'
-            try:
-                return cont.decode(codec)
-            except UnicodeDecodeError:
-                cont = cont.decode(codec, 'ignore')
-                #L10n: {0} is the filename.
-                self.selected['msg'] = (
-                    _('Problems decoding {0}.').format(codec))
-                return cont
+        if self.zip_native:
+            cont = self.index.read(self.selected['full'])
+        else:
+            with storage.open(self.selected['full'], 'r') as opened:
+                cont = opened.read()
+        codec = 'utf-16' if cont.startswith(codecs.BOM_UTF16) else 'utf-8'
+        try:
+            return cont.decode(codec)
+        except UnicodeDecodeError:
+            cont = cont.decode(codec, 'ignore')
+            #L10n: {0} is the filename.
+            self.selected['msg'] = (
+                _('Problems decoding {0}.').format(codec))
+            return cont
 
     def _process_manifest(self, data):
         """
@@ -219,6 +264,22 @@ class FileViewer(object):
 
     def select(self, file_):
         self.selected = self.get_files().get(file_)
+        if self.zip_native and self.selected:
+            # Only the selected file is hashed, it's read anyway.
+            self.hash_files([self.selected])
+
+    def hash_files(self, files):
+        """Fills in the md5 of the `files` of an archive read in place."""
+        for file in files:
+            if file['directory'] or file['md5']:
+                continue
+            try:
+                md5 = hashlib.md5()
+                for chunk in self.index.iter_chunks(file['full']):
+                    md5.update(chunk)
+                file['md5'] = md5.hexdigest()
+            except (IOError, OSError):
+                pass
 
     def is_binary(self):
         if self.selected:
@@ -260,7 +321,8 @@ class FileViewer(object):
         # In case a cron job comes along and deletes the files
         # mid tree building.
         try:
-            self._files = self._get_files()
+            self._files = (self._get_zip_files() if self.zip_native
+                           else self._get_files())
             return self._files
         except (OSError, IOError):
             return {}
@@ -302,6 +364,28 @@ class FileViewer(object):
                 return short
         return 'plain'
 
+    def _file_info(self, short, full, directory):
+        filename = os.path.basename(short)
+        mime, encoding = mimetypes.guess_type(filename)
+        if not mime and filename == 'manifest.webapp':
+            mime = 'application/x-web-app-manifest+json'
+        url_prefix = 'mkt.%s' if self.is_webapp else '%s'
+        return {
+            'depth': short.count(os.sep),
+            'directory': directory,
+            'filename': filename,
+            'full': full,
+            'mimetype': mime or 'application/octet-stream',
+            'syntax': self.get_syntax(filename),
+            'short': short,
+            'truncated': self.truncate(filename),
+            'url': reverse(url_prefix % 'files.list',
+                           args=[self.file.id, 'file', short]),
+            'url_serve': reverse(url_prefix % 'files.redirect',
+                                 args=[self.file.id, short]),
+            'version': self.file.version.version,
+        }
+
     @memoize(prefix='file-viewer', time=60 * 60)
     def _get_files(self):
         all_files, res = [], SortedDict()
@@ -320,34 +404,56 @@ class FileViewer(object):
 
         iterate(self.dest)
 
-        url_prefix = 'mkt.%s' if self.is_webapp else '%s'
         for path in all_files:
-            filename = smart_unicode(os.path.basename(path), errors='replace')
             short = smart_unicode(path[len(self.dest) + 1:], errors='replace')
-            mime, encoding = mimetypes.guess_type(filename)
-            if not mime and filename == 'manifest.webapp':
-                mime = 'application/x-web-app-manifest+json'
             directory = os.path.isdir(path)
-
-            res[short] = {
-                'binary': self._is_binary(mime, path),
-                'depth': short.count(os.sep),
-                'directory': directory,
-                'filename': filename,
-                'full': path,
+            info = self._file_info(short, path, directory)
+            info.update({
+                'binary': self._is_binary(info['mimetype'], path),
                 'md5': get_md5(path) if not directory else '',
-                'mimetype': mime or 'application/octet-stream',
-                'syntax': self.get_syntax(filename),
                 'modified': os.stat(path)[stat.ST_MTIME],
-                'short': short,
                 'size': os.stat(path)[stat.ST_SIZE],
-                'truncated': self.truncate(filename),
-                'url': reverse(url_prefix % 'files.list',
-                               args=[self.file.id, 'file', short]),
-                'url_serve': reverse(url_prefix % 'files.redirect',
-                                     args=[self.file.id, short]),
-                'version': self.file.version.version,
-            }
+            })
+            res[short] = info
+
+        return res
+
+    @memoize(prefix='file-viewer-zip', time=60 * 60)
+    def _get_zip_files(self):
+        entries = self.index.entries
+        children = {}
+        for path, entry in entries.items():
+            children.setdefault(os.path.dirname(path), []).append(path)
+
+        # Directories first, then files, like `_get_files`.
+        def iterate(parent):
+            paths = sorted(children.get(parent, []))
+            for path in paths:
+                if entries[path]['directory']:
+                    yield path
+                    for child in iterate(path):
+                        yield child
+            for path in paths:
+                if not entries[path]['directory']:
+                    yield path
+
+        res = SortedDict()
+        for path in iterate(''):
+            entry = entries[path]
+            short = smart_unicode(path, errors='replace')
+            info = self._file_info(short, path, entry['directory'])
+            info.update({
+                'binary': self._is_binary(info['mimetype'], path,
+                                          head=entry['head']),
+                # The entries aren't hashed, the CRC32 and size of the zip
+                # tell them apart. See `select` for the md5.
+                'fingerprint': ('%08x:%s' % (entry['crc'], entry['size'])
+                                if not entry['directory'] else ''),
+                'md5': '',
+                'modified': entry['modified'],
+                'size': entry['size'],
+            })
+            res[short] = info
 
         return res
 
@@ -389,10 +495,20 @@ class DiffHelper(object):
         """
         left_files = self.left.get_files()
         right_files = self.right.get_files()
+        # Archives read in place are compared by the CRC32 and size of their
+        # entries rather than by md5, when both sides are.
+        if self.left.zip_native and self.right.zip_native:
+            compare = 'fingerprint'
+        else:
+            compare = 'md5'
+            for viewer, files in ((self.left, left_files),
+                                  (self.right, right_files)):
+                if viewer.zip_native:
+                    viewer.hash_files(files.values())
         different = []
         for key, file in left_files.items():
             file['url'] = self.get_url(file['short'])
-            diff = file['md5'] != right_files.get(key, {}).get('md5')
+            diff = file[compare] != right_files.get(key, {}).get(compare)
             file['diff'] = diff
             if diff:
                 different.append(file)
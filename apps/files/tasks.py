@@ -36,8 +36,6 @@ def extract_file(viewer, **kw):
     # This message is for end users so they'll see a nice error.
     msg = Message('file-viewer:%s' % viewer)
     msg.delete()
-    # This flag is so that we can signal when the extraction is completed.
-    flag = Message(viewer._extraction_cache_key())
     task_log.debug('[1@%s] Unzipping %s for file viewer.' % (
                   extract_file.rate_limit, viewer))
 
@@ -52,8 +50,6 @@ def extract_file(viewer, **kw):
         task_log.error('[1@%s] Error unzipping: %s' %
                        (extract_file.rate_limit, err))
 
-    flag.delete()
-
 
 # The version/file creation methods expect a files.FileUpload object.
 class FakeUpload(object):
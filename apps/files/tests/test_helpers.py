@@ -16,7 +16,7 @@ import amo.tests
 from amo.urlresolvers import reverse
 from files.helpers import FileViewer, DiffHelper
 from files.models import File
-from files.utils import SafeUnzip
+from files.utils import extraction_cache, SafeUnzip
 
 root = os.path.join(settings.ROOT, 'apps/files/fixtures/files')
 get_file = lambda x: '%s/%s' % (root, x)
@@ -69,6 +69,36 @@ class TestFileHelper(amo.tests.TestCase):
         self.viewer.cleanup()
         eq_(self.viewer.is_extracted(), False)
 
+    def test_cleanup_keeps_shared_tree(self):
+        other = FileViewer(make_file(2, get_file('dictionary-test.xpi')))
+        self.viewer.extract()
+        other.extract()
+        self.viewer.cleanup()
+        eq_(other.is_extracted(), True)
+        assert os.path.exists(os.path.join(other.dest, 'install.rdf'))
+        other.cleanup()
+
+    def test_extract_shared(self):
+        other = FileViewer(make_file(2, get_file('dictionary-test.xpi')))
+        self.viewer.extract()
+        other.extract()
+        assert os.path.islink(other.dest)
+        eq_(os.path.realpath(other.dest), os.path.realpath(self.viewer.dest))
+        os.unlink(other.dest)
+
+    def test_extract_over_old_tree(self):
+        os.makedirs(os.path.join(self.viewer.dest, 'old'))
+        self.viewer.extract()
+        assert os.path.islink(self.viewer.dest)
+        assert not os.path.exists(os.path.join(self.viewer.dest, 'old'))
+
+    def test_evicted(self):
+        self.viewer.extract()
+        extraction_cache.remove_tree(os.readlink(self.viewer.dest))
+        eq_(self.viewer.is_extracted(), False)
+        self.viewer.extract()
+        eq_(self.viewer.is_extracted(), True)
+
     def test_isbinary(self):
         binary = self.viewer._is_binary
         for f in ['foo.rdf', 'foo.xml', 'foo.js', 'foo.py'
@@ -348,6 +378,111 @@ class TestDiffHelper(amo.tests.TestCase):
         open(path, 'w').write(data)
 
 
+class TestZipFileViewer(amo.tests.TestCase):
+
+    def setUp(self):
+        self.extracted = FileViewer(make_file(1, get_file('recurse.xpi')))
+        self.extracted.extract()
+        self.create_switch('zip-file-viewer')
+        self.viewer = FileViewer(make_file(2, get_file('recurse.xpi')))
+
+    def tearDown(self):
+        self.extracted.cleanup()
+
+    def test_not_extracted(self):
+        assert self.viewer.zip_native
+        assert not self.viewer.is_extracted()
+        self.viewer.extract()
+        assert self.viewer.is_extracted()
+        assert not os.path.exists(self.viewer.dest)
+
+    def test_index_cached(self):
+        self.viewer.extract()
+        viewer = FileViewer(make_file(3, get_file('recurse.xpi')))
+        assert viewer.is_extracted()
+        with patch('files.utils.storage') as storage:
+            eq_(viewer.get_files().keys(), self.viewer.get_files().keys())
+        assert not storage.open.called
+
+    def test_index_not_cached(self):
+        self.viewer.extract()
+        os.remove(self.viewer.index.path)
+        viewer = FileViewer(make_file(3, get_file('recurse.xpi')))
+        assert not viewer.is_extracted()
+        eq_(viewer.get_files().keys(), self.viewer.get_files().keys())
+        assert viewer.is_extracted()
+
+    @patch('files.utils.cache')
+    def test_index_not_in_memcache(self, cache):
+        self.viewer.extract()
+        assert not cache.set.called
+        assert FileViewer(make_file(3, get_file('recurse.xpi'))).is_extracted()
+
+    def test_broken(self):
+        self.viewer.src = get_file('search.xml')
+        assert not self.viewer.is_extracted()
+        eq_(self.viewer.get_files(), {})
+        with self.assertRaises(zipfile.BadZipfile):
+            self.viewer.extract()
+
+    def test_search_engine(self):
+        viewer = FileViewer(make_file(3, get_file('search.xml')))
+        assert not viewer.zip_native
+
+    def test_same_files(self):
+        files = self.viewer.get_files()
+        extracted = self.extracted.get_files()
+        # An archive that doesn't unzip is extracted as an empty directory.
+        eq_(files.pop('recurse/notazip.jar')['directory'], False)
+        eq_(extracted.pop('recurse/notazip.jar')['directory'], True)
+        eq_(files.keys(), extracted.keys())
+        for key, value in extracted.items():
+            for field in ('binary', 'depth', 'directory', 'filename',
+                          'mimetype', 'syntax'):
+                eq_(files[key][field], value[field])
+            if not value['directory']:
+                eq_(files[key]['size'], value['size'])
+
+    def test_fingerprint(self):
+        key = 'recurse/recurse.xpi/chrome/test-root.txt'
+        data = open(self.extracted.get_files()[key]['full']).read()
+        eq_(self.viewer.get_files()[key]['fingerprint'],
+            '%08x:%s' % (zipfile.crc32(data) & 0xffffffff, len(data)))
+
+    def test_select(self):
+        key = 'recurse/somejar.jar/recurse/recurse.xpi/chrome/test.jar/test'
+        self.extracted.select(key)
+        self.viewer.select(key)
+        eq_(self.viewer.selected['md5'], self.extracted.selected['md5'])
+        eq_(self.viewer.read_file(), self.extracted.read_file())
+
+    def test_diff(self):
+        dest = os.path.join(settings.TMP_PATH, 'test_zip_diff.xpi')
+        source = zipfile.ZipFile(get_file('dictionary-test.xpi'))
+        changed = zipfile.ZipFile(dest, 'w')
+        for info in source.infolist():
+            data = source.read(info)
+            if info.filename == 'install.js':
+                data += 'asd'
+            changed.writestr(info, data)
+        changed.close()
+
+        helper = DiffHelper(make_file(3, dest),
+                            make_file(4, get_file('dictionary-test.xpi')))
+        files = helper.get_files()
+        eq_([k for k, v in files.items() if v['diff']], ['install.js'])
+        os.remove(dest)
+
+    def test_diff_extracted(self):
+        helper = DiffHelper(make_file(3, get_file('dictionary-test.xpi')),
+                            make_file(4, get_file('dictionary-test.xpi')))
+        helper.right.zip_native = False
+        helper.right.extract()
+        files = helper.get_files()
+        eq_([k for k, v in files.items() if v['diff']], [])
+        helper.right.cleanup()
+
+
 class TestSafeUnzipFile(amo.tests.TestCase, amo.tests.AMOPaths):
 
     #TODO(andym): get full coverage for existing SafeUnzip methods, most
@@ -1,10 +1,18 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+
+from mock import patch
 from nose.tools import eq_
 
 import amo.tests
 import files.utils
 from addons.models import Addon
 from files.models import File
-from files.utils import find_jetpacks
+from files.utils import ExtractionCache, find_jetpacks
 from versions.models import Version
 
 
@@ -62,3 +70,110 @@ class TestFindJetpacks(amo.tests.TestCase):
         File.objects.update(builder_version='2.0.1')
         files = find_jetpacks('.1', '1.0', from_builder_only=True)
         eq_(files, [self.file])
+
+
+def get_file(name):
+    return os.path.join(settings.ROOT, 'apps/files/fixtures/files', name)
+
+
+class TestExtractionCache(amo.tests.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = ExtractionCache(root=self.root, grace=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def entries(self):
+        return sorted(k for k in os.listdir(self.root) if not k[0] == '.')
+
+    def age(self, tree, seconds):
+        old = time.time() - seconds
+        os.utime(os.path.dirname(tree), (old, old))
+
+    def test_extract(self):
+        tree = self.cache.extract(get_file('dictionary-test.xpi'))
+        assert os.path.exists(os.path.join(tree, 'install.rdf'))
+        eq_(self.entries(), [os.path.basename(os.path.dirname(tree))])
+
+    def test_extract_once(self):
+        with patch('files.utils.extract_xpi') as extract_xpi:
+            extract_xpi.side_effect = lambda src, dest, expand: os.mkdir(dest)
+            tree = self.cache.extract(get_file('dictionary-test.xpi'))
+            eq_(self.cache.extract(get_file('dictionary-test.xpi')), tree)
+        eq_(extract_xpi.call_count, 1)
+
+    def test_content_addressed(self):
+        copy = os.path.join(self.root, '.copy.xpi')
+        shutil.copy(get_file('dictionary-test.xpi'), copy)
+        eq_(self.cache.extract(copy),
+            self.cache.extract(get_file('dictionary-test.xpi')))
+
+    def test_expand(self):
+        flat = self.cache.extract(get_file('recurse.xpi'))
+        expanded = self.cache.extract(get_file('recurse.xpi'), expand=True)
+        assert flat != expanded
+        assert os.path.isfile(os.path.join(flat, 'recurse/recurse.xpi'))
+        assert os.path.isdir(os.path.join(expanded, 'recurse/recurse.xpi'))
+
+    def test_bad_archive(self):
+        with self.assertRaises(Exception):
+            self.cache.extract(get_file('search.xml'))
+        eq_(os.listdir(self.root), ['.locks'])
+
+    def test_evict_least_recent(self):
+        first = self.cache.extract(get_file('dictionary-test.xpi'))
+        second = self.cache.extract(get_file('extension.xpi'))
+        self.age(first, 20)
+        self.age(second, 10)
+        self.cache.extract(get_file('dictionary-test.xpi'))
+        self.cache._limit = self.cache.get_size(first)
+        self.cache.evict()
+        eq_(self.entries(), [os.path.basename(os.path.dirname(first))])
+
+    def test_evict_keeps_new(self):
+        self.cache._limit = 0
+        tree = self.cache.extract(get_file('dictionary-test.xpi'))
+        assert os.path.exists(tree)
+        self.cache.extract(get_file('extension.xpi'))
+        assert not os.path.exists(tree)
+
+    def test_evict_keeps_used(self):
+        self.cache._grace = 60
+        first = self.cache.extract(get_file('dictionary-test.xpi'))
+        second = self.cache.extract(get_file('extension.xpi'))
+        self.age(first, 120)
+        self.cache._limit = 0
+        self.cache.evict()
+        assert not os.path.exists(first)
+        assert os.path.exists(second)
+
+    def test_evict_skips_locked(self):
+        tree = self.cache.extract(get_file('dictionary-test.xpi'))
+        key = os.path.basename(os.path.dirname(tree))
+        self.cache._limit = 0
+        with self.cache._lock(key, shared=True):
+            self.cache.evict()
+        assert os.path.exists(tree)
+
+    def test_remove_tree(self):
+        tree = self.cache.extract(get_file('dictionary-test.xpi'))
+        assert self.cache.remove_tree(tree)
+        eq_(self.entries(), [])
+        eq_(os.listdir(os.path.join(self.root, '.locks')), [])
+        assert not self.cache.remove_tree(tree)
+
+    def test_cleanup(self):
+        os.mkdir(os.path.join(self.root, '.tmp-old'))
+        os.mkdir(os.path.join(self.root, '.tmp-new'))
+        self.age(os.path.join(self.root, '.tmp-old', 'x'), 60 * 60 * 2)
+        self.cache.cleanup()
+        eq_(sorted(os.listdir(self.root)), ['.locks', '.tmp-new'])
+
+    def test_cleanup_locks(self):
+        tree = self.cache.extract(get_file('dictionary-test.xpi'))
+        open(os.path.join(self.root, '.locks', 'gone'), 'w').close()
+        self.cache.cleanup()
+        eq_(sorted(os.listdir(os.path.join(self.root, '.locks'))),
+            sorted([os.path.basename(os.path.dirname(tree)), 'evict']))
@@ -458,6 +458,50 @@ class TestFileViewer(FilesBase, amo.tests.TestCase):
                 PLATFORM_NAME)
 
 
+class TestZipFileViewer(amo.tests.TestCase):
+    fixtures = ['base/addon_3615', 'base/users']
+
+    def setUp(self):
+        self.file = Addon.objects.get(pk=3615).current_version.all_files[0]
+        try:
+            os.makedirs(os.path.dirname(self.file.file_path))
+        except OSError:
+            pass
+        shutil.copyfile(os.path.join(settings.ROOT, dictionary),
+                        self.file.file_path)
+        self.create_switch('zip-file-viewer', db=True)
+        self.viewer = FileViewer(self.file)
+        assert self.client.login(username='editor@mozilla.com',
+                                 password='password')
+
+    def file_url(self, file=None):
+        args = [self.file.pk]
+        if file:
+            args.extend(['file', file])
+        return reverse('files.list', args=args)
+
+    def test_browse(self):
+        res = self.client.get(self.file_url(not_binary))
+        eq_(res.status_code, 200)
+        eq_(res.context['key'], not_binary)
+        assert 'files' in res.context
+        assert res.context['content'].startswith('var ')
+        assert not os.path.exists(self.viewer.dest)
+
+    def test_poll(self):
+        res = self.client.get(reverse('files.poll', args=[self.file.pk]))
+        eq_(json.loads(res.content)['status'], True)
+
+    def test_serve(self):
+        res = self.client.get(reverse('files.redirect',
+                                      args=[self.file.pk, binary]))
+        url = res['Location'][len(settings.STATIC_URL):]
+        res = self.client.get(url)
+        eq_(res.status_code, 200)
+        assert settings.XSENDFILE_HEADER not in res
+        eq_(res.content, self.viewer.index.read(binary))
+
+
 class TestDiffViewer(FilesBase, amo.tests.TestCase):
     fixtures = ['base/addon_3615', 'base/platforms', 'base/users']
 
@@ -1,4 +1,7 @@
 import collections
+import contextlib
+import cPickle
+import fcntl
 import glob
 import hashlib
 import json
@@ -9,6 +12,7 @@ import shutil
 import stat
 import StringIO
 import tempfile
+import time
 import zipfile
 from datetime import datetime
 from itertools import groupby
@@ -21,8 +25,10 @@ from django.core.cache import cache
 from django.utils.http import urlencode
 from django.utils.translation import trans_real as translation
 from django.core.files.storage import default_storage as storage
+from django.utils.encoding import smart_str
 
 import rdflib
+from django_statsd.clients import statsd
 from tower import ugettext as _
 
 import amo
@@ -422,13 +428,380 @@ def extract_xpi(xpi, path, expand=False):
     copy_over(tempdir, path)
 
 
+class ArchiveIndex(object):
+    """
+    Lists the entries of an archive, and of the archives in it up to 10
+    levels deep, from their central directories without extracting anything.
+    Nested archives are listed as directories, like `extract_xpi` lays them
+    out with expand=True.
+
+    `entries` maps the path of every entry to a dict with:
+
+    * `directory`, `size`, `modified` (a timestamp) and `crc` (a CRC32),
+    * `head`, the first bytes of the entry,
+    * `name`, its name in the archive holding it, and `archives`, the names
+      of the nested archives to open, from the outermost, to get there.
+
+    The entries are built once per `source` and kept in a file of
+    ARCHIVE_INDEX_PATH, whatever their size.
+    """
+    expand_whitelist = ['.jar', '.xpi']
+    max_depth = 10
+
+    def __init__(self, source):
+        self.source = source
+        self._entries = None
+
+    @property
+    def path(self):
+        return os.path.join(settings.ARCHIVE_INDEX_PATH,
+                            hashlib.md5(smart_str(self.source)).hexdigest())
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            try:
+                with open(self.path, 'rb') as fd:
+                    self._entries = cPickle.load(fd)
+            except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+                self._entries = self.build()
+        return self._entries
+
+    def is_indexed(self):
+        """Whether the entries are at hand, without reading the archive."""
+        return self._entries is not None or os.path.exists(self.path)
+
+    def build(self):
+        """Reads the entries from the archive, and saves them."""
+        entries = {}
+        with storage.open(self.source) as fobj:
+            zip = SafeUnzip(fobj)
+            zip.is_valid()
+            self._add(entries, zip, (), '')
+
+        root = os.path.dirname(self.path)
+        if not os.path.exists(root):
+            try:
+                os.makedirs(root)
+            except OSError:
+                # Somebody else just made it.
+                pass
+        # Renamed in place, so that nobody reads half of it.
+        fd, tmp = tempfile.mkstemp(prefix='.tmp-', dir=root)
+        try:
+            with os.fdopen(fd, 'wb') as fobj:
+                cPickle.dump(entries, fobj, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, self.path)
+        except:
+            os.remove(tmp)
+            raise
+        return entries
+
+    def _add_directory(self, entries, path, modified):
+        while path and path not in entries:
+            entries[path] = {'directory': True, 'size': 0, 'crc': 0,
+                             'modified': modified, 'head': '', 'name': '',
+                             'archives': ()}
+            path = os.path.dirname(path)
+
+    def _add(self, entries, zip, archives, prefix):
+        for info in zip.info:
+            path = prefix + info.filename.rstrip('/')
+            modified = time.mktime(info.date_time + (0, 0, -1))
+            self._add_directory(entries, os.path.dirname(path), modified)
+            if info.filename.endswith('/'):
+                self._add_directory(entries, path, modified)
+                continue
+
+            if (os.path.splitext(path)[1] in self.expand_whitelist and
+                len(archives) < self.max_depth):
+                nested = SafeUnzip(StringIO.StringIO(zip.zip.read(info)))
+                if nested.is_valid(fatal=False):
+                    self._add_directory(entries, path, modified)
+                    self._add(entries, nested, archives + (info.filename,),
+                              path + '/')
+                    continue
+
+            entries[path] = {'directory': False, 'size': info.file_size,
+                             'crc': info.CRC & 0xffffffff,
+                             'modified': modified,
+                             'head': zip.zip.open(info).read(4),
+                             'name': info.filename, 'archives': archives}
+
+    @contextlib.contextmanager
+    def open(self, path):
+        """Opens the entry at `path`, to be read."""
+        entry = self.entries[path]
+        with storage.open(self.source) as fobj:
+            zip = ZipFile(fobj)
+            for name in entry['archives']:
+                zip = ZipFile(StringIO.StringIO(zip.read(name)))
+            opened = zip.open(entry['name'])
+            try:
+                yield opened
+            finally:
+                opened.close()
+
+    def read(self, path):
+        with self.open(path) as opened:
+            return opened.read()
+
+    def iter_chunks(self, path, size=64 * 1024):
+        with self.open(path) as opened:
+            while True:
+                chunk = opened.read(size)
+                if not chunk:
+                    break
+                yield chunk
+
+
+class ExtractionCache(object):
+    """
+    Extracted archives, keyed by their sha256, so that an archive is only
+    extracted once per node however many files, requests and tasks need it
+    on disk.
+
+    Each entry is a directory of `root` holding the extracted `tree` and its
+    `size` in bytes. The mtime of an entry is bumped whenever it's used, and
+    the entries used least recently are removed once the cache holds more
+    than `limit` bytes. Entries used in the last `grace` seconds are never
+    removed, the trees handed out are still being read.
+
+    Everything on an entry happens under an flock() on its key: the first
+    process to ask for an archive extracts it under an exclusive lock, the
+    others wait on the lock and then find the tree in place. Hits only take
+    a shared lock, long enough for the entry to be marked as used so that
+    eviction leaves it alone. Trees only show up, or go away, with a rename
+    so nobody ever sees half of one.
+    """
+
+    def __init__(self, root=None, limit=None, grace=None):
+        self._root, self._limit, self._grace = root, limit, grace
+
+    @property
+    def root(self):
+        return self._root or settings.EXTRACTION_CACHE_PATH
+
+    @property
+    def limit(self):
+        if self._limit is None:
+            return settings.EXTRACTION_CACHE_SIZE
+        return self._limit
+
+    @property
+    def grace(self):
+        if self._grace is None:
+            return settings.EXTRACTION_CACHE_GRACE
+        return self._grace
+
+    def get_key(self, source, expand=False):
+        """
+        Returns the sha256 of `source`. It's only hashed again when its size
+        or mtime change.
+        """
+        st = os.stat(source)
+        memo = amo.ARCHIVE_HASH_KEY % hashlib.md5(smart_str(
+            '%s:%s:%s' % (source, st.st_size, st.st_mtime))).hexdigest()
+        digest = cache.get(memo)
+        if not digest:
+            digest = get_sha256(source)
+            cache.set(memo, digest, 60 * 60 * 24)
+        return '%s-expanded' % digest if expand else digest
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    @contextlib.contextmanager
+    def _lock(self, name, blocking=True, shared=False):
+        """
+        Yields whether the lock on `name` was taken. The lock file can be
+        removed with `_unlink_lock` while the lock is held.
+        """
+        locks = self._path('.locks')
+        if not os.path.exists(locks):
+            try:
+                os.makedirs(locks)
+            except OSError:
+                # Somebody else just made it.
+                pass
+        path = os.path.join(locks, name)
+        flags = ((fcntl.LOCK_SH if shared else fcntl.LOCK_EX) |
+                 (0 if blocking else fcntl.LOCK_NB))
+        while True:
+            fd = open(path, 'a')
+            try:
+                fcntl.flock(fd, flags)
+            except IOError:
+                fd.close()
+                if blocking:
+                    raise
+                yield False
+                return
+            try:
+                current = os.stat(path).st_ino
+            except OSError:
+                current = None
+            if current == os.fstat(fd.fileno()).st_ino:
+                break
+            # It was unlinked while we were waiting, lock the new one.
+            fd.close()
+        try:
+            yield True
+        finally:
+            # Closing it releases the lock.
+            fd.close()
+
+    def _unlink_lock(self, name):
+        """Removes the file of the lock on `name`, which must be held."""
+        try:
+            os.unlink(self._path('.locks', name))
+        except OSError:
+            pass
+
+    def extract(self, source, expand=False):
+        """
+        Returns the path of the tree `source` is extracted to, extracting it
+        first if it isn't in the cache. See `extract_xpi` for `expand`.
+        """
+        key = self.get_key(source, expand)
+        tree = self._path(key, 'tree')
+        with self._lock(key, shared=True):
+            if os.path.isdir(tree):
+                return self._hit(tree)
+
+        with self._lock(key):
+            # It may have been extracted while we were waiting.
+            if os.path.isdir(tree):
+                return self._hit(tree)
+
+            statsd.incr('files.extraction_cache.miss')
+            tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.root)
+            try:
+                with statsd.timer('files.extraction_cache.extract'):
+                    extract_xpi(source, os.path.join(tmp, 'tree'),
+                                expand=expand)
+                with open(os.path.join(tmp, 'size'), 'w') as fd:
+                    fd.write(str(self.get_size(os.path.join(tmp, 'tree'))))
+                os.chmod(tmp, 0755)
+                os.rename(tmp, self._path(key))
+            except:
+                rm_local_tmp_dir(tmp)
+                raise
+            self.touch(tree)
+
+        self.evict(keep=key)
+        return tree
+
+    def _hit(self, tree):
+        statsd.incr('files.extraction_cache.hit')
+        self.touch(tree)
+        return tree
+
+    def touch(self, tree):
+        """Marks the entry of `tree` as just used."""
+        try:
+            os.utime(os.path.dirname(tree), None)
+        except OSError:
+            # It was evicted.
+            pass
+
+    def get_size(self, tree):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, dirs, files in os.walk(tree) for name in files)
+
+    def remove(self, key, blocking=True, unused_for=None):
+        """
+        Removes the entry of `key`. If `blocking` is False, entries that are
+        being used or extracted are left alone, and so are entries used in
+        the last `unused_for` seconds. Returns whether it was removed.
+        """
+        with self._lock(key, blocking) as locked:
+            if not locked:
+                return False
+            path = self._path(key)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                self._unlink_lock(key)
+                return False
+            if unused_for and time.time() - mtime < unused_for:
+                return False
+            tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.root)
+            os.rename(path, os.path.join(tmp, key))
+            rm_local_tmp_dir(tmp)
+            self._unlink_lock(key)
+        statsd.incr('files.extraction_cache.evict')
+        return True
+
+    def remove_tree(self, tree):
+        """Removes the entry of a path `extract` returned."""
+        return self.remove(os.path.basename(os.path.dirname(tree)))
+
+    def evict(self, keep=None):
+        """
+        Removes the entries used least recently, but `keep` and those used
+        in the last `grace` seconds, until the cache holds at most `limit`
+        bytes.
+        """
+        with self._lock('evict', blocking=False) as locked:
+            if not locked:
+                # Somebody else is on it.
+                return
+            entries, total = [], 0
+            for key in os.listdir(self.root):
+                if key.startswith('.'):
+                    continue
+                path = self._path(key)
+                try:
+                    with open(os.path.join(path, 'size')) as fd:
+                        size = int(fd.read())
+                    entries.append((os.stat(path).st_mtime, size, key))
+                except (IOError, OSError, ValueError):
+                    continue
+                total += size
+
+            for mtime, size, key in sorted(entries):
+                if total <= self.limit:
+                    break
+                if key != keep and self.remove(key, blocking=False,
+                                               unused_for=self.grace):
+                    log.info('Evicted %s (%s bytes) from the extraction '
+                             'cache.' % (key, size))
+                    total -= size
+
+    def cleanup(self, age=60 * 60):
+        """
+        Evicts what doesn't fit, and removes what the extractions that died
+        half way through left behind for more than `age` seconds, along with
+        the locks of the entries that are gone.
+        """
+        if not os.path.exists(self.root):
+            return
+        for name in os.listdir(self.root):
+            path = self._path(name)
+            if (name.startswith('.tmp-') and
+                time.time() - os.stat(path).st_mtime > age):
+                rm_local_tmp_dir(path)
+        self.evict()
+
+        locks = self._path('.locks')
+        if not os.path.exists(locks):
+            return
+        for name in os.listdir(locks):
+            if name == 'evict' or os.path.exists(self._path(name)):
+                continue
+            with self._lock(name, blocking=False) as locked:
+                if locked and not os.path.exists(self._path(name)):
+                    self._unlink_lock(name)
+
+
+extraction_cache = ExtractionCache()
+
+
 def parse_xpi(xpi, addon=None):
     """Extract and parse an XPI."""
-    # Extract to /tmp
-    path = tempfile.mkdtemp()
     try:
-        xpi = get_file(xpi)
-        extract_xpi(xpi, path)
+        path = extraction_cache.extract(get_file(xpi))
         rdf = Extractor.parse(path)
     except forms.ValidationError:
         raise
@@ -442,8 +815,6 @@ def parse_xpi(xpi, addon=None):
     except Exception:
         log.error('XPI parse error', exc_info=True)
         raise forms.ValidationError(_('Could not parse install.rdf.'))
-    finally:
-        rm_local_tmp_dir(path)
 
     return check_rdf(rdf, addon)
 
@@ -1,7 +1,7 @@
 import datetime
 
 from django.core.management import call_command
-from django.db.models import Sum, Max
+from django.db.models import Sum
 
 import commonware.log
 from celery.task.sets import TaskSet
@@ -44,23 +44,20 @@ def update_collections_total():
 
 
 @cronjobs.register
-def update_global_totals(date=None):
-    """Update global statistics totals."""
+def update_global_totals(date=None, end=None):
+    """
+    Update global statistics totals, of today or of every day from `date` to
+    `end` in one pass:
+
+        ./manage.py cron update_global_totals 2013-01-01 2013-03-31
+    """
     raise_if_reindex_in_progress()
 
     if date:
         date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
-    today = date or datetime.date.today()
-    today_jobs = [dict(job=job, date=today) for job in
-                  tasks._get_daily_jobs(date)]
-
-    max_update = date or UpdateCount.objects.aggregate(max=Max('date'))['max']
-    metrics_jobs = [dict(job=job, date=max_update) for job in
-                    tasks._get_metrics_jobs(date)]
-
-    ts = [tasks.update_global_totals.subtask(kwargs=kw)
-          for kw in today_jobs + metrics_jobs]
-    TaskSet(ts).apply_async()
+    if end:
+        end = datetime.datetime.strptime(end, '%Y-%m-%d').date()
+    tasks.update_global_totals.delay(date=date, end=end)
 
 
 @cronjobs.register
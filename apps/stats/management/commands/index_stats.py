@@ -43,6 +43,9 @@ class Command(BaseCommand):
                          '(inclusive).'),
         make_option('--fixup', action='store_true',
                     help='Find and index rows we missed.'),
+        make_option('--inline', action='store_true',
+                    help='Index from this process instead of through '
+                         'celery.'),
     )
     help = HELP
 
@@ -51,6 +54,7 @@ class Command(BaseCommand):
             fixup()
 
         addons, dates = kw['addons'], kw['date']
+        inline = kw.get('inline', False)
 
         queries = [
             (UpdateCount.objects, index_update_counts,
@@ -99,12 +103,16 @@ class Command(BaseCommand):
                                   today - timedelta(days=start))
                     create_tasks(task, list(qs.filter(**{
                                             '%s__range' % date_field:
-                                            date_range})))
+                                            date_range})), inline=inline)
             else:
-                create_tasks(task, list(qs))
+                create_tasks(task, list(qs), inline=inline)
 
 
-def create_tasks(task, qs):
+def create_tasks(task, qs, inline=False):
+    if inline:
+        for chunk in chunked(qs, 50):
+            task(chunk)
+        return
     ts = [task.subtask(args=[chunk]) for chunk in chunked(qs, 50)]
     TaskSet(ts).apply_async()
 
@@ -194,6 +194,7 @@ class Contribution(amo.models.ModelBase):
 
         reason is either 'reversal' or 'refund'
         """
+        self.invalidate_receipts()
         # Sigh. AMO does not have inapp_pay installed and it does not have
         # the database tables. Since both mkt and AMO share this code we
         # need to hide it from AMO.
@@ -344,8 +345,15 @@ class Contribution(amo.models.ModelBase):
         if rejection_reason:
             refund.rejection_reason = rejection_reason
         refund.save()
+        self.invalidate_receipts()
         return refund
 
+    def invalidate_receipts(self):
+        """Make the receipt verifier look at the purchase again."""
+        from mkt.webapps.models import invalidate_verify_cache
+        if self.addon_id and self.user_id:
+            invalidate_verify_cache(self.addon_id, self.user_id)
+
     @staticmethod
     def post_save(sender, instance, **kwargs):
         from . import tasks
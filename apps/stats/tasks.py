@@ -1,7 +1,6 @@
 import datetime
 import httplib2
 import itertools
-import json
 
 from django.conf import settings
 from django.db import connection, transaction
@@ -14,19 +13,14 @@ from oauth2client.client import OAuth2Credentials
 
 import amo
 import amo.search
-from addons.models import Addon, AddonUser
+from addons.models import Addon
 from bandwagon.models import Collection
-from mkt.monolith.models import MonolithRecord
-from mkt.webapps.models import Installed
 from stats.models import Contribution
-from reviews.models import Review
-from users.models import UserProfile
-from versions.models import Version
 from lib.es.utils import get_indices
 from .models import (AddonCollectionCount, CollectionCount, CollectionStats,
                      DownloadCount, UpdateCount)
 
-from . import search
+from . import search, totals
 
 log = commonware.log.getLogger('z.task')
 
@@ -142,175 +136,21 @@ def update_google_analytics(date, **kw):
 
 
 @task
-def update_global_totals(job, date, **kw):
-    log.info("Updating global statistics totals (%s) for (%s)" %
-                   (job, date))
-
-    jobs = _get_daily_jobs(date)
-    jobs.update(_get_metrics_jobs(date))
-
-    num = jobs[job]()
-
-    q = """REPLACE INTO
-                global_stats(`name`, `count`, `date`)
-            VALUES
-                (%s, %s, %s)"""
-    p = [job, num or 0, date]
-
-    try:
-        cursor = connection.cursor()
-        cursor.execute(q, p)
-        transaction.commit_unless_managed()
-    except Exception, e:
-        log.critical("Failed to update global stats: (%s): %s" % (p, e))
-
-    # monolith is only used for marketplace
-    if job.startswith(('apps', 'mmo')):
-        try:
-            value = json.dumps({'count': num or 0})
-            MonolithRecord(recorded=date, key=job, value=value,
-                           user_hash='none').save()
-        except Exception as e:
-            log.critical("Update of monolith table failed: (%s): %s" % (p, e))
-
-    log.debug("Committed global stats details: (%s) has (%s) for (%s)"
-              % tuple(p))
-
-
-def _get_daily_jobs(date=None):
-    """Return a dictionary of statisitics queries.
-
-    If a date is specified and applies to the job it will be used.  Otherwise
-    the date will default to today().
+def update_global_totals(date=None, end=None, **kw):
     """
-    if not date:
-        date = datetime.date.today()
-
-    # Passing through a datetime would not generate an error,
-    # but would pass and give incorrect values.
-    if isinstance(date, datetime.datetime):
-        raise ValueError('This requires a valid date, not a datetime')
-
-    # Testing on lte created date doesn't get you todays date, you need to do
-    # less than next date. That's because 2012-1-1 becomes 2012-1-1 00:00
-    next_date = date + datetime.timedelta(days=1)
-
-    date_str = date.strftime('%Y-%m-%d')
-    extra = dict(where=['DATE(created)=%s'], params=[date_str])
-
-    # If you're editing these, note that you are returning a function!  This
-    # cheesy hackery was done so that we could pass the queries to celery
-    # lazily and not hammer the db with a ton of these all at once.
-    stats = {
-        # Add-on Downloads
-        'addon_total_downloads': lambda: DownloadCount.objects.filter(
-                date__lt=next_date).aggregate(sum=Sum('count'))['sum'],
-        'addon_downloads_new': lambda: DownloadCount.objects.filter(
-                date=date).aggregate(sum=Sum('count'))['sum'],
-
-        # Add-on counts
-        'addon_count_new': Addon.objects.extra(**extra).count,
-
-        # Version counts
-        'version_count_new': Version.objects.extra(**extra).count,
-
-        # User counts
-        'user_count_total': UserProfile.objects.filter(
-                created__lt=next_date).count,
-        'user_count_new': UserProfile.objects.extra(**extra).count,
-
-        # Review counts
-        'review_count_total': Review.objects.filter(created__lte=date,
-                                                    editorreview=0).count,
-        'review_count_new': Review.objects.filter(editorreview=0).extra(
-                **extra).count,
-
-        # Collection counts
-        'collection_count_total': Collection.objects.filter(
-                created__lt=next_date).count,
-        'collection_count_new': Collection.objects.extra(**extra).count,
-        'collection_count_autopublishers': Collection.objects.filter(
-                created__lt=next_date, type=amo.COLLECTION_SYNCHRONIZED).count,
-
-        'collection_addon_downloads': (lambda:
-            AddonCollectionCount.objects.filter(date__lte=date).aggregate(
-                sum=Sum('count'))['sum']),
-
-        # Marketplace stats
-        'apps_count_new': (Addon.objects
-                .filter(created__range=(date, next_date),
-                        type=amo.ADDON_WEBAPP).count),
-        'apps_count_installed': (Installed.objects
-                .filter(created__range=(date, next_date),
-                        addon__type=amo.ADDON_WEBAPP).count),
-
-        # Marketplace reviews
-        'apps_review_count_new': Review.objects
-                .filter(created__range=(date, next_date),
-                        editorreview=0, addon__type=amo.ADDON_WEBAPP).count,
-
-        # New users
-        'mmo_user_count_total': UserProfile.objects.filter(
-                created__lt=next_date,
-                source=amo.LOGIN_SOURCE_MMO_BROWSERID).count,
-        'mmo_user_count_new': UserProfile.objects.filter(
-                created__range=(date, next_date),
-                source=amo.LOGIN_SOURCE_MMO_BROWSERID).count,
-
-        # New developers
-        'mmo_developer_count_total': AddonUser.objects.filter(
-            addon__type=amo.ADDON_WEBAPP).values('user').distinct().count,
-    }
-
-    # If we're processing today's stats, we'll do some extras.  We don't do
-    # these for re-processed stats because they change over time (eg. add-ons
-    # move from sandbox -> public
-    if date == datetime.date.today():
-        stats.update({
-            'addon_count_experimental': Addon.objects.filter(
-                created__lte=date, status=amo.STATUS_UNREVIEWED,
-                disabled_by_user=0).count,
-            'addon_count_nominated': Addon.objects.filter(
-                created__lte=date, status=amo.STATUS_NOMINATED,
-                disabled_by_user=0).count,
-            'addon_count_public': Addon.objects.filter(
-                created__lte=date, status=amo.STATUS_PUBLIC,
-                disabled_by_user=0).count,
-            'addon_count_pending': Version.objects.filter(
-                created__lte=date, files__status=amo.STATUS_PENDING).count,
-
-            'collection_count_private': Collection.objects.filter(
-                created__lte=date, listed=0).count,
-            'collection_count_public': Collection.objects.filter(
-                created__lte=date, listed=1).count,
-            'collection_count_editorspicks': Collection.objects.filter(
-                created__lte=date, type=amo.COLLECTION_FEATURED).count,
-            'collection_count_normal': Collection.objects.filter(
-                created__lte=date, type=amo.COLLECTION_NORMAL).count,
-        })
-
-    return stats
-
-
-def _get_metrics_jobs(date=None):
-    """Return a dictionary of statisitics queries.
-
-    If a date is specified and applies to the job it will be used.  Otherwise
-    the date will default to the last date metrics put something in the db.
+    Updates the global statistics totals of every day from `date` to `end`,
+    or of `date` only. Without a date, the stats of today and the update pings
+    of the last day we have update counts of are updated.
     """
-
-    if not date:
-        date = UpdateCount.objects.aggregate(max=Max('date'))['max']
-
-    # If you're editing these, note that you are returning a function!
-    stats = {
-        'addon_total_updatepings': lambda: UpdateCount.objects.filter(
-                date=date).aggregate(sum=Sum('count'))['sum'],
-        'collector_updatepings': lambda: UpdateCount.objects.get(
-                addon=11950, date=date).count,
-    }
-
-    return stats
+    log.info('Updating global statistics totals for %s to %s' % (date, end))
+    if date:
+        rows = totals.get_totals(date, end)
+    else:
+        rows = totals.get_totals(datetime.date.today(), group=totals.DAILY)
+        latest = UpdateCount.objects.aggregate(max=Max('date'))['max']
+        if latest:
+            rows += totals.get_totals(latest, group=totals.METRICS)
+    totals.save_totals(rows)
 
 
 @task
@@ -13,13 +13,18 @@ from mkt.webapps.models import Installed
 from reviews.models import Review
 from stats.models import (Contribution, DownloadCount, GlobalStat,
                           UpdateCount, AddonCollectionCount)
-from stats import cron, tasks
+from stats import cron, tasks, totals
+from stats.management.commands.index_stats import create_tasks
 from users.models import UserProfile
 
 
 class TestGlobalStats(amo.tests.TestCase):
     fixtures = ['stats/test_models']
 
+    def totals(self, start=None, end=None):
+        return dict((name, count) for name, count, date in
+                    totals.get_totals(start or datetime.date.today(), end))
+
     def test_stats_for_date(self):
 
         date = datetime.date(2009, 6, 1)
@@ -27,69 +32,143 @@ class TestGlobalStats(amo.tests.TestCase):
 
         eq_(GlobalStat.objects.no_cache().filter(date=date,
                                                  name=job).count(), 0)
-        tasks.update_global_totals(job, date)
-        eq_(len(GlobalStat.objects.no_cache().filter(date=date,
-                                                 name=job)), 1)
-
-    @mock.patch('stats.tasks.MonolithRecord')
+        tasks.update_global_totals(date)
+        eq_(GlobalStat.objects.no_cache().get(date=date, name=job).count, 10)
+        eq_(GlobalStat.objects.no_cache().get(
+            date=date, name='addon_total_updatepings').count, 1000)
+
+    def test_stats_for_range(self):
+        start, end = datetime.date(2009, 6, 1), datetime.date(2009, 6, 12)
+        tasks.update_global_totals(start, end)
+        stats = GlobalStat.objects.no_cache().filter(
+            name='addon_total_downloads')
+        eq_(stats.count(), 12)
+        eq_(stats.get(date=datetime.date(2009, 6, 12)).count, 30)
+
+    def test_stats_latest_updates(self):
+        tasks.update_global_totals()
+        today = datetime.date.today()
+        assert GlobalStat.objects.no_cache().filter(
+            date=today, name='addon_count_public').exists()
+        eq_(GlobalStat.objects.no_cache().get(
+            name='addon_total_updatepings').date, datetime.date(2009, 6, 2))
+
+    def test_one_query_per_source(self):
+        # The pending versions are only counted today.
+        day = datetime.date(2009, 6, 1)
+        with self.assertNumQueries(10):
+            totals.get_totals(day)
+        with self.assertNumQueries(10):
+            totals.get_totals(day, day + datetime.timedelta(days=365))
+
+    def test_backfill(self):
+        start = datetime.date(2009, 6, 1)
+        rows = totals.get_totals(start, datetime.date(2009, 6, 7))
+        downloads = dict(((name, date), count) for name, count, date in rows
+                         if name.startswith('addon_'))
+        eq_(downloads[('addon_total_downloads', start)], 10)
+        eq_(downloads[('addon_downloads_new', start)], 10)
+        day = datetime.date(2009, 6, 6)
+        eq_(downloads[('addon_total_downloads', day)], 10)
+        eq_(downloads[('addon_downloads_new', day)], 0)
+        day = datetime.date(2009, 6, 7)
+        eq_(downloads[('addon_total_downloads', day)], 20)
+        eq_(downloads[('addon_downloads_new', day)], 10)
+
+    def test_backfill_users(self):
+        day = datetime.date(2009, 1, 1)
+        for i, created in enumerate([day, day, day + datetime.timedelta(2)]):
+            p = UserProfile.objects.create(username='foo%s' % i)
+            p.update(created=created)
+        rows = totals.get_totals(day, day + datetime.timedelta(2))
+        new = [count for name, count, date in rows
+               if name == 'user_count_new']
+        total = [count for name, count, date in rows
+                 if name == 'user_count_total']
+        eq_(new, [2, 0, 1])
+        eq_(total, [2, 2, 3])
+
+    def test_today_only(self):
+        day = datetime.date(2009, 1, 1)
+        assert 'addon_count_public' not in self.totals(day)
+        assert 'addon_count_public' in self.totals()
+        rows = totals.get_totals(datetime.date.today() -
+                                 datetime.timedelta(days=1),
+                                 datetime.date.today())
+        eq_([date for name, count, date in rows
+             if name == 'addon_count_public'], [datetime.date.today()])
+
+    def test_save_totals(self):
+        date = datetime.date(2009, 6, 1)
+        GlobalStat.objects.create(name='user_count_new', count=10, date=date)
+        totals.save_totals([('user_count_new', 2, date),
+                            ('user_count_total', 3, date)])
+        eq_(dict(GlobalStat.objects.no_cache().filter(date=date)
+                 .values_list('name', 'count')),
+            {'user_count_new': 2, 'user_count_total': 3})
+
+    @mock.patch('stats.totals.MonolithRecord')
     def test_mmo_user_total_count_updates_monolith(self, record):
         date = datetime.date(2013, 3, 11)
-        job = 'mmo_user_count_total'
-
-        tasks.update_global_totals(job, date)
-        self.assertTrue(record.called)
+        totals.save_totals([('mmo_user_count_total', 0, date),
+                            ('addon_total_downloads', 1, date)])
+        records = record.objects.bulk_create.call_args[0][0]
+        eq_(len(records), 1)
+        eq_(record.call_args[1]['key'], 'mmo_user_count_total')
         eq_(record.call_args[1]['value'], '{"count": 0}')
 
-    @mock.patch('stats.tasks.MonolithRecord')
+    @mock.patch('stats.totals.MonolithRecord')
     def test_addon_total_downloads_doesnot_update_monolith(self, record):
         date = datetime.date(2013, 3, 11)
-        job = 'addon_total_downloads'
-
-        tasks.update_global_totals(job, date)
+        totals.save_totals([('addon_total_downloads', 1, date)])
         self.assertFalse(record.called)
+        self.assertFalse(record.objects.bulk_create.called)
 
     def test_marketplace_stats(self):
-        res = tasks._get_daily_jobs()
+        res = self.totals()
         for k in ['apps_count_new', 'apps_count_installed',
                   'apps_review_count_new']:
-            assert k in res, 'Job %s missing from _get_daily_jobs' % k
+            assert k in res, 'Stat %s missing from get_totals' % k
 
     def test_app_new(self):
         Addon.objects.create(type=amo.ADDON_WEBAPP)
-        eq_(tasks._get_daily_jobs()['apps_count_new'](), 1)
+        eq_(self.totals()['apps_count_new'], 1)
 
     def test_apps_installed(self):
         addon = Addon.objects.create(type=amo.ADDON_WEBAPP)
         user = UserProfile.objects.create(username='foo')
         Installed.objects.create(addon=addon, user=user)
-        eq_(tasks._get_daily_jobs()['apps_count_installed'](), 1)
+        eq_(self.totals()['apps_count_installed'], 1)
 
     def test_app_reviews(self):
         addon = Addon.objects.create(type=amo.ADDON_WEBAPP)
         user = UserProfile.objects.create(username='foo')
         Review.objects.create(addon=addon, user=user)
-        eq_(tasks._get_daily_jobs()['apps_review_count_new'](), 1)
+        eq_(self.totals()['apps_review_count_new'], 1)
 
     def test_input(self):
         for x in ['2009-1-1',
                   datetime.datetime(2009, 1, 1),
                   datetime.datetime(2009, 1, 1, 11, 0)]:
             with self.assertRaises((TypeError, ValueError)):
-                tasks._get_daily_jobs(x)
+                totals.get_totals(x)
+        with self.assertRaises(ValueError):
+            totals.get_totals(datetime.date(2009, 1, 2),
+                              datetime.date(2009, 1, 1))
 
     def test_user_total(self):
         day = datetime.date(2009, 1, 1)
         p = UserProfile.objects.create(username='foo',
                                        source=amo.LOGIN_SOURCE_MMO_BROWSERID)
         p.update(created=day)
-        eq_(tasks._get_daily_jobs(day)['mmo_user_count_total'](), 1)
-        eq_(tasks._get_daily_jobs()['mmo_user_count_total'](), 1)
-        eq_(tasks._get_daily_jobs()['mmo_user_count_new'](), 0)
+        eq_(self.totals(day)['mmo_user_count_total'], 1)
+        eq_(self.totals()['mmo_user_count_total'], 1)
+        eq_(self.totals()['mmo_user_count_new'], 0)
 
     def test_user_new(self):
         UserProfile.objects.create(username='foo',
                                    source=amo.LOGIN_SOURCE_MMO_BROWSERID)
-        eq_(tasks._get_daily_jobs()['mmo_user_count_new'](), 1)
+        eq_(self.totals()['mmo_user_count_new'], 1)
 
     def test_dev_total(self):
         p1 = UserProfile.objects.create(username='foo',
@@ -102,7 +181,7 @@ class TestGlobalStats(amo.tests.TestCase):
         AddonUser.objects.create(addon=a1, user=p2)
         AddonUser.objects.create(addon=a2, user=p1)
 
-        eq_(tasks._get_daily_jobs()['mmo_developer_count_total'](), 1)
+        eq_(self.totals()['mmo_developer_count_total'], 1)
 
 
 class TestGoogleAnalytics(amo.tests.TestCase):
@@ -151,6 +230,16 @@ class TestTotalContributions(amo.tests.TestCase):
         eq_(float(a.total_contributions), 19.99)
 
 
+class TestCreateTasks(amo.tests.TestCase):
+
+    @mock.patch('stats.management.commands.index_stats.TaskSet')
+    def test_inline(self, TaskSet):
+        task = mock.Mock()
+        create_tasks(task, range(60), inline=True)
+        eq_([c[0][0] for c in task.call_args_list], [range(50), range(50, 60)])
+        assert not TaskSet.called
+
+
 @mock.patch('stats.management.commands.index_stats.create_tasks')
 class TestIndexStats(amo.tests.TestCase):
     fixtures = ['stats/test_models']
@@ -0,0 +1,300 @@
+"""
+The global statistics totals, computed per source table instead of one
+query per stat.
+
+Every `Source` is a table (and its joins) that some of the stats count or sum
+rows of. All its stats are computed in a single conditional aggregate
+query, grouped by day, so that the stats of a range of dates come out of that
+one query as well:
+
+    SELECT CASE WHEN created < <start> THEN NULL ELSE DATE(created) END,
+           SUM(CASE WHEN <where of stat 1> THEN 1 ELSE 0 END), ...
+    FROM users WHERE created < <end + 1 day> GROUP BY 1
+
+The rows created before the range fall in the NULL group, which is where the
+running totals start from.
+"""
+import datetime
+import itertools
+import json
+
+from django.db import connection, transaction
+
+import commonware.log
+
+import amo
+from amo.utils import chunked
+from mkt.monolith.models import MonolithRecord
+
+log = commonware.log.getLogger('z.task')
+
+# A stat counts the rows of its day (NEW), the rows up to the end of its day
+# (TOTAL), or all the rows of a source without dates (ALL).
+NEW, TOTAL, ALL = 'new', 'total', 'all'
+
+# The stats of the add-ons and apps are computed for a day, those of the
+# update pings for the last day we have update counts of.
+DAILY, METRICS = 'daily', 'metrics'
+
+# The REPLACE of a long backfill is split in statements of that many rows.
+INSERT_CHUNK_SIZE = 1000
+
+
+class Metric(object):
+    """
+    A global stat: the sum of `value` over the rows of its source matching
+    `where`, or the number of distinct `distinct` of them for ALL stats.
+
+    Stats that are `today_only` change over time (eg. add-ons move from
+    sandbox -> public), they are only computed for today, not for re-processed
+    dates.
+    """
+
+    def __init__(self, name, kind, where='1', value='1', distinct=None,
+                 today_only=False):
+        self.name = name
+        self.kind = kind
+        self.where = where
+        self.value = value
+        self.distinct = distinct
+        self.today_only = today_only
+
+    def sql(self):
+        if self.distinct:
+            return 'COUNT(DISTINCT CASE WHEN %s THEN %s END)' % (
+                self.where, self.distinct)
+        return 'SUM(CASE WHEN %s THEN %s ELSE 0 END)' % (self.where,
+                                                         self.value)
+
+
+class Source(object):
+    """
+    The rows of `table` (and of its `joins`) matching `where`, dated by the
+    `date` column. The stats of sources without a `date` are the same for
+    every date.
+    """
+
+    def __init__(self, table, metrics, date=None, joins='', where='1',
+                 group=DAILY):
+        self.table = table
+        self.metrics = metrics
+        self.date = date
+        self.joins = joins
+        self.where = where
+        self.group = group
+
+    def query(self, metrics, start, end):
+        """Returns the query of `metrics` from `start` to `end`, and its
+        parameters."""
+        aggregates = ', '.join(m.sql() for m in metrics)
+        tables = ' '.join(filter(None, [self.table, self.joins]))
+        if not self.date:
+            return ('SELECT %s FROM %s WHERE %s' %
+                    (aggregates, tables, self.where), [])
+
+        q = ('SELECT CASE WHEN {date} < %s THEN NULL ELSE DATE({date}) END, '
+             '{aggregates} FROM {tables} WHERE {where} AND {date} < %s')
+        params = [start, end + datetime.timedelta(days=1)]
+        # The rows before the range only matter to the totals, otherwise
+        # the index on the date column does the job.
+        if all(m.kind == NEW for m in metrics):
+            q += ' AND {date} >= %s'
+            params.append(start)
+        q += ' GROUP BY 1'
+        return (q.format(date=self.date, aggregates=aggregates,
+                         tables=tables, where=self.where), params)
+
+    def totals(self, start, end, today=None):
+        """Returns the (name, count, date) of the stats of this source, for
+        every day from `start` to `end`."""
+        today = today or datetime.date.today()
+        metrics = [m for m in self.metrics
+                   if not m.today_only or start <= today <= end]
+        if not metrics:
+            return []
+
+        q, params = self.query(metrics, start, end)
+        cursor = connection.cursor()
+        cursor.execute(q, params)
+        rows = cursor.fetchall()
+        if self.date:
+            days = dict((row[0], [int(c or 0) for c in row[1:]])
+                        for row in rows)
+        else:
+            days = {}
+            counts = [int(c or 0) for c in rows[0]] if rows else []
+
+        zeros = [0] * len(metrics)
+        running = days.pop(None, zeros)
+        totals = []
+        day = start
+        while day <= end:
+            if self.date:
+                counts = days.get(day, zeros)
+                running = [a + b for a, b in zip(running, counts)]
+            for metric, new, total in zip(metrics, counts, running):
+                if metric.today_only and day != today:
+                    continue
+                totals.append((metric.name,
+                               total if metric.kind == TOTAL else new, day))
+            day += datetime.timedelta(days=1)
+        return totals
+
+
+def _sources():
+    webapp = 'addons.addontype_id = %s' % amo.ADDON_WEBAPP
+    mmo = 'users.source = %s' % amo.LOGIN_SOURCE_MMO_BROWSERID
+    # Add-ons disabled by their developers are left out of the status counts.
+    status = 'addons.status = %s AND addons.inactive = 0'
+
+    return [
+        Source('download_counts', date='download_counts.date',
+               metrics=[
+                   Metric('addon_total_downloads', TOTAL,
+                          value='download_counts.count'),
+                   Metric('addon_downloads_new', NEW,
+                          value='download_counts.count'),
+               ]),
+        Source('stats_addons_collections_counts',
+               date='stats_addons_collections_counts.date',
+               metrics=[
+                   Metric('collection_addon_downloads', TOTAL,
+                          value='stats_addons_collections_counts.count'),
+               ]),
+        Source('addons', date='addons.created',
+               where='addons.status != %s' % amo.STATUS_DELETED,
+               metrics=[
+                   Metric('addon_count_new', NEW),
+                   Metric('apps_count_new', NEW, webapp),
+                   Metric('addon_count_experimental', TOTAL,
+                          status % amo.STATUS_UNREVIEWED, today_only=True),
+                   Metric('addon_count_nominated', TOTAL,
+                          status % amo.STATUS_NOMINATED, today_only=True),
+                   Metric('addon_count_public', TOTAL,
+                          status % amo.STATUS_PUBLIC, today_only=True),
+               ]),
+        Source('versions', date='versions.created',
+               where='versions.deleted = 0',
+               metrics=[
+                   Metric('version_count_new', NEW),
+               ]),
+        Source('versions', date='versions.created',
+               joins='INNER JOIN files ON files.version_id = versions.id',
+               where='versions.deleted = 0',
+               metrics=[
+                   Metric('addon_count_pending', TOTAL,
+                          'files.status = %s' % amo.STATUS_PENDING,
+                          today_only=True),
+               ]),
+        Source('users', date='users.created',
+               metrics=[
+                   Metric('user_count_total', TOTAL),
+                   Metric('user_count_new', NEW),
+                   Metric('mmo_user_count_total', TOTAL, mmo),
+                   Metric('mmo_user_count_new', NEW, mmo),
+               ]),
+        Source('reviews', date='reviews.created',
+               joins='INNER JOIN addons ON addons.id = reviews.addon_id',
+               where='reviews.editorreview = 0',
+               metrics=[
+                   Metric('review_count_total', TOTAL),
+                   Metric('review_count_new', NEW),
+                   Metric('apps_review_count_new', NEW, webapp),
+               ]),
+        Source('collections', date='collections.created',
+               metrics=[
+                   Metric('collection_count_total', TOTAL),
+                   Metric('collection_count_new', NEW),
+                   Metric('collection_count_autopublishers', TOTAL,
+                          'collections.collection_type = %s' %
+                          amo.COLLECTION_SYNCHRONIZED),
+                   Metric('collection_count_private', TOTAL,
+                          'collections.listed = 0', today_only=True),
+                   Metric('collection_count_public', TOTAL,
+                          'collections.listed = 1', today_only=True),
+                   Metric('collection_count_editorspicks', TOTAL,
+                          'collections.collection_type = %s' %
+                          amo.COLLECTION_FEATURED, today_only=True),
+                   Metric('collection_count_normal', TOTAL,
+                          'collections.collection_type = %s' %
+                          amo.COLLECTION_NORMAL, today_only=True),
+               ]),
+        Source('users_install', date='users_install.created',
+               joins='INNER JOIN addons ON addons.id = users_install.addon_id',
+               metrics=[
+                   Metric('apps_count_installed', NEW, webapp),
+               ]),
+        Source('addons_users',
+               joins='INNER JOIN addons ON addons.id = addons_users.addon_id',
+               metrics=[
+                   Metric('mmo_developer_count_total', ALL, webapp,
+                          distinct='addons_users.user_id'),
+               ]),
+        Source('update_counts', date='update_counts.date', group=METRICS,
+               metrics=[
+                   Metric('addon_total_updatepings', NEW,
+                          value='update_counts.count'),
+                   Metric('collector_updatepings', NEW,
+                          'update_counts.addon_id = 11950',
+                          value='update_counts.count'),
+               ]),
+    ]
+
+
+def get_totals(start, end=None, group=None):
+    """
+    Returns the (name, count, date) of the global stats of every day from
+    `start` to `end`, or of `start` only, with one query per source. Only the
+    stats of `group` are computed if given.
+    """
+    end = end or start
+    # Passing through a datetime would not generate an error,
+    # but would pass and give incorrect values.
+    for date in (start, end):
+        if (not isinstance(date, datetime.date) or
+            isinstance(date, datetime.datetime)):
+            raise ValueError('This requires a valid date, not %r' % date)
+    if end < start:
+        raise ValueError('%s is before %s' % (end, start))
+
+    log.info('Computing global statistics totals for %s to %s' %
+             (start, end))
+    today = datetime.date.today()
+    totals = []
+    for source in _sources():
+        if group and source.group != group:
+            continue
+        totals.extend(source.totals(start, end, today))
+    return totals
+
+
+def save_totals(totals):
+    """Replaces the global stats with `totals`, the (name, count, date) rows
+    of `get_totals`."""
+    if not totals:
+        return
+    q = 'REPLACE INTO global_stats(`name`, `count`, `date`) VALUES %s'
+    try:
+        cursor = connection.cursor()
+        for chunk in chunked(totals, INSERT_CHUNK_SIZE):
+            cursor.execute(q % ', '.join(['(%s, %s, %s)'] * len(chunk)),
+                           list(itertools.chain.from_iterable(chunk)))
+        transaction.commit_unless_managed()
+    except Exception, e:
+        log.critical('Failed to update global stats: (%s rows): %s' %
+                     (len(totals), e))
+        return
+
+    # monolith is only used for marketplace
+    records = [MonolithRecord(recorded=date, key=name, user_hash='none',
+                              value=json.dumps({'count': count}))
+               for name, count, date in totals
+               if name.startswith(('apps', 'mmo'))]
+    if records:
+        try:
+            MonolithRecord.objects.bulk_create(records)
+        except Exception, e:
+            log.critical('Update of monolith table failed: (%s rows): %s' %
+                         (len(records), e))
+
+    log.debug('Committed %s global stats' % len(totals))
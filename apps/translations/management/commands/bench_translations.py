@@ -0,0 +1,65 @@
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+import multidb
+
+import amo
+from addons.models import Addon
+from amo.utils import chunked
+from translations import transformer
+
+
+class Command(BaseCommand):
+    """
+    Compare the queries and time it takes to attach translations to listing
+    pages of add-ons straight from the database, with a cold translation
+    cache and with a warm one.
+    """
+    help = 'Benchmark the translation transformer with and without cache.'
+    option_list = BaseCommand.option_list + (
+        make_option('--pages', action='store', type='int', dest='pages',
+                    default=50, help='Number of listing pages.'),
+        make_option('--page-size', action='store', type='int',
+                    dest='page_size', default=20,
+                    help='Number of add-ons per page.'),
+    )
+
+    def handle(self, *args, **options):
+        ids = list(Addon.objects.filter(status__in=amo.REVIEWED_STATUSES)
+                                .values_list('id', flat=True)
+                                .order_by('-weekly_downloads')
+                                [:options['pages'] * options['page_size']])
+        if not ids:
+            raise CommandError('No add-ons to list.')
+        pages = list(chunked(ids, options['page_size']))
+
+        connection = connections[multidb.get_slave()]
+        connection.use_debug_cursor = True
+        original = settings.TRANSLATION_CACHE_TIMEOUT
+        timeout = original or 60
+        modes = (('database', 0), ('cold cache', timeout),
+                 ('warm cache', timeout))
+        cache.clear()
+        try:
+            for mode, mode_timeout in modes:
+                settings.TRANSLATION_CACHE_TIMEOUT = mode_timeout
+                took, queries = 0, 0
+                for page in pages:
+                    addons = list(Addon.objects.no_cache().no_transforms()
+                                       .filter(id__in=page))
+                    before = len(connection.queries)
+                    start = time.time()
+                    transformer.get_trans(addons)
+                    took += time.time() - start
+                    queries += len(connection.queries) - before
+                self.stdout.write('%s: %.1f queries, %.2fms per page\n' %
+                                  (mode, float(queries) / len(pages),
+                                   took * 1000 / len(pages)))
+        finally:
+            settings.TRANSLATION_CACHE_TIMEOUT = original
+            connection.use_debug_cursor = None
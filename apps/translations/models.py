@@ -1,13 +1,36 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models, connection
+from django.db.models.signals import post_delete
 from django.utils import encoding
 
 import bleach
+import caching.base
 
 import amo.models
 from amo import urlresolvers
 from . import utils
 
 
+class TranslationQuerySet(caching.base.CachingQuerySet):
+
+    def update(self, **kw):
+        # Updates don't go through save(), forget the cached translations
+        # here.
+        changed = set(self.values_list('id', 'locale'))
+        rv = super(TranslationQuerySet, self).update(**kw)
+        for id, locale in changed:
+            invalidate_locale_cache(id, locale)
+        return rv
+
+
+class TranslationManager(amo.models.ManagerBase):
+
+    def get_query_set(self):
+        qs = super(TranslationManager, self).get_query_set()
+        return qs._clone(klass=TranslationQuerySet)
+
+
 class Translation(amo.models.ModelBase):
     """
     Translation model.
@@ -22,6 +45,8 @@ class Translation(amo.models.ModelBase):
     localized_string = models.TextField(null=True)
     localized_string_clean = models.TextField(null=True)
 
+    objects = TranslationManager()
+
     class Meta:
         db_table = 'translations'
         unique_together = ('id', 'locale')
@@ -52,7 +77,9 @@ class Translation(amo.models.ModelBase):
 
     def save(self, **kwargs):
         self.clean()
-        return super(Translation, self).save(**kwargs)
+        rv = super(Translation, self).save(**kwargs)
+        invalidate_locale_cache(self.id, self.locale)
+        return rv
 
     @property
     def cache_key(self):
@@ -103,6 +130,37 @@ class Translation(amo.models.ModelBase):
         return trans
 
 
+def locale_cache_key(id, locale):
+    """
+    Cache key of translation `id` in `locale`, as used by the transformer.
+    A `locale` of None stands for whichever locale there is.
+    """
+    # MySQL compares locales case insensitively, so do we.
+    return 'trans:%s:%s' % (id, locale.lower() if locale else '*')
+
+
+def changed_cache_key(id):
+    """Cache key flagging translation `id` as changed lately."""
+    return 'trans:%s:changed' % id
+
+
+def invalidate_locale_cache(id, locale):
+    # Until the slaves have caught up, the transformer reads the translation
+    # from the master and doesn't cache it, or a lagging slave would get its
+    # old string cached again.
+    if settings.TRANSLATION_MASTER_TIMEOUT:
+        cache.set(changed_cache_key(id), 1,
+                  settings.TRANSLATION_MASTER_TIMEOUT)
+    # A translation can move to another locale, forget them all.
+    locales = set(settings.AMO_LANGUAGES + settings.HIDDEN_LANGUAGES +
+                  (locale, None))
+    cache.delete_many([locale_cache_key(id, l) for l in locales])
+
+
+def translation_deleted(sender, instance, **kw):
+    invalidate_locale_cache(instance.id, instance.locale)
+
+
 class PurifiedTranslation(Translation):
     """Run the string through bleach to get a safe, linkified version."""
 
@@ -159,3 +217,8 @@ def delete_translation(obj, fieldname):
     obj.update(**{field.name: None})
     if trans:
         Translation.objects.filter(id=trans.id).delete()
+
+
+for cls in (Translation, PurifiedTranslation, LinkifiedTranslation):
+    post_delete.connect(translation_deleted, sender=cls,
+                        dispatch_uid='translation_deleted_%s' % cls.__name__)
@@ -1,17 +1,20 @@
 # -*- coding: utf-8 -*-
 from django.conf import settings
 from django import test
+from django.core.cache import cache
+from django.test.utils import override_settings
 from django.utils import translation
 from django.utils.functional import lazy
 
 import jinja2
+import mock
 from nose.tools import eq_
 from test_utils import ExtraAppTestCase, trans_eq
 
 from testapp.models import TranslatedModel, UntranslatedModel, FancyModel
 from translations.models import (Translation, PurifiedTranslation,
                                  TranslationSequence)
-from translations import widgets
+from translations import transformer, widgets
 from translations.query import order_by_translation
 
 
@@ -347,6 +350,79 @@ class TranslationTestCase(ExtraAppTestCase):
         eq_(obj.no_locale.locale, 'fr')
 
 
+@override_settings(TRANSLATION_CACHE_TIMEOUT=60)
+class TranslationCacheTestCase(TranslationTestCase):
+    """The same, with the translations going through the cache."""
+
+    def setUp(self):
+        super(TranslationCacheTestCase, self).setUp()
+        cache.clear()
+
+    def test_cached(self):
+        with mock.patch('translations.transformer.fetch_trans',
+                        wraps=transformer.fetch_trans) as fetch:
+            for i in range(2):
+                o = TranslatedModel.objects.no_cache().get(id=1)
+                trans_eq(o.name, 'some name', 'en-US')
+        eq_(fetch.call_count, 1)
+
+    def test_cached_per_locale(self):
+        with mock.patch('translations.transformer.fetch_trans',
+                        wraps=transformer.fetch_trans) as fetch:
+            TranslatedModel.objects.no_cache().get(id=1)
+            translation.activate('de')
+            o = TranslatedModel.objects.no_cache().get(id=1)
+            trans_eq(o.name, 'German!! (unst unst)', 'de')
+            trans_eq(o.description, 'some description', 'en-US')
+        eq_(fetch.call_count, 2)
+        # The fallbacks were cached the first time around.
+        eq_(sorted(fetch.call_args[0][0]),
+            [(1, 'de'), (2, 'de'), (10, 'de')])
+
+    def test_save_invalidates(self):
+        o = TranslatedModel.objects.no_cache().get(id=1)
+        o.name.localized_string = 'new name'
+        o.name.save()
+        o = TranslatedModel.objects.no_cache().get(id=1)
+        trans_eq(o.name, 'new name', 'en-US')
+
+    @override_settings(TRANSLATION_MASTER_TIMEOUT=0)
+    def test_delete_invalidates(self):
+        with mock.patch('translations.transformer.fetch_trans',
+                        wraps=transformer.fetch_trans) as fetch:
+            TranslatedModel.objects.no_cache().get(id=1)
+            Translation.objects.get(id=1, locale='de').delete()
+            TranslatedModel.objects.no_cache().get(id=1)
+            TranslatedModel.objects.no_cache().get(id=1)
+        eq_(fetch.call_count, 2)
+
+    def test_update_invalidates(self):
+        TranslatedModel.objects.no_cache().get(id=1)
+        Translation.objects.filter(id=1).update(localized_string='new name')
+        o = TranslatedModel.objects.no_cache().get(id=1)
+        trans_eq(o.name, 'new name', 'en-US')
+
+    def test_changed_read_from_master(self):
+        o = TranslatedModel.objects.no_cache().get(id=1)
+        o.name.save()
+        with mock.patch('translations.transformer.fetch_trans',
+                        wraps=transformer.fetch_trans) as fetch:
+            for i in range(2):
+                o = TranslatedModel.objects.no_cache().get(id=1)
+                trans_eq(o.name, 'some name', 'en-US')
+        # Not cached until the slaves caught up.
+        eq_(fetch.call_count, 2)
+        eq_(fetch.call_args[1]['using'], 'default')
+        eq_(set(id for id, locale in fetch.call_args[0][0]), set([1]))
+
+    def test_disabled(self):
+        with self.settings(TRANSLATION_CACHE_TIMEOUT=0):
+            with mock.patch('translations.transformer.fetch_trans') as fetch:
+                o = TranslatedModel.objects.no_cache().get(id=1)
+                trans_eq(o.name, 'some name', 'en-US')
+        assert not fetch.called
+
+
 def test_translation_bool():
     t = lambda s: Translation(localized_string=s)
 
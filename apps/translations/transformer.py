@@ -1,10 +1,14 @@
 from django.conf import settings
+from django.core.cache import cache
 from django.db import connections, models
 from django.utils import translation
 
 import multidb
+import multidb.pinning
+from django_statsd.clients import statsd
 
-from translations.models import Translation
+from translations.models import (Translation, changed_cache_key,
+                                 locale_cache_key)
 from translations.fields import TranslatedField
 
 isnull = """IF(!ISNULL({t1}.localized_string), {t1}.{col}, {t2}.{col})
@@ -15,21 +19,32 @@ no_locale_join = """LEFT OUTER JOIN translations {t}
                     ON {t}.id={model}.{name}"""
 
 trans_fields = [f.name for f in Translation._meta.fields]
+trans_columns = [f.column for f in Translation._meta.fields]
+ID, LOCALE, STRING = map(trans_fields.index, ('id', 'locale',
+                                              'localized_string'))
 
 
-def build_query(model, connection):
-    qn = connection.ops.quote_name
-    selects, joins, params = [], [], []
-
+def get_fallback(model):
     # The model can define a fallback locale (which may be a Field).
     if hasattr(model, 'get_fallback'):
-        fallback = model.get_fallback()
+        return model.get_fallback()
     else:
-        fallback = settings.LANGUAGE_CODE
+        return settings.LANGUAGE_CODE
+
 
+def get_translated_fields(model):
     if not hasattr(model._meta, 'translated_fields'):
         model._meta.translated_fields = [f for f in model._meta.fields
                                          if isinstance(f, TranslatedField)]
+    return model._meta.translated_fields
+
+
+def build_query(model, connection):
+    qn = connection.ops.quote_name
+    selects, joins, params = [], [], []
+
+    fallback = get_fallback(model)
+    get_translated_fields(model)
 
     # Add the selects and joins for each translated field on the model.
     for field in model._meta.translated_fields:
@@ -64,6 +79,120 @@ def build_query(model, connection):
 
 
 def get_trans(items):
+    """
+    Attach the translations of `items` in the current locale, or in their
+    fallback locale.
+
+    Translations are looked up in the cache by (id, locale) and only the
+    ones missing from it are loaded, in one query. With
+    TRANSLATION_CACHE_TIMEOUT set to 0, everything comes from the database.
+
+    Translations that changed in the last TRANSLATION_MASTER_TIMEOUT seconds
+    are read from the master and not cached.
+    """
+    if not items:
+        return
+    if not settings.TRANSLATION_CACHE_TIMEOUT:
+        return get_trans_from_db(items)
+
+    model = items[0].__class__
+    fallback = get_fallback(model)
+    lang = translation.get_language()
+
+    wanted = []
+    for item in items:
+        for field in get_translated_fields(model):
+            id = getattr(item, field.attname)
+            if id is None:
+                continue
+            if not field.require_locale:
+                locale = None
+            elif isinstance(fallback, models.Field):
+                locale = getattr(item, fallback.attname)
+            else:
+                locale = fallback
+            wanted.append((item, field, id, locale))
+
+    keys = {}
+    for item, field, id, locale in wanted:
+        if lang:
+            keys[locale_cache_key(id, lang)] = (id, lang)
+        keys[locale_cache_key(id, locale)] = (id, locale)
+    changed_keys = dict((changed_cache_key(id), id)
+                        for item, field, id, locale in wanted)
+    rows = cache.get_many(keys.keys() + changed_keys.keys())
+    changed = set(changed_keys[k] for k in changed_keys if k in rows)
+    rows = dict((k, v) for k, v in rows.items()
+                if k in keys and keys[k][0] not in changed)
+    statsd.incr('translations.cache.hit', len(rows))
+
+    missing = dict((k, v) for k, v in keys.items() if k not in rows)
+    if missing:
+        statsd.incr('translations.cache.miss', len(missing))
+        fresh = dict((k, v) for k, v in missing.items() if v[0] in changed)
+        stale = dict((k, v) for k, v in missing.items()
+                     if v[0] not in changed)
+        using = ('default' if multidb.pinning.this_thread_is_pinned()
+                 else multidb.get_slave())
+        for missed, db in ((fresh, 'default'), (stale, using)):
+            if not missed:
+                continue
+            found = fetch_trans(missed.values(), using=db)
+            for key, (id, locale) in missed.items():
+                # Cache what isn't there too, an empty tuple.
+                rows[key] = found.get(
+                    (id, locale.lower() if locale else None), ())
+
+        # Translations that changed while they were being read don't get
+        # cached either.
+        ids = set(id for id, locale in stale.values())
+        changed.update(changed_keys[k] for k in cache.get_many(
+            [changed_cache_key(id) for id in ids]))
+        cache.set_many(dict((k, rows[k]) for k, (id, locale) in missing.items()
+                            if id not in changed),
+                       settings.TRANSLATION_CACHE_TIMEOUT)
+
+    for item, field, id, locale in wanted:
+        # Same as the SQL: the current locale if it has a string, the
+        # fallback otherwise.
+        row = rows[locale_cache_key(id, lang)] if lang else ()
+        if not row or row[STRING] is None:
+            row = rows[locale_cache_key(id, locale)]
+        if row and row[STRING] is not None:
+            setattr(item, field.name, Translation(*row))
+
+
+def fetch_trans(wanted, using=None):
+    """
+    Load the translations for the (id, locale) in `wanted` in one query, from
+    the database `using` or a slave. Returns a dict of rows keyed by (id,
+    lowercased locale), a locale of None being the last row of the id with a
+    string.
+    """
+    ids = set(id for id, locale in wanted)
+    locales = set(locale for id, locale in wanted if locale)
+    any_ids = set(id for id, locale in wanted if not locale)
+
+    where, params = [], []
+    if locales:
+        where.append('locale IN (%s)' % ','.join(['%s'] * len(locales)))
+        params.extend(locales)
+    if any_ids:
+        where.append('id IN (%s)' % ','.join(map(str, any_ids)))
+    sql = 'SELECT %s FROM translations WHERE id IN (%s) AND (%s)' % (
+        ','.join(trans_columns), ','.join(map(str, ids)), ' OR '.join(where))
+
+    cursor = connections[using or multidb.get_slave()].cursor()
+    cursor.execute(sql, params)
+    found = {}
+    for row in cursor.fetchall():
+        found[row[ID], row[LOCALE].lower()] = row
+        if row[ID] in any_ids and row[STRING] is not None:
+            found[row[ID], None] = row
+    return found
+
+
+def get_trans_from_db(items):
     if not items:
         return
 
@@ -7,6 +7,7 @@ from celery.task.sets import TaskSet
 import cronjobs
 from amo import VALID_STATUSES
 from amo.utils import chunked
+from lib.es.utils import reindex_changed, reindex_objects
 from .models import UserProfile
 from .tasks import update_user_ratings_task
 
@@ -47,9 +48,13 @@ def update_user_ratings():
 
 
 @cronjobs.register
-def reindex_users(index=None, aliased=True):
+def reindex_users(index=None, aliased=True, inline=False, since=None):
     from . import tasks
     ids = UserProfile.objects.values_list('id', flat=True)
-    taskset = [tasks.index_users.subtask(args=[chunk], kwargs=dict(index=index))
-               for chunk in chunked(sorted(list(ids)), 150)]
-    TaskSet(taskset).apply_async()
+    if since:
+        changed = ids.filter(modified__gte=since)
+        reindex_changed('reindex_users', tasks.index_users, ids, changed,
+                        index, inline)
+        return
+    reindex_objects('reindex_users', tasks.index_users, UserProfile,
+                    list(ids), index, inline)
@@ -46,7 +46,8 @@ def resize_photo(src, dst, locally=False, **kw):
 def index_users(ids, **kw):
     task_log.debug('Indexing users %s-%s [%s].' % (ids[0], ids[-1], len(ids)))
     index = kw.pop('index', None)
-    index_objects(ids, UserProfile, search, index)
+    index_objects(ids, UserProfile, search, index,
+                  checkpoint=kw.pop('checkpoint', None))
 
 
 @task
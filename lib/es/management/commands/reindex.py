@@ -20,18 +20,25 @@ from amo.utils import timestamp_index
 from apps.addons.search import setup_mapping as put_amo_mapping
 from bandwagon.cron import reindex_collections
 from compat.cron import compatibility_report
-from lib.es.models import Reindexing
-from lib.es.utils import database_flagged
+from lib.es.models import Reindexing, ReindexingCheckpoint
+from lib.es.utils import check_counts, database_flagged
 from stats.search import setup_indexes as put_stats_mapping
 from users.cron import reindex_users
+from zadmin.models import set_config, unmemoized_get_config
 
 
 _INDEXES = {}
+# Config key holding the start of the last successful indexation.
+LAST_REINDEX = 'es_last_reindex'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Indexers that can run without celery.
+_INLINE = set([reindex_addons, reindex_apps, reindex_collections,
+               reindex_users])
 
 
-def index_stats(index=None, aliased=True):
+def index_stats(index=None, aliased=True, inline=False):
     """Indexes the previous 365 days."""
-    call_command('index_stats', addons=None)
+    call_command('index_stats', addons=None, inline=inline)
 
 
 if django_settings.MARKETPLACE:
@@ -43,6 +50,8 @@ if django_settings.MARKETPLACE:
     from mkt.stats.cron import index_mkt_stats
     from mkt.stats.search import setup_mkt_indexes as put_mkt_stats_mapping
 
+    _INLINE.update([index_stats, index_mkt_stats])
+
     _INDEXES = {'stats': [index_stats, index_mkt_stats],
                 'apps': [reindex_addons,
                          reindex_apps,
@@ -106,11 +115,20 @@ def delete_indexes(indexes):
 
 
 @task_with_callbacks
-def run_aliases_actions(actions):
+def run_aliases_actions(actions, check=False):
     """Run actions on aliases.
 
      - action: list of action/index/alias items
+     - check: if True, make sure the new indexes hold as many documents as
+       there are in the database before pointing the aliases at them
     """
+    if check:
+        errors = sum([check_counts(index) for action, index, alias in actions
+                      if action == 'add'], [])
+        if errors:
+            raise CommandError('Not switching the aliases:\n%s' %
+                               '\n'.join(errors))
+
     # we also want to rename or delete the current index in case we have one
     dump = []
     aliases = []
@@ -187,19 +205,22 @@ def create_mapping(new_index, alias, num_replicas=DEFAULT_NUM_REPLICAS,
 
 
 @task_with_callbacks
-def create_index(index, is_stats):
+def create_index(index, is_stats, inline=False):
     """Create the index.
 
     - index: name of the index
     - is_stats: if True, we're indexing stats
+    - inline: if True, index from this process rather than through celery,
+      for the indexers that support it
     """
     log('Running all indexes for %r' % index)
     indexers = is_stats and _INDEXES['stats'] or _INDEXES['apps']
 
     for indexer in indexers:
         log('Indexing %r' % indexer.__name__)
+        kw = {'inline': True} if inline and indexer in _INLINE else {}
         try:
-            indexer(index, aliased=False)
+            indexer(index, aliased=False, **kw)
         except Exception:
             # We want to log this event but continue
             log('Indexer %r failed' % indexer.__name__)
@@ -220,6 +241,40 @@ def unflag_database():
     """Unflag the database to indicate that the reindexing is over."""
     log('Unflagging the database')
     Reindexing.objects.all().delete()
+    ReindexingCheckpoint.objects.all().delete()
+
+
+def parse_since(value):
+    """Parse --since, `last` being the start of the last indexation."""
+    if value == 'last':
+        value = unmemoized_get_config(LAST_REINDEX)
+        if not value:
+            raise CommandError('No indexation recorded yet, pass a date to '
+                               '--since.')
+    for fmt in (DATE_FORMAT, '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise CommandError('Invalid date for --since: %r' % value)
+
+
+def delta_reindex(aliases, since, inline=False):
+    """Index what changed since `since` in the current indexes."""
+    for alias in sorted(aliases):
+        if 'stats' in alias:
+            continue
+        for indexer in _INDEXES['apps']:
+            if indexer not in _INLINE:
+                continue
+            log('Indexing %r changes since %s in %r' %
+                (indexer.__name__, since, alias))
+            indexer(alias, inline=inline, since=since)
+
+
+def show_progress():
+    for checkpoint in ReindexingCheckpoint.objects.order_by('index', 'id'):
+        log(checkpoint.progress())
 
 
 _SUMMARY = """
@@ -248,6 +303,25 @@ class Command(BaseCommand):
                     help=('Wipes ES from any content first. This option '
                           'will destroy anything that is in ES!'),
                     default=False),
+        make_option('--inline', action='store_true',
+                    help=('Index from this process with the bulk indexer '
+                          'instead of going through celery'),
+                    default=False),
+        make_option('--resume', action='store_true',
+                    help=('Resume an interrupted reindexation from its '
+                          'checkpoints, implies --inline'),
+                    default=False),
+        make_option('--since', action='store',
+                    help=('Only index what changed since this date '
+                          '(YYYY-MM-DD [HH:MM:SS]) or since the last '
+                          'indexation with "last", in the current indexes'),
+                    default=None),
+        make_option('--check-counts', action='store_true',
+                    dest='check_counts',
+                    help=('Do not switch the aliases if the new indexes '
+                          'have fewer documents than the database, with '
+                          '--inline or --resume'),
+                    default=False),
     )
 
     def handle(self, *args, **kwargs):
@@ -263,12 +337,41 @@ class Command(BaseCommand):
                                'run from the Marketplace.')
 
         force = kwargs.get('force', False)
-
-        if database_flagged() and not force:
+        resume = kwargs.get('resume', False)
+        since = kwargs.get('since')
+        started = datetime.datetime.now()
+
+        # With celery, the aliases step runs as soon as the indexing tasks
+        # are sent, there wouldn't be anything to compare yet.
+        if kwargs.get('check_counts') and not (kwargs.get('inline') or
+                                               resume):
+            raise CommandError('--check-counts can only be used with '
+                               '--inline or --resume.')
+
+        if since and (force or resume or kwargs.get('wipe', False)):
+            raise CommandError('--since cannot be used with --force, '
+                               '--resume or --wipe.')
+
+        if resume:
+            if not database_flagged():
+                raise CommandError('No indexation to resume.')
+            if force or kwargs.get('wipe', False):
+                raise CommandError('--resume cannot be used with --force or '
+                                   '--wipe.')
+        elif database_flagged() and not force:
             raise CommandError('Indexation already occuring - use --force to '
-                               'bypass')
+                               'bypass, or --resume to carry on')
 
         prefix = kwargs.get('prefix', '')
+
+        if since:
+            since = parse_since(since)
+            delta_reindex(set([prefix + index for index in
+                               django_settings.ES_INDEXES.values()]),
+                          since, kwargs.get('inline', False))
+            set_config(LAST_REINDEX, started.strftime(DATE_FORMAT))
+            return 'Indexed the changes since %s.\n' % since
+
         log('Starting the reindexation')
 
         if kwargs.get('wipe', False):
@@ -302,12 +405,14 @@ class Command(BaseCommand):
 
         all_aliases = all_aliases.items()
 
-        # creating a task tree
-        log('Building the task tree')
-        tree = TaskTree()
-        last_action = None
-
+        inline = kwargs.get('inline', False) or resume
+        # The indexes an interrupted run was building, by alias.
+        resumed = dict((r.alias, r.new_index)
+                       for r in Reindexing.objects.all()) if resume else {}
         to_remove = []
+        # One chain of steps per index, then the steps run once they're
+        # all done.
+        chains, steps = [], []
 
         # for each index, we create a new time-stamped index
         for alias in indexes:
@@ -323,6 +428,16 @@ class Command(BaseCommand):
                     # mark the alias to be removed as well
                     add_action('remove', aliased_index, alias)
 
+            if alias in resumed:
+                # The database is flagged and the mapping is there already,
+                # carry on indexing.
+                new_index = resumed[alias]
+                log('Resuming the indexation of %r' % new_index)
+                show_progress()
+                chains.append([(create_index, [new_index, is_stats, inline])])
+                add_action('add', new_index, alias)
+                continue
+
             # create a new index, using the alias name with a timestamp
             new_index = timestamp_index(alias)
 
@@ -332,41 +447,52 @@ class Command(BaseCommand):
             if requests.head(future_alias).status_code == 200:
                 old_index = alias
 
-            # flag the database
-            step1 = tree.add_task(flag_database, args=[new_index, old_index,
-                                                       alias])
-            step2 = step1.add_task(create_mapping, args=[new_index, alias])
-            step3 = step2.add_task(create_index, args=[new_index, is_stats])
-            last_action = step3
+            chains.append([(flag_database, [new_index, old_index, alias]),
+                           (create_mapping, [new_index, alias]),
+                           (create_index, [new_index, is_stats, inline])])
 
             # adding new index to the alias
             add_action('add', new_index, alias)
 
         # Alias the new index and remove the old aliases, if any.
-        renaming_step = last_action.add_task(run_aliases_actions,
-                                             args=[actions])
+        steps.append((run_aliases_actions,
+                      [actions, kwargs.get('check_counts', False)]))
 
         # unflag the database - there's no need to duplicate the
         # indexing anymore
-        delete = renaming_step.add_task(unflag_database)
+        steps.append((unflag_database, []))
 
         # Delete the old indexes, if any
-        delete.add_task(delete_indexes, args=[to_remove])
-
-        # let's do it
-        log('Running all indexation tasks')
+        steps.append((delete_indexes, [to_remove]))
 
         os.environ['FORCE_INDEXING'] = '1'
         try:
-            tree.apply_async()
-            time.sleep(10)   # give celeryd some time to flag the DB
-            while database_flagged():
-                sys.stdout.write('.')
-                sys.stdout.flush()
-                time.sleep(5)
+            if inline:
+                log('Running all indexation steps')
+                for step, args in sum(chains, []) + steps:
+                    step(*args)
+            else:
+                # creating a task tree
+                log('Building the task tree')
+                tree = TaskTree()
+                for chain in chains:
+                    last_action = tree
+                    for step, args in chain:
+                        last_action = last_action.add_task(step, args=args)
+                for step, args in steps:
+                    last_action = last_action.add_task(step, args=args)
+
+                # let's do it
+                log('Running all indexation tasks')
+                tree.apply_async()
+                time.sleep(10)   # give celeryd some time to flag the DB
+                while database_flagged():
+                    show_progress()
+                    time.sleep(30)
         finally:
             del os.environ['FORCE_INDEXING']
 
+        set_config(LAST_REINDEX, started.strftime(DATE_FORMAT))
         sys.stdout.write('\n')
 
         # let's return the /_aliases values
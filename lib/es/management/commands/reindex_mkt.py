@@ -20,7 +20,7 @@ from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
 from amo.utils import chunked, timestamp_index
-from addons.models import Webapp  # To avoid circular import.
+from addons.models import Webapp  # noqa, to avoid a circular import.
 from lib.es.models import Reindexing
 from lib.es.utils import database_flagged
 
@@ -86,12 +86,13 @@ def create_index(new_index, alias, settings):
 
 def index_webapp(ids, **kw):
     index = kw.pop('index', None) or ALIAS
+    timings = kw.pop('timings', {})
     sys.stdout.write('Indexing %s apps' % len(ids))
 
-    qs = Webapp.indexing_transformer(Webapp.uncached.filter(id__in=ids))
-
-    docs = [WebappIndexer.extract_document(obj.id, obj=obj) for obj in qs]
+    docs = WebappIndexer.extract_documents(ids, timings=timings)
+    start = time.time()
     WebappIndexer.bulk_index(docs, es=ES, index=index)
+    timings['bulk'] = timings.get('bulk', 0) + time.time() - start
 
 
 @task_with_callbacks
@@ -110,8 +111,12 @@ def run_indexing(index):
     sys.stdout.write('Indexing apps into index: %s' % index)
 
     qs = WebappIndexer.get_indexable()
+    timings = {}
     for chunk in chunked(list(qs), 100):
-        index_webapp(chunk, index=index)
+        index_webapp(chunk, index=index, timings=timings)
+    sys.stdout.write('Time spent per phase: %s' % ', '.join(
+        '%s %.2fs' % (phase, took) for phase, took
+        in sorted(timings.items(), key=lambda x: -x[1])))
 
 
 @task_with_callbacks
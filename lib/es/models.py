@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from django.db import models
 
 
@@ -9,3 +11,46 @@ class Reindexing(models.Model):
 
     class Meta:
         db_table = 'zadmin_reindexing'
+
+
+class ReindexingCheckpoint(models.Model):
+    """Progress of one indexer while an index is being rebuilt."""
+    index = models.CharField(max_length=255)
+    # The indexer, like `reindex_addons`.
+    name = models.CharField(max_length=255)
+    doc_type = models.CharField(max_length=255)
+    # Number of objects the indexer found in the database.
+    total = models.PositiveIntegerField(default=0)
+    # Number of documents indexed so far.
+    docs = models.PositiveIntegerField(default=0)
+    # Indexing inline goes through the ids in order, so everything up to
+    # `last_id` is done and a resumed run can start after it.
+    last_id = models.PositiveIntegerField(default=0)
+    resumable = models.BooleanField(default=False)
+    # When the current run started, and how many docs were done by then.
+    started = models.DateTimeField(default=datetime.now)
+    start_docs = models.PositiveIntegerField(default=0)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'zadmin_reindexing_checkpoint'
+        unique_together = ('index', 'name')
+
+    @property
+    def rate(self):
+        """Documents per second since the current run started."""
+        elapsed = (datetime.now() - self.started).total_seconds()
+        return (self.docs - self.start_docs) / elapsed if elapsed > 0 else 0
+
+    @property
+    def eta(self):
+        """Seconds left at the current rate, or None."""
+        if not self.rate:
+            return None
+        return max(self.total - self.docs, 0) / self.rate
+
+    def progress(self):
+        eta = self.eta
+        return '%s %s: %s/%s docs, %.0f docs/sec, ETA %s' % (
+            self.index, self.name, self.docs, self.total, self.rate,
+            '%d:%02d' % divmod(int(eta), 60) if eta is not None else '?')
@@ -6,6 +6,8 @@ import time
 from nose.tools import eq_
 
 from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db import connection
 
 import amo.search
@@ -18,6 +20,14 @@ from es.management.commands.reindex import (call_es, unflag_database,
 from mkt.webapps.models import Webapp
 
 
+class TestReindexOptions(amo.tests.TestCase):
+
+    def test_check_counts_needs_inline(self):
+        with self.assertRaises(CommandError):
+            call_command('reindex', check_counts=True)
+        assert not database_flagged()
+
+
 class TestIndexCommand(amo.tests.ESTestCase):
     fixtures = ['webapps/337141-steamcube']
 
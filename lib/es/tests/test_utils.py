@@ -0,0 +1,262 @@
+import json
+from datetime import datetime, timedelta
+
+import mock
+from nose.tools import eq_
+
+import amo.tests
+from addons.models import Addon
+from lib.es.models import Reindexing, ReindexingCheckpoint
+from lib.es.utils import (BulkIndexer, check_counts, reindex_changed,
+                          reindex_objects, translated_since, unindex_objects)
+from translations.models import Translation
+
+
+class Obj(object):
+
+    def __init__(self, id):
+        self.id = id
+
+
+class TestBulkIndexer(amo.tests.TestCase):
+
+    def setUp(self):
+        self.model = mock.Mock()
+        self.model._meta.db_table = 'things'
+        self.model.uncached.filter.side_effect = (
+            lambda id__in: [Obj(id) for id in id__in])
+        self.search = mock.Mock()
+        self.search.extract.side_effect = lambda ob: {'id': ob.id}
+        patcher = mock.patch('lib.es.utils.amo.search.get_es')
+        self.es = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.es._send_request.return_value = {'items': []}
+
+    def indexer(self, **kw):
+        return BulkIndexer(self.model, self.search, index='idx', threads=1,
+                           **kw)
+
+    def bodies(self):
+        return [[json.loads(line) for line in c[0][2].splitlines()]
+                for c in self.es._send_request.call_args_list]
+
+    def test_chunks(self):
+        indexer = self.indexer(chunk_size=2).index([1, 2, 3])
+        eq_(indexer.docs, 3)
+        eq_(self.bodies(), [
+            [{'index': {'_index': 'idx', '_type': 'things', '_id': 1}},
+             {'id': 1},
+             {'index': {'_index': 'idx', '_type': 'things', '_id': 2}},
+             {'id': 2}],
+            [{'index': {'_index': 'idx', '_type': 'things', '_id': 3}},
+             {'id': 3}]])
+        eq_(len(indexer.latencies), 2)
+
+    def test_all_indices(self):
+        Reindexing.objects.create(alias='idx', old_index='old',
+                                  new_index='new', start_date='2013-01-01')
+        self.indexer().index([1])
+        body = self.bodies()[0]
+        eq_([line['index']['_index'] for line in body[::2]], ['new', 'old'])
+        eq_(body[1], body[3])
+
+    @mock.patch('lib.es.utils.time.sleep')
+    def test_retry_failed(self, sleep):
+        self.es._send_request.side_effect = [
+            {'items': [{'index': {'_index': 'idx', '_id': '2',
+                                  'error': 'nope'}}]},
+            {'items': []}]
+        indexer = self.indexer().index([1, 2])
+        eq_(len(self.bodies()[1]), 2)
+        eq_(self.bodies()[1][0]['index']['_id'], 2)
+        eq_(indexer.failed, [])
+
+    @mock.patch('lib.es.utils.time.sleep')
+    def test_give_up(self, sleep):
+        self.es._send_request.return_value = {
+            'items': [{'index': {'_index': 'idx', '_id': '1',
+                                 'error': 'nope'}}]}
+        indexer = self.indexer(retries=1).index([1])
+        eq_(self.es._send_request.call_count, 2)
+        eq_(indexer.failed, [(1, 'idx')])
+
+    def test_threads(self):
+        indexer = BulkIndexer(self.model, self.search, index='idx',
+                              threads=3)
+        indexer.index(range(10))
+        eq_(indexer.docs, 10)
+        eq_([line['id'] for line in self.bodies()[0][1::2]], range(10))
+
+    @mock.patch('lib.es.utils.connections')
+    def test_threads_close_connections(self, connections):
+        connection = mock.Mock()
+        connections.all.return_value = [connection]
+        BulkIndexer(self.model, self.search, index='idx',
+                    threads=3).index(range(10))
+        # One slice per thread.
+        eq_(connection.close.call_count, 3)
+
+    def test_checkpoint(self):
+        checkpoint = ReindexingCheckpoint.objects.create(
+            index='idx', name='reindex_things', doc_type='things', total=5)
+        self.indexer(chunk_size=2, checkpoint=checkpoint.pk).index([1, 2, 3])
+        checkpoint = ReindexingCheckpoint.objects.get(pk=checkpoint.pk)
+        eq_(checkpoint.docs, 3)
+        eq_(checkpoint.last_id, 3)
+
+    def test_empty_chunk(self):
+        self.model.uncached.filter.side_effect = lambda id__in: []
+        checkpoint = ReindexingCheckpoint.objects.create(
+            index='idx', name='reindex_things', doc_type='things', total=2)
+        for threads in (1, 3):
+            indexer = BulkIndexer(self.model, self.search, index='idx',
+                                  threads=threads, checkpoint=checkpoint.pk)
+            eq_(indexer.index([1, 2]).docs, 0)
+        assert not self.es._send_request.called
+        eq_(ReindexingCheckpoint.objects.get(pk=checkpoint.pk).last_id, 2)
+
+
+class TestReindexObjects(amo.tests.TestCase):
+
+    def setUp(self):
+        self.task = mock.Mock()
+        self.model = mock.Mock()
+        self.model._meta.db_table = 'things'
+        Reindexing.objects.create(alias='idx', old_index='old',
+                                  new_index='new', start_date='2013-01-01')
+
+    def reindex(self, ids, **kw):
+        reindex_objects('reindex_things', self.task, self.model, ids,
+                        index='new', **kw)
+
+    def checkpoint(self):
+        return ReindexingCheckpoint.objects.get(index='new',
+                                                name='reindex_things')
+
+    def test_inline(self):
+        self.reindex([3, 1, 2], inline=True)
+        checkpoint = self.checkpoint()
+        self.task.assert_called_with([1, 2, 3], index='new',
+                                     checkpoint=checkpoint.pk)
+        eq_(checkpoint.doc_type, 'things')
+        eq_(checkpoint.total, 3)
+        eq_(checkpoint.docs, 0)
+        assert checkpoint.resumable
+
+    def test_resume(self):
+        self.reindex([1, 2, 3], inline=True)
+        ReindexingCheckpoint.objects.update(docs=2, last_id=2)
+        self.reindex([1, 2, 3, 4], inline=True)
+        checkpoint = self.checkpoint()
+        self.task.assert_called_with([3, 4], index='new',
+                                     checkpoint=checkpoint.pk)
+        eq_(checkpoint.total, 4)
+        eq_(checkpoint.docs, 2)
+        eq_(checkpoint.start_docs, 2)
+
+    @mock.patch('lib.es.utils.TaskSet')
+    def test_not_resumable(self, TaskSet):
+        self.reindex([1, 2, 3])
+        ReindexingCheckpoint.objects.update(docs=2, last_id=2)
+        self.reindex([1, 2, 3], inline=True)
+        self.task.assert_called_with([1, 2, 3], index='new',
+                                     checkpoint=self.checkpoint().pk)
+        eq_(self.checkpoint().docs, 0)
+
+    @mock.patch('lib.es.utils.TaskSet')
+    def test_celery(self, TaskSet):
+        self.reindex(range(200))
+        eq_([c[1]['args'][0] for c in self.task.subtask.call_args_list],
+            [range(150), range(150, 200)])
+        assert not self.checkpoint().resumable
+        assert TaskSet.return_value.apply_async.called
+
+    def test_not_reindexing(self):
+        reindex_objects('reindex_things', self.task, self.model, [1],
+                        index='idx', inline=True)
+        self.task.assert_called_with([1], index='idx')
+        assert not ReindexingCheckpoint.objects.exists()
+
+
+class TestReindexChanged(amo.tests.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('lib.es.utils.amo.search.get_es')
+        self.es = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.model = mock.Mock()
+        self.model._meta.db_table = 'things'
+
+    def test_unindex(self):
+        unindex_objects([2, 1], self.model, index='idx')
+        body = self.es._send_request.call_args[0][2].splitlines()
+        eq_([json.loads(line) for line in body],
+            [{'delete': {'_index': 'idx', '_type': 'things', '_id': 1}},
+             {'delete': {'_index': 'idx', '_type': 'things', '_id': 2}}])
+
+    @mock.patch('lib.es.utils.reindex_objects')
+    def test_changed(self, reindex_objects):
+        qs = mock.Mock()
+        qs.model = self.model
+        qs.filter.return_value.values_list.return_value = [1, 3]
+        task = mock.Mock()
+        reindex_changed('reindex_things', task, qs, [1, 2, 3], index='idx',
+                        inline=True)
+        qs.filter.assert_called_with(id__in=[1, 2, 3])
+        reindex_objects.assert_called_with('reindex_things', task,
+                                           self.model, set([1, 3]), 'idx',
+                                           True)
+        body = self.es._send_request.call_args[0][2].splitlines()
+        eq_(json.loads(body[0])['delete']['_id'], 2)
+
+
+class TestTranslatedSince(amo.tests.TestCase):
+    fixtures = ['base/addon_3615', 'base/addon_5299_gcal']
+
+    def setUp(self):
+        self.since = datetime.now() - timedelta(hours=1)
+        Translation.objects.update(modified=self.since - timedelta(days=1))
+
+    def test_unchanged(self):
+        eq_(translated_since(Addon.objects.all(), self.since), set())
+
+    def test_changed(self):
+        addon = Addon.objects.get(pk=3615)
+        Translation.objects.filter(id=addon.summary_id).update(
+            modified=datetime.now())
+        eq_(translated_since(Addon.objects.all(), self.since), set([3615]))
+
+    @mock.patch('lib.es.utils.chunked')
+    def test_chunked(self, chunked):
+        chunked.side_effect = lambda seq, n: [[id] for id in seq]
+        ids = Addon.objects.values_list('name_id', flat=True)
+        Translation.objects.filter(id__in=list(ids)).update(
+            modified=datetime.now())
+        eq_(translated_since(Addon.objects.all(), self.since),
+            set([3615, 5299]))
+
+
+class TestCheckCounts(amo.tests.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('lib.es.utils.amo.search.get_es')
+        self.es = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.es._send_request.return_value = {'count': 10}
+        for name, total in (('reindex_addons', 10), ('reindex_apps', 4)):
+            ReindexingCheckpoint.objects.create(
+                index='new', name=name, doc_type='addons', total=total)
+
+    def test_ok(self):
+        eq_(check_counts('new'), [])
+        eq_([c[0][:2] for c in self.es._send_request.call_args_list],
+            [('POST', '/new/_refresh'), ('GET', '/new/addons/_count')])
+
+    def test_missing_docs(self):
+        self.es._send_request.return_value = {'count': 9}
+        eq_(check_counts('new'),
+            ['new has 9 addons documents, expected 10.'])
+
+    def test_no_checkpoints(self):
+        eq_(check_counts('other'), [])
+        assert not self.es._send_request.called
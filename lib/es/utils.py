@@ -1,8 +1,27 @@
+import bisect
+import json
+import logging
 import os
+import time
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
 
-import amo.search
-from .models import Reindexing
+from django.conf import settings
 from django.core.management.base import CommandError
+from django.db import connections
+from django.db.models import F, Q
+
+import pyes.exceptions as pyes
+from celery.task.sets import TaskSet
+from django_statsd.clients import statsd
+
+import amo.search
+from amo.utils import chunked, JSONEncoder
+from translations.models import Translation
+from .models import Reindexing, ReindexingCheckpoint
+
+
+log = logging.getLogger('z.es')
 
 
 def get_indices(index):
@@ -16,26 +35,259 @@ def get_indices(index):
         return [index]
 
 
-def index_objects(ids, model, search, index=None, transforms=None):
-    if index is None:
-        index = model._get_index()
+def index_objects(ids, model, search, index=None, transforms=None,
+                  checkpoint=None):
+    BulkIndexer(model, search, index, transforms,
+                checkpoint=checkpoint).index(ids)
+
+
+def reindex_objects(name, task, model, ids, index=None, inline=False,
+                    chunk_size=150):
+    """
+    Index `ids` with `task`, from this process if `inline` or in chunks
+    through celery otherwise.
+
+    If `index` is being rebuilt by the reindex command, the progress is
+    recorded in a `ReindexingCheckpoint` for `name`. An inline run carries
+    on after the last id a previous inline run got to.
+    """
+    ids = sorted(ids)
+    kw = {'index': index}
+    if index and Reindexing.objects.filter(new_index=index).exists():
+        checkpoint, _ = ReindexingCheckpoint.objects.get_or_create(
+            index=index, name=name,
+            defaults={'doc_type': model._meta.db_table})
+        if inline and checkpoint.resumable and checkpoint.last_id:
+            done = bisect.bisect_right(ids, checkpoint.last_id)
+            log.info('Resuming %s on %s after id %s, %s done already.' %
+                     (name, index, checkpoint.last_id, done))
+            remaining = ids[done:]
+            checkpoint.docs = done
+        else:
+            remaining = ids
+            checkpoint.docs = checkpoint.last_id = 0
+        checkpoint.total = len(ids)
+        checkpoint.resumable = inline
+        checkpoint.started = datetime.now()
+        checkpoint.start_docs = checkpoint.docs
+        checkpoint.save()
+        kw['checkpoint'] = checkpoint.pk
+        ids = remaining
+
+    if inline:
+        if ids:
+            task(ids, **kw)
+        return
+    TaskSet([task.subtask(args=[chunk], kwargs=kw)
+             for chunk in chunked(ids, chunk_size)]).apply_async()
 
-    indices = get_indices(index)
 
-    if transforms is None:
-        transforms = []
+def unindex_objects(ids, model, index=None):
+    """Remove `ids` from all the indices `get_indices` returns, in bulk."""
+    doc_type = model._meta.db_table
+    indices = get_indices(index or model._get_index())
+    es = amo.search.get_es()
+    for chunk in chunked(sorted(ids), settings.ES_BULK_CHUNK_SIZE):
+        body = [json.dumps({'delete': {'_index': idx, '_type': doc_type,
+                                       '_id': id}})
+                for id in chunk for idx in indices]
+        es._send_request('POST', '/_bulk', '\n'.join(body) + '\n')
+    if ids:
+        amo.search.invalidate(index or model._get_index())
+        log.info('Unindexed %s %s docs.' % (len(ids), doc_type))
 
-    qs = model.uncached.filter(id__in=ids)
-    for t in transforms:
-        qs = qs.transform(t)
 
-    for ob in qs:
-        data = search.extract(ob)
+def translated_since(qs, since):
+    """
+    Ids of the objects in `qs` with a translation modified since `since`.
+    The ids of the translations are fetched first, so that the objects are
+    looked up by index and not with a subquery per translated field.
+    """
+    changed = set(Translation.objects.filter(modified__gte=since)
+                  .values_list('id', flat=True))
+    ids = set()
+    for chunk in chunked(sorted(changed), 1000):
+        q = Q()
+        for field in qs.model._meta.translated_fields:
+            q |= Q(**{'%s__in' % field.attname: chunk})
+        ids.update(qs.filter(q).values_list('id', flat=True))
+    return ids
+
+
+def reindex_changed(name, task, qs, changed, index=None, inline=False):
+    """
+    Index the objects of `qs` in the `changed` ids, and unindex the others:
+    they've been deleted or don't belong in the index anymore.
+    """
+    changed = set(changed)
+    ids = set()
+    for chunk in chunked(sorted(changed), 1000):
+        ids.update(qs.filter(id__in=chunk).values_list('id', flat=True))
+    unindex_objects(changed - ids, qs.model, index)
+    reindex_objects(name, task, qs.model, ids, index, inline)
 
-        for index in indices:
-            model.index(data, bulk=True, id=ob.id, index=index)
 
-    amo.search.get_es().flush_bulk(forced=True)
+class BulkIndexer(object):
+    """
+    Index objects in chunks: every chunk is loaded in one query, extracted
+    in a pool of threads and sent in one bulk request to all the indices
+    `get_indices` returns. Each document is serialized once, whatever the
+    number of indices.
+
+    Documents ES fails to index are retried up to `retries` times.
+    Throughput goes to the log, and bulk latencies to statsd. If given the
+    pk of a `ReindexingCheckpoint`, it is moved forward after every chunk.
+    """
+
+    def __init__(self, model, search, index=None, transforms=None,
+                 chunk_size=None, threads=None, retries=None,
+                 checkpoint=None):
+        self.model = model
+        self.search = search
+        self.alias = index or model._get_index()
+        self.indices = get_indices(self.alias)
+        self.transforms = transforms or []
+        self.chunk_size = chunk_size or settings.ES_BULK_CHUNK_SIZE
+        self.threads = threads or settings.ES_BULK_THREADS
+        self.retries = retries if retries is not None else \
+            settings.ES_BULK_RETRIES
+        self.doc_type = model._meta.db_table
+        self.checkpoint = checkpoint
+        self.docs = 0
+        self.failed = []
+        self.latencies = []
+
+    def index(self, ids):
+        start = time.time()
+        pool = ThreadPool(self.threads) if self.threads > 1 else None
+        try:
+            for chunk in chunked(ids, self.chunk_size):
+                self.index_chunk(chunk, pool)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        took = time.time() - start
+        log.info('Indexed %s %s docs in %.2fs (%.0f docs/sec, %s failed), '
+                 'bulk latency: %s.' %
+                 (self.docs, self.doc_type, took,
+                  self.docs / took if took else 0, len(self.failed),
+                  self.histogram()))
+        return self
+
+    def index_chunk(self, ids, pool=None):
+        qs = self.model.uncached.filter(id__in=ids)
+        for t in self.transforms:
+            qs = qs.transform(t)
+        objs = list(qs)
+        if not objs:
+            # They were all deleted or filtered out, nothing to send.
+            if self.checkpoint:
+                self.save_checkpoint(0, max(ids))
+            return
+        if pool:
+            # One slice of the chunk per thread.
+            size = -(-len(objs) // self.threads)
+            slices = [objs[i:i + size] for i in range(0, len(objs), size)]
+            docs = sum(pool.map(self.extract, slices), [])
+        else:
+            docs = map(self.search.extract, objs)
+
+        sources = dict((ob.id, json.dumps(doc, cls=JSONEncoder))
+                       for ob, doc in zip(objs, docs))
+        pending = [(ob.id, index) for ob in objs for index in self.indices]
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(2 ** (attempt - 1) * .1)
+            pending = self.send(pending, sources)
+            if not pending:
+                break
+        else:
+            log.error('Failed to index %s docs: %s' %
+                      (self.doc_type, pending))
+            self.failed.extend(pending)
+        self.docs += len(objs)
+        amo.search.invalidate(self.alias)
+        if self.checkpoint:
+            self.save_checkpoint(len(objs), max(ids))
+
+    def extract(self, objs):
+        """Extract `objs` in a pool thread, which closes the database
+        connections it opened when it's done."""
+        try:
+            return map(self.search.extract, objs)
+        finally:
+            for connection in connections.all():
+                connection.close()
+
+    def save_checkpoint(self, docs, last_id):
+        qs = ReindexingCheckpoint.objects.filter(pk=self.checkpoint)
+        qs.update(docs=F('docs') + docs, last_id=last_id,
+                  modified=datetime.now())
+        for checkpoint in qs:
+            log.info(checkpoint.progress())
+
+    def send(self, pending, sources):
+        """Send one bulk request, return the (id, index) that failed."""
+        body = []
+        for id, index in pending:
+            body.append(json.dumps({'index': {'_index': index,
+                                              '_type': self.doc_type,
+                                              '_id': id}}))
+            body.append(sources[id])
+        start = time.time()
+        try:
+            res = amo.search.get_es()._send_request(
+                'POST', '/_bulk', '\n'.join(body) + '\n')
+        except pyes.ElasticSearchException:
+            log.warning('Bulk request failed.', exc_info=True)
+            return pending
+        finally:
+            took = (time.time() - start) * 1000
+            self.latencies.append(took)
+            statsd.timing('es.bulk.%s' % self.doc_type, took)
+        failed = []
+        for item in res.get('items', []):
+            item = item.get('index', item.get('create', {}))
+            if 'error' in item:
+                failed.append((int(item['_id']), item['_index']))
+        return failed
+
+    def histogram(self, buckets=(10, 50, 100, 500, 1000, 5000)):
+        """Count of bulk requests per latency bucket, in ms."""
+        counts = [0] * (len(buckets) + 1)
+        for latency in self.latencies:
+            counts[len([b for b in buckets if latency > b])] += 1
+        labels = ['<%s' % b for b in buckets] + ['>%s' % buckets[-1]]
+        return ', '.join('%s: %s' % (label, count)
+                         for label, count in zip(labels, counts) if count)
+
+
+def check_counts(index):
+    """
+    Compare the number of documents in `index` with what the indexers found
+    in the database, return a list of error messages.
+
+    The add-ons and apps indexers overlap, so each doc type has to have at
+    least as many documents as the biggest of its indexers.
+    """
+    expected = {}
+    for checkpoint in ReindexingCheckpoint.objects.filter(index=index):
+        expected[checkpoint.doc_type] = max(
+            checkpoint.total, expected.get(checkpoint.doc_type, 0))
+    if not expected:
+        return []
+
+    es = amo.search.get_es()
+    es._send_request('POST', '/%s/_refresh' % index)
+    errors = []
+    for doc_type, total in sorted(expected.items()):
+        count = es._send_request('GET', '/%s/%s/_count' %
+                                 (index, doc_type))['count']
+        if count < total:
+            errors.append('%s has %s %s documents, expected %s.' %
+                          (index, count, doc_type, total))
+    return errors
 
 
 def database_flagged():
@@ -4,6 +4,9 @@ items.
 
 Check the function docs, they expect specific preconditions.
 """
+import heapq
+import multiprocessing
+import operator
 
 # Placeholders for the fast functions implemented in C.
 
@@ -20,3 +23,81 @@ try:
     from _recommend import symmetric_diff_count, similarity
 except ImportError:
     pass
+
+
+def _index(items):
+    # {collection: [item]}, the inverse of `items`.
+    index = {}
+    for item, xs in items.iteritems():
+        for x in xs:
+            index.setdefault(x, []).append(item)
+    return index
+
+
+# Set up in the parent before forking so the workers share it.
+_state = {}
+
+
+def _top_similar(chunk):
+    items, index = _state['items'], _state['index']
+    by_size, n = _state['by_size'], _state['n']
+    rv = []
+    for item in chunk:
+        xs = items[item]
+        overlap = {}
+        get = overlap.get  # Locals are faster.
+        for x in xs:
+            for other in index[x]:
+                overlap[other] = get(other, 0) + 1
+        overlap.pop(item, None)
+        size = len(xs)
+        # symmetric_diff_count is |xs| + |ys| - 2 * |xs & ys|.
+        scores = [(other, 1. / (1. + size + len(items[other]) - 2 * count))
+                  for other, count in overlap.iteritems()]
+        # Items without anything in common still have a similarity, it's
+        # highest for the smallest ones. Consider enough of them to fill
+        # up the top n, like the full comparison would.
+        extra = 0
+        for other_size, other in by_size:
+            if extra == n:
+                break
+            if other != item and other not in overlap:
+                scores.append((other, 1. / (1. + size + other_size)))
+                extra += 1
+        rv.append((item, heapq.nlargest(n, scores,
+                                        key=operator.itemgetter(1))))
+    return rv
+
+
+def top_similar(items, n=10, processes=1, chunk_size=1000):
+    """
+    Yield (item, [(other, similarity), ...]) with the `n` most similar
+    other items for every item in `items`, a dict of {item: [collection]}.
+
+    This gives the same similarities as comparing every pair with
+    `similarity` but only scores pairs that share a collection, through an
+    index of {collection: [item]}. Collections have to be unique per item.
+
+    With `processes` > 1 the items are split into chunks of `chunk_size`
+    and scored in a pool of forked workers.
+    """
+    _state.update(items=items, index=_index(items), n=n,
+                  by_size=sorted((len(xs), item)
+                                 for item, xs in items.iteritems()))
+    keys = sorted(items)
+    chunks = [keys[i:i + chunk_size] for i in xrange(0, len(keys), chunk_size)]
+    try:
+        if processes > 1:
+            pool = multiprocessing.Pool(processes)
+            try:
+                for rv in pool.imap_unordered(_top_similar, chunks):
+                    for result in rv:
+                        yield result
+            finally:
+                pool.terminate()
+        else:
+            for chunk in chunks:
+                for result in _top_similar(chunk):
+                    yield result
+    finally:
+        _state.clear()
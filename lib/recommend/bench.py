@@ -0,0 +1,97 @@
+"""
+Benchmark `top_similar` on a synthetic catalogue, by default 100k add-ons
+and 1M add-on/collection memberships like the `recs` cron sees.
+
+    python lib/recommend/bench.py --addons=100000 --memberships=1000000
+
+Comparing every pair takes far too long at that size, so the pairwise
+comparison the cron used to do is timed on a sample of add-ons and
+extrapolated, and its results on that sample are checked against
+`top_similar`.
+"""
+from array import array
+import operator
+import optparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import recommend
+
+
+def synthetic(addons, memberships, collections):
+    # Collection popularity is skewed, a few collections hold a thousand or
+    # so add-ons and most hold a handful.
+    weights = [(i + 1) ** -.5 for i in xrange(collections)]
+    total = sum(weights)
+    cumulative, acc = [], 0
+    for w in weights:
+        acc += w / total
+        cumulative.append(acc)
+
+    def pick():
+        r, lo, hi = random.random(), 0, collections - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if cumulative[mid] < r:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    per_addon = memberships // addons
+    items = {}
+    for addon in xrange(addons):
+        size = max(4, int(random.expovariate(1. / per_addon)))
+        cs = set()
+        while len(cs) < size:
+            cs.add(pick())
+        items[addon] = array('l', sorted(cs))
+    return items
+
+
+def pairwise(items, addon, n):
+    sim, xs = recommend.similarity, items[addon]
+    sims = [(other, sim(xs, ys)) for other, ys in items.iteritems()]
+    others = sorted(sims, key=operator.itemgetter(1), reverse=True)
+    return [(k, v) for k, v in others[:n + 1] if k != addon][:n]
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--addons', type='int', default=100000)
+    parser.add_option('--memberships', type='int', default=1000000)
+    parser.add_option('--collections', type='int', default=200000)
+    parser.add_option('--processes', type='int', default=4)
+    parser.add_option('--sample', type='int', default=20)
+    opts, args = parser.parse_args()
+
+    random.seed(0)
+    start = time.time()
+    items = synthetic(opts.addons, opts.memberships, opts.collections)
+    print '%s add-ons, %s memberships generated in %.2fs' % (
+        len(items), sum(len(xs) for xs in items.itervalues()),
+        time.time() - start)
+
+    for processes in sorted(set([1, opts.processes])):
+        start = time.time()
+        results = dict(recommend.top_similar(items, 10, processes=processes))
+        print 'top_similar, %s processes: %.2fs' % (processes,
+                                                    time.time() - start)
+
+    sample = random.sample(items.keys(), opts.sample)
+    start = time.time()
+    for addon in sample:
+        expected = pairwise(items, addon, 10)
+        got = results[addon]
+        assert [s for _, s in expected] == [s for _, s in got], addon
+    took = time.time() - start
+    print 'pairwise: %.2fs for %s add-ons, ~%.0fs for all of them' % (
+        took, len(sample), took / len(sample) * len(items))
+
+
+if __name__ == '__main__':
+    main()
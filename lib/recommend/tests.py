@@ -1,4 +1,5 @@
 from array import array
+import random
 from nose.tools import eq_
 
 import recommend
@@ -31,3 +32,41 @@ def test_symmetric_diff_count():
 # The algorithm is in flux so this is minimal coverage.
 def test_similarity():
     eq_(1/2., recommend.similarity([1], [1, 2]))
+
+
+def brute_force(items, n):
+    rv = {}
+    for item, xs in items.items():
+        sims = sorted((recommend.similarity(xs, ys), other)
+                      for other, ys in items.items() if other != item)
+        rv[item] = [s for s, _ in reversed(sims)][:n]
+    return rv
+
+
+def check_top_similar(processes):
+    random.seed(42)
+    items = dict((i, array('l', sorted(random.sample(xrange(100),
+                                                     random.randint(4, 10)))))
+                 for i in range(200))
+    expected = brute_force(items, 10)
+    rv = dict(recommend.top_similar(items, 10, processes=processes,
+                                    chunk_size=30))
+    eq_(sorted(rv), sorted(items))
+    for item, others in rv.items():
+        assert item not in [other for other, _ in others]
+        eq_([score for _, score in others], expected[item])
+
+
+def test_top_similar():
+    check_top_similar(1)
+
+
+def test_top_similar_pool():
+    check_top_similar(2)
+
+
+def test_top_similar_nothing_in_common():
+    items = {1: [1, 2], 2: [3], 3: [4, 5, 6], 4: [1]}
+    rv = dict(recommend.top_similar(items, 2))
+    eq_(rv[2], [(4, 1 / 3.), (1, 1 / 4.)])
+    eq_(rv[1], [(4, 1 / 2.), (2, 1 / 4.)])
@@ -102,6 +102,18 @@ SERVICES_DATABASE = {
     'PASSWORD': '',
     'HOST': '',
 }
+# The connection pool all the services share when they run in one process,
+# see services/host.py, and the most connections each of them can hold.
+SERVICES_DATABASE_POOL = {
+    'max_overflow': 10,
+    'pool_size': 5,
+    'recycle': 300
+}
+SERVICES_DATABASE_LIMITS = {
+    'update': 10,
+    'verify': 5,
+    'theme_update': 5,
+}
 
 DATABASE_ROUTERS = ('multidb.PinningMasterSlaveRouter',)
 
@@ -112,6 +124,33 @@ DATABASE_POOL_ARGS = {
     'recycle': 300
 }
 
+# Path to the compiled snapshot services/update.py answers update pings
+# from, rebuilt by the `build_update_index` cron. If this is unset, or the
+# file doesn't exist yet, update pings are answered from SERVICES_DATABASE.
+SERVICES_UPDATE_INDEX = None
+# Seconds between checks for a newer snapshot.
+SERVICES_UPDATE_INDEX_CHECK = 30
+# Number of rendered update responses each services/update.py process keeps
+# in memory, 0 turns the cache off. Entries expire after the timeout (in
+# seconds) and whenever an add-on, version or file changes, which is checked
+# every SERVICES_UPDATE_CACHE_CHECK seconds.
+SERVICES_UPDATE_CACHE_SIZE = 0
+SERVICES_UPDATE_CACHE_TIMEOUT = 60
+SERVICES_UPDATE_CACHE_CHECK = 5
+# Seconds services/verify.py caches decoded receipts and the install and
+# purchase rows they are checked against, 0 turns the cache off. Refunds,
+# chargebacks and changes to installs or purchases invalidate it.
+SERVICES_VERIFY_CACHE_TIMEOUT = 60
+# Most receipts services/verify.py accepts in one batch verification.
+SERVICES_VERIFY_BATCH_SIZE = 100
+# Seconds the documents services/theme_update.py serves are kept, they are
+# rebuilt whenever a theme changes. 0 turns them off and every request is
+# answered from the database.
+SERVICES_THEME_UPDATE_TIMEOUT = 60 * 60 * 24 * 7
+# Number of rendered plugin finder responses each services/pfs.py process
+# keeps in memory, 0 turns the cache off.
+SERVICES_PFS_CACHE_SIZE = 1000
+
 # Put the aliases for your slave databases in this list.
 SLAVE_DATABASES = []
 
@@ -268,6 +307,8 @@ MIRROR_STAGE_PATH = NETAPP_STORAGE + '/public-staging'
 
 # Where dumped apps will be written too.
 DUMPED_APPS_PATH = NETAPP_STORAGE + '/dumped-apps'
+# Processes dehydrating apps for `dump_apps_tarball`.
+DUMPED_APPS_PROCESSES = 4
 
 # paths that don't require an app prefix
 SUPPORTED_NONAPPS = ('about', 'admin', 'apps', 'blocklist', 'credits',
@@ -923,6 +964,17 @@ FETCH_BY_ID = True
 # it's not possible to invalidate these queries.
 CACHE_COUNT_TIMEOUT = 60
 
+# Number of seconds translations attached by translations.transformer are
+# cached, by id and locale. They're invalidated when saved. 0 disables it.
+TRANSLATION_CACHE_TIMEOUT = 60 * 60
+# Number of seconds changed translations are read from the master and not
+# cached, while the slaves catch up.
+TRANSLATION_MASTER_TIMEOUT = 60
+
+# Number of seconds the ids of the apps excluded from each region are cached.
+# Changes to exclusions and content flags invalidate them. 0 disables it.
+EXCLUDED_REGIONS_CACHE_TIMEOUT = 60 * 60
+
 # To enable pylibmc compression (in bytes)
 PYLIBMC_MIN_COMPRESS_LEN = 0  # disabled
 
@@ -1342,6 +1394,17 @@ FILE_VIEWER_SIZE_LIMIT = 1048576
 # The maximum file size that you can have inside a zip file.
 FILE_UNZIP_SIZE_LIMIT = 104857600
 
+# Archives are extracted once per content into this directory, and the trees
+# used least recently are removed when it holds more than
+# EXTRACTION_CACHE_SIZE bytes. The locks are flock()s, keep it off NFS.
+EXTRACTION_CACHE_PATH = os.path.join(TMP_PATH, 'extracted')
+EXTRACTION_CACHE_SIZE = 5 * 1024 * 1024 * 1024
+# Trees used in the last EXTRACTION_CACHE_GRACE seconds are never evicted.
+EXTRACTION_CACHE_GRACE = 60 * 10
+# The entries of the archives the file viewer reads in place, see
+# files.utils.ArchiveIndex.
+ARCHIVE_INDEX_PATH = os.path.join(TMP_PATH, 'archive-index')
+
 # How long to delay tasks relying on file system to cope with NFS lag.
 NFS_LAG_DELAY = 3
 
@@ -1374,6 +1437,22 @@ ES_INDEXES = {'default': 'addons',
               'stats_collections_counts': 'addons_stats',
               'users_install': 'addons_stats'}
 ES_TIMEOUT = 30
+# lib.es.utils.BulkIndexer: objects loaded and sent per bulk request, threads
+# extracting documents and retries of documents ES failed to index.
+ES_BULK_CHUNK_SIZE = 150
+ES_BULK_THREADS = 4
+ES_BULK_RETRIES = 2
+# mkt.webapps.tasks.update_manifests: threads fetching manifests, requests
+# to the same host at once, and times a failed fetch is tried again right
+# away before the app is retried in a later task.
+MANIFEST_FETCH_THREADS = 8
+MANIFEST_FETCH_PER_HOST = 2
+MANIFEST_FETCH_RETRIES = 2
+# Default timeout of amo.search.ES.cache(), in seconds.
+ES_CACHE_TIMEOUT = 60
+# Seconds it takes ES to make what was indexed searchable: searches aren't
+# cached for that long after an index changed, see amo.search.invalidate().
+ES_REFRESH_INTERVAL = 5
 
 # Default AMO user id to use for tasks.
 TASK_USER_ID = 4757633
@@ -1574,3 +1653,22 @@ APP_FEATURES_VERSION = 1
 
 # Whether to throttle API requests. Default is True. Disable where appropriate.
 API_THROTTLE = True
+
+# Where the API throttle counts the requests: 'redis', in
+# REDIS_BACKENDS['master'], or 'cache'.
+API_THROTTLE_BACKEND = 'redis'
+
+# Limits of the API throttle by resource name, as (requests, seconds). They
+# replace the limits the throttles of the resources were given, e.g.
+# {'app': (10, 60 * 60 * 24)}.
+API_THROTTLE_RATES = {}
+
+# Where the nonces of signed API requests are recorded, to refuse replays:
+# 'redis' keeps them in REDIS_BACKENDS['master'] until their timestamp
+# expires, 'db' in the oauth_nonce table. Redis falls back to the table when
+# it can't be reached.
+OAUTH_NONCE_BACKEND = 'redis'
+
+# Number of seconds OAuth consumer secrets and access tokens are cached.
+# They're invalidated when saved or deleted. 0 disables it.
+OAUTH_CACHE_TIMEOUT = 60 * 60
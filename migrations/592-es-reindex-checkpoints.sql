@@ -0,0 +1,15 @@
+CREATE TABLE `zadmin_reindexing_checkpoint` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `index` varchar(255) NOT NULL,
+  `name` varchar(255) NOT NULL,
+  `doc_type` varchar(255) NOT NULL,
+  `total` int(11) unsigned NOT NULL DEFAULT 0,
+  `docs` int(11) unsigned NOT NULL DEFAULT 0,
+  `last_id` int(11) unsigned NOT NULL DEFAULT 0,
+  `resumable` bool NOT NULL DEFAULT 0,
+  `started` datetime NOT NULL,
+  `start_docs` int(11) unsigned NOT NULL DEFAULT 0,
+  `modified` datetime NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY (`index`, `name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
@@ -0,0 +1,4 @@
+-- For the incremental reindexation, `reindex --since`.
+CREATE INDEX modified_idx ON versions (modified);
+CREATE INDEX modified_idx ON files (modified);
+CREATE INDEX modified_idx ON translations (modified);
@@ -0,0 +1,2 @@
+INSERT INTO waffle_switch_mkt (name, active, created, modified, note)
+       VALUES ('search-region-exclusions', 0, NOW(), NOW(), 'Filters apps out of regions with the region_exclusions field of the mkt index');
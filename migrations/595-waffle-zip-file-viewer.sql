@@ -0,0 +1,4 @@
+INSERT INTO waffle_switch_amo (name, active, created, modified, note)
+       VALUES ('zip-file-viewer', 0, NOW(), NOW(), 'Lists and reads the files of add-ons from their archive instead of extracting them');
+INSERT INTO waffle_switch_mkt (name, active, created, modified, note)
+       VALUES ('zip-file-viewer', 0, NOW(), NOW(), 'Lists and reads the files of apps from their archive instead of extracting them');
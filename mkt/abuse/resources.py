@@ -1,6 +1,5 @@
 from tastypie import fields
 from tastypie.authorization import Authorization
-from tastypie.throttle import CacheThrottle
 
 from abuse.models import AbuseReport
 from mkt.account.api import AccountResource
@@ -9,6 +8,7 @@ from mkt.api.base import (CORSResource, GenericObject, MarketplaceResource,
                           PotatoCaptchaResource)
 from mkt.api.forms import RequestFormValidation
 from mkt.api.resources import AppResource
+from mkt.api.throttle import SlidingWindowThrottle
 
 from .forms import AppAbuseForm, UserAbuseForm
 
@@ -35,7 +35,7 @@ class BaseAbuseResource(PotatoCaptchaResource, CORSResource,
         rename_field_map = [
             ('text', 'message'),
         ]
-        throttle = CacheThrottle(throttle_at=30)
+        throttle = SlidingWindowThrottle(throttle_at=30)
 
     def obj_create(self, bundle, request=None, **kwargs):
         bundle.obj = self._meta.object_class(**kwargs)
@@ -12,7 +12,6 @@ from tastypie import fields, http
 from tastypie.authorization import Authorization
 from tastypie.bundle import Bundle
 from tastypie.exceptions import ImmediateHttpResponse
-from tastypie.throttle import CacheThrottle
 from tastypie.validation import CleanedDataFormValidation
 
 from access import acl
@@ -25,6 +24,7 @@ from mkt.api.base import (CORSResource, GenericObject,
                           MarketplaceModelResource, MarketplaceResource,
                           PotatoCaptchaResource)
 from mkt.api.resources import AppResource
+from mkt.api.throttle import SlidingWindowThrottle
 from mkt.constants.apps import INSTALL_TYPE_USER
 from mkt.webapps.models import Webapp
 from users.models import UserProfile
@@ -172,7 +172,7 @@ class FeedbackResource(PotatoCaptchaResource, CORSResource,
         authorization = Authorization()
         object_class = GenericObject
         include_resource_uri = False
-        throttle = CacheThrottle(throttle_at=30)
+        throttle = SlidingWindowThrottle(throttle_at=30)
 
     def _send_email(self, bundle):
         """
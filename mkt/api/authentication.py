@@ -12,7 +12,7 @@ from tastypie.authentication import Authentication
 from access.middleware import ACLMiddleware
 from mkt.api.middleware import APIPinningMiddleware
 
-from mkt.api.models import Access, Token, ACCESS_TOKEN
+from mkt.api.models import get_access, get_access_token
 from mkt.api.oauth import OAuthServer
 
 log = commonware.log.getLogger('z.api')
@@ -72,8 +72,9 @@ class OAuthAuthentication(Authentication):
                 log.error(u'Cannot find APIAccess token with that key: %s'
                           % oauth.attempted_key)
                 return self._error('headers')
-            request.user = Token.objects.get(token_type=ACCESS_TOKEN,
-                key=oauth_request.resource_owner_key).user
+            secret, user_id = get_access_token(
+                oauth_request.client_key, oauth_request.resource_owner_key)
+            request.user = User.objects.get(pk=user_id)
 
         else:
             # This is 2-legged OAuth.
@@ -90,8 +91,8 @@ class OAuthAuthentication(Authentication):
                 log.error(u'Cannot find APIAccess token with that key: %s'
                           % oauth.attempted_key)
                 return self._error('headers')
-            request.user = Access.objects.get(
-                key=oauth_request.client_key).user
+            secret, user_id = get_access(oauth_request.client_key)
+            request.user = User.objects.get(pk=user_id)
 
         ACLMiddleware().process_request(request)
         # We've just become authenticated, time to run the pinning middleware
@@ -183,6 +183,19 @@ class Marketplace(object):
 
         raise ImmediateHttpResponse(response=http.HttpUnauthorized())
 
+    def throttle_identifiers(self, request):
+        """
+        The identifiers the auth backends give the request, each once.
+        """
+        if not hasattr(request, '_throttle_identifiers'):
+            request._throttle_identifiers = sorted(set(
+                a.get_identifier(request) for a in self._auths()))
+        return request._throttle_identifiers
+
+    def throttle_counts(self, request):
+        """Whether the request counts against the throttle limits."""
+        return True
+
     def throttle_check(self, request):
         """
         Handles checking if the user should be throttled.
@@ -193,11 +206,12 @@ class Marketplace(object):
         # Never throttle users with Apps:APIUnthrottled.
         if (settings.API_THROTTLE and
             not acl.action_allowed(request, 'Apps', 'APIUnthrottled')):
-            identifiers = [a.get_identifier(request) for a in self._auths()]
-
             # Check to see if they should be throttled.
-            if any(self._meta.throttle.should_be_throttled(identifier)
-                   for identifier in identifiers):
+            count = self.throttle_counts(request)
+            if any(self._meta.throttle.should_be_throttled(
+                       identifier, scope=self._meta.resource_name,
+                       count=count)
+                   for identifier in self.throttle_identifiers(request)):
                 # Throttle limit exceeded.
                 raise ImmediateHttpResponse(response=HttpTooManyRequests())
 
@@ -208,9 +222,10 @@ class Marketplace(object):
         Mostly a hook, this uses class assigned to ``throttle`` from
         ``Resource._meta``.
         """
+        if not self.throttle_counts(request):
+            return
         request_method = request.method.lower()
-        identifiers = [a.get_identifier(request) for a in self._auths()]
-        for identifier in identifiers:
+        for identifier in self.throttle_identifiers(request):
             self._meta.throttle.accessed(identifier,
                                          url=request.get_full_path(),
                                          request_method=request_method)
@@ -0,0 +1,102 @@
+import time
+import uuid
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from oauthlib import oauth1
+from test_utils import RequestFactory
+
+from amo.urlresolvers import reverse
+from mkt.api.authentication import OAuthAuthentication
+from mkt.api.models import (Access, invalidate_access, invalidate_token,
+                            Nonce, Token, ACCESS_TOKEN)
+
+
+class Command(BaseCommand):
+    """
+    Compare the authenticated API requests/sec with the nonces recorded in
+    the database and in redis, with and without the consumer secrets and
+    access tokens cached.
+
+    The requests are signed by the consumer with `--key`, and with its access
+    token `--token` for 3-legged OAuth, before they are timed. Their nonces
+    are removed from the database once done.
+    """
+    help = 'Benchmark OAuth authentication of API requests.'
+    option_list = BaseCommand.option_list + (
+        make_option('--key', action='store', type='string', dest='key',
+                    help='Key of the consumer signing the requests.'),
+        make_option('--token', action='store', type='string', dest='token',
+                    help='Key of an access token of that consumer.'),
+        make_option('--requests', action='store', type='int',
+                    dest='requests', default=500,
+                    help='Number of requests per mode.'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            access = Access.objects.get(key=options['key'])
+        except Access.DoesNotExist:
+            raise CommandError('No consumer with the key %s.' %
+                               options['key'])
+        kw = {'client_key': access.key, 'client_secret': access.secret}
+        token = None
+        if options['token']:
+            try:
+                token = Token.objects.get(key=options['token'], creds=access,
+                                          token_type=ACCESS_TOKEN)
+            except Token.DoesNotExist:
+                raise CommandError('No access token with the key %s.' %
+                                   options['token'])
+            kw.update(resource_owner_key=token.key,
+                      resource_owner_secret=token.secret)
+        url = settings.SITE_URL + reverse(
+            'api_dispatch_list',
+            kwargs={'resource_name': 'app', 'api_name': 'apps'})
+        host = url.split('/')[2]
+        requests = options['requests']
+
+        connection.use_debug_cursor = True
+        backend = settings.OAUTH_NONCE_BACKEND
+        original = settings.OAUTH_CACHE_TIMEOUT
+        timeout = original or 60
+        try:
+            for nonces in ('db', 'redis'):
+                for mode, mode_timeout in (('database', 0),
+                                           ('cache', timeout)):
+                    settings.OAUTH_NONCE_BACKEND = nonces
+                    settings.OAUTH_CACHE_TIMEOUT = mode_timeout
+                    invalidate_access(Access, access)
+                    if token:
+                        invalidate_token(Token, token)
+                    signed = []
+                    for i in xrange(requests + 1):
+                        client = oauth1.Client(
+                            nonce='bench%s' % uuid.uuid4().hex, **kw)
+                        signed.append(RequestFactory().get(
+                            url, HTTP_HOST=host, HTTP_AUTHORIZATION=client
+                            .sign(url)[1]['Authorization']))
+                    auth = OAuthAuthentication()
+                    # Warms the cache up.
+                    if auth.is_authenticated(signed.pop()) is not True:
+                        raise CommandError('The requests were refused.')
+                    before = len(connection.queries)
+                    start = time.time()
+                    for request in signed:
+                        auth.is_authenticated(request)
+                    took = time.time() - start
+                    self.stdout.write(
+                        'nonces in %s, credentials from %s: %.1f queries '
+                        'per request, %.0f requests/sec\n' %
+                        (nonces, mode,
+                         float(len(connection.queries) - before) / requests,
+                         requests / took))
+        finally:
+            settings.OAUTH_NONCE_BACKEND = backend
+            settings.OAUTH_CACHE_TIMEOUT = original
+            connection.use_debug_cursor = None
+            Nonce.objects.filter(client_key=access.key,
+                                 nonce__startswith='bench').delete()
@@ -1,8 +1,13 @@
+import hashlib
 import os
 import time
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.db.models import signals as dbsignals
 
+import amo
 from amo.models import ModelBase
 
 
@@ -61,3 +66,71 @@ class Nonce(ModelBase):
 
 def generate():
     return os.urandom(64).encode('hex')
+
+
+def _cached(key, lookup):
+    timeout = settings.OAUTH_CACHE_TIMEOUT
+    if not timeout:
+        return lookup()
+    value = cache.get(key)
+    if value is None:
+        value = lookup()
+        cache.set(key, value, timeout)
+    return value
+
+
+def _hash(key):
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def get_access(key):
+    """
+    Return the `(secret, user id)` of the consumer with that key, or an empty
+    tuple if there's none.
+
+    Unknown keys are cached like the others, so that failures take as many
+    lookups as successes.
+    """
+    def lookup():
+        rows = list(Access.objects.no_cache().filter(key=key)
+                    .values_list('secret', 'user'))
+        return rows[0] if rows else ()
+    return _cached(amo.OAUTH_ACCESS_KEY % _hash(key), lookup)
+
+
+def get_access_token(client_key, key):
+    """
+    Return the `(secret, user id)` of the access token with that key, given
+    to the consumer with that client key, or an empty tuple if there's none.
+    """
+    def lookup():
+        rows = list(Token.objects.no_cache()
+                    .filter(key=key, token_type=ACCESS_TOKEN)
+                    .values_list('creds__key', 'secret', 'user'))
+        return rows[0] if rows else ()
+    token = _cached(amo.OAUTH_TOKEN_KEY % _hash(key), lookup)
+    # Tokens are cached by their key alone, so that they can be invalidated
+    # without looking their consumer up.
+    if token and token[0] == client_key:
+        return token[1:]
+    return ()
+
+
+def invalidate_access(sender, instance, **kw):
+    if not kw.get('raw'):
+        cache.delete(amo.OAUTH_ACCESS_KEY % _hash(instance.key))
+
+
+def invalidate_token(sender, instance, **kw):
+    if not kw.get('raw'):
+        cache.delete(amo.OAUTH_TOKEN_KEY % _hash(instance.key))
+
+
+for _sender, _receiver in ((Access, invalidate_access),
+                           (Token, invalidate_token)):
+    dbsignals.post_save.connect(_receiver, sender=_sender,
+                                dispatch_uid='oauth_%s' %
+                                _sender._meta.db_table)
+    dbsignals.post_delete.connect(_receiver, sender=_sender,
+                                  dispatch_uid='oauth_%s' %
+                                  _sender._meta.db_table)
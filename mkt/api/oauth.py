@@ -1,17 +1,24 @@
+import hashlib
 import string
+import time
 from urllib import urlencode
 
+from django.conf import settings
 from django.http import HttpResponse, HttpResponseRedirect
 from django.views.decorators.csrf import csrf_view_exempt
 
 import commonware.log
 import jingo
+import redisutils
 from oauthlib import oauth1
 from oauthlib.common import safe_string_equals
+from redis.exceptions import RedisError
 
+import amo
 from amo.decorators import login_required
 from amo.utils import urlparams
-from mkt.api.models import Access, Nonce, Token, REQUEST_TOKEN, ACCESS_TOKEN
+from mkt.api.models import (Access, get_access, get_access_token, Nonce,
+                            Token, REQUEST_TOKEN, ACCESS_TOKEN)
 
 DUMMY_CLIENT_KEY = u'DummyOAuthClientKeyString'
 DUMMY_TOKEN = u'DummyOAuthToken'
@@ -20,6 +27,58 @@ DUMMY_SECRET = u'DummyOAuthSecret'
 log = commonware.log.getLogger('z.api')
 
 
+class DatabaseNonceStore(object):
+    """Records the nonces in the oauth_nonce table, which never shrinks."""
+
+    def add(self, client_key, timestamp, nonce, request_token=None,
+            access_token=None):
+        """Return whether that nonce was never used before."""
+        n, created = Nonce.objects.safer_get_or_create(
+            defaults={'client_key': client_key},
+            nonce=nonce, timestamp=timestamp,
+            request_token=request_token,
+            access_token=access_token)
+        return created
+
+
+class RedisNonceStore(DatabaseNonceStore):
+    """
+    Records the nonces in redis, with SETNX, until their timestamp is too old
+    to be accepted anyway. When redis can't be reached they are recorded in
+    the database instead.
+    """
+
+    def __init__(self, lifetime):
+        self.lifetime = lifetime
+
+    def add(self, client_key, timestamp, nonce, request_token=None,
+            access_token=None):
+        parts = (client_key, timestamp, nonce, request_token or '',
+                 access_token or '')
+        key = amo.OAUTH_NONCE_KEY % hashlib.md5(
+            u'\n'.join(map(unicode, parts)).encode('utf-8')).hexdigest()
+        # Requests are accepted until `lifetime` seconds after their
+        # timestamp, which can be in the future.
+        ttl = max(int(timestamp) + self.lifetime - int(time.time()), 1)
+        try:
+            redis = redisutils.connections['master']
+            created, expires = (redis.pipeline().setnx(key, 1)
+                                .expire(key, ttl).execute())
+        except RedisError:
+            log.error('Could not record the OAuth nonce in redis',
+                      exc_info=True)
+            return super(RedisNonceStore, self).add(
+                client_key, timestamp, nonce, request_token=request_token,
+                access_token=access_token)
+        return bool(created)
+
+
+def get_nonce_store(lifetime):
+    if settings.OAUTH_NONCE_BACKEND == 'redis':
+        return RedisNonceStore(lifetime)
+    return DatabaseNonceStore()
+
+
 class OAuthServer(oauth1.Server):
     safe_characters = set(string.printable)
     nonce_length = (7, 128)
@@ -31,16 +90,14 @@ class OAuthServer(oauth1.Server):
 
     def validate_client_key(self, key):
         self.attempted_key = key
-        return Access.objects.filter(key=key).exists()
+        return bool(get_access(key))
 
     def get_client_secret(self, key):
         # This method returns a dummy secret on failure so that auth
         # success and failure take a codepath with the same run time,
         # to prevent timing attacks.
-        try:
-            return Access.objects.get(key=key).secret
-        except Access.DoesNotExist:
-            return DUMMY_SECRET
+        access = get_access(key)
+        return access[0] if access else DUMMY_SECRET
 
     @property
     def dummy_client(self):
@@ -56,12 +113,9 @@ class OAuthServer(oauth1.Server):
 
     def validate_timestamp_and_nonce(self, client_key, timestamp, nonce,
                                      request_token=None, access_token=None):
-        n, created = Nonce.objects.safer_get_or_create(
-            defaults={'client_key': client_key},
-            nonce=nonce, timestamp=timestamp,
-            request_token=request_token,
+        return get_nonce_store(self.timestamp_lifetime).add(
+            client_key, timestamp, nonce, request_token=request_token,
             access_token=access_token)
-        return created
 
     def validate_requested_realm(self, client_key, realm):
         return True
@@ -83,9 +137,7 @@ class OAuthServer(oauth1.Server):
     def validate_access_token(self, client_key, access_token):
         # This method must take the same amount of time/db lookups for
         # success and failure to prevent timing attacks.
-        return Token.objects.filter(token_type=ACCESS_TOKEN,
-                                    creds__key=client_key,
-                                    key=access_token).exists()
+        return bool(get_access_token(client_key, access_token))
 
     def validate_verifier(self, client_key, request_token, verifier):
         # This method must take the same amount of time/db lookups for
@@ -110,13 +162,8 @@ class OAuthServer(oauth1.Server):
     def get_access_token_secret(self, client_key, request_token):
         # This method must take the same amount of time/db lookups for
         # success and failure to prevent timing attacks.
-        try:
-            t = Token.objects.get(key=request_token, creds__key=client_key,
-                                  token_type=ACCESS_TOKEN)
-        except Token.DoesNotExist:
-            return DUMMY_SECRET
-
-        return t.secret
+        token = get_access_token(client_key, request_token)
+        return token[0] if token else DUMMY_SECRET
 
 
 @csrf_view_exempt
@@ -13,7 +13,6 @@ from tastypie.bundle import Bundle
 from tastypie.exceptions import ImmediateHttpResponse
 from tastypie.resources import ALL_WITH_RELATIONS
 from tastypie.serializers import Serializer
-from tastypie.throttle import CacheThrottle
 from tastypie.utils import trailing_slash
 import waffle
 
@@ -38,6 +37,7 @@ from mkt.api.forms import (CategoryForm, DeviceTypeForm, NewPackagedForm,
                            PreviewArgsForm, PreviewJSONForm, StatusForm,
                            UploadForm)
 from mkt.api.http import HttpLegallyUnavailable
+from mkt.api.throttle import SlidingWindowThrottle
 from mkt.carriers import get_carrier_id, CARRIERS, CARRIER_MAP
 from mkt.developers import tasks
 from mkt.developers.forms import NewManifestForm, PreviewForm, RegionForm
@@ -135,7 +135,8 @@ class AppResource(CORSResource, MarketplaceModelResource):
         serializer = Serializer(formats=['json'])
         slug_lookup = 'app_slug'
         # Throttle users without Apps:APIUnthrottled at 10 POST requests/day.
-        throttle = CacheThrottle(throttle_at=10, timeframe=60 * 60 * 24)
+        throttle = SlidingWindowThrottle(throttle_at=10,
+                                         timeframe=60 * 60 * 24)
 
     def dispatch(self, request_type, request, **kwargs):
         # Using `Webapp.objects.all()` here forces a new queryset, which for
@@ -180,12 +181,11 @@ class AppResource(CORSResource, MarketplaceModelResource):
         log.info('App created: %s' % bundle.obj.pk)
         return bundle
 
-    def log_throttled_access(self, request):
+    def throttle_counts(self, request):
         """
         Only throttle POST requests.
         """
-        if request.method == 'POST':
-            super(AppResource, self).log_throttled_access(request)
+        return request.method == 'POST'
 
     def _icons_and_images(self, bundle_obj):
         pipeline = TaskTree()
@@ -380,7 +380,8 @@ class PrivacyPolicyResource(MarketplaceModelResource):
         serializer = Serializer(formats=['json'])
         slug_lookup = 'app_slug'
         # Throttle users without Apps:APIUnthrottled at 10 POST requests/day.
-        throttle = CacheThrottle(throttle_at=10, timeframe=60 * 60 * 24)
+        throttle = SlidingWindowThrottle(throttle_at=10,
+                                         timeframe=60 * 60 * 24)
 
 
 
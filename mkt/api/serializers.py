@@ -2,6 +2,8 @@ from urlparse import parse_qsl
 
 from django.utils.simplejson import JSONDecodeError
 
+import simplejson
+from tastypie.bundle import Bundle
 from tastypie.serializers import Serializer
 from tastypie.exceptions import UnsupportedFormat
 
@@ -27,3 +29,23 @@ class Serializer(Serializer):
             return super(Serializer, self).deserialize(content, format)
         except JSONDecodeError, exc:
             raise DeserializationError(original=exc)
+
+
+class SimpleJSONSerializer(Serializer):
+    """
+    Gives the same JSON as tastypie's serializer, but lets the C encoder of
+    simplejson walk the data instead of `to_simple`. Only what JSON can't
+    encode by itself (bundles, dates, decimals...) goes through `to_simple`.
+    """
+
+    def to_json(self, data, options=None):
+        options = options or {}
+
+        def default(obj):
+            if isinstance(obj, Bundle):
+                return obj.data
+            return self.to_simple(obj, options)
+
+        return simplejson.dumps(data, default=default, sort_keys=True,
+                                use_decimal=False,
+                                namedtuple_as_object=False)
@@ -231,7 +231,7 @@ class CreateHandler(BaseOAuth):
                                          name=fil, valid=True)
 
 
-def _mock_fetch_content(url):
+def _mock_fetch_content(url, headers=None):
     return open(os.path.join(os.path.dirname(__file__),
                              '..', '..', 'developers', 'tests', 'icons',
                              '337141-128.png'))
@@ -1,15 +1,20 @@
 from datetime import datetime
 from functools import partial
 import json
+import time
 import urllib
 import urlparse
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test.client import Client, FakePayload
+from django.test.utils import override_settings
 
+from mock import Mock, patch
 from nose.tools import eq_
 from oauthlib import oauth1
+from redis.exceptions import ConnectionError
 from pyquery import PyQuery as pq
 from test_utils import RequestFactory
 
@@ -19,7 +24,9 @@ from amo.urlresolvers import reverse
 
 from mkt.api import authentication
 from mkt.api.base import CORSResource, MarketplaceResource
-from mkt.api.models import Access, Token, generate, REQUEST_TOKEN, ACCESS_TOKEN
+from mkt.api.models import (Access, get_access, get_access_token, Nonce,
+                            Token, generate, REQUEST_TOKEN, ACCESS_TOKEN)
+from mkt.api.oauth import DatabaseNonceStore, OAuthServer, RedisNonceStore
 from mkt.site.fixtures import fixture
 
 
@@ -310,3 +317,130 @@ class Test3LeggedOAuthFlow(TestCase):
                               HTTP_AUTHORIZATION=auth_header)
         eq_(res.status_code, 401)
         assert not Token.objects.filter(token_type=REQUEST_TOKEN).exists()
+
+
+class TestNonceStores(TestCase):
+
+    def setUp(self):
+        self.timestamp = str(int(time.time()))
+        self.redis = Mock()
+        self.pipeline = self.redis.pipeline.return_value
+        self.pipeline.setnx.return_value = self.pipeline
+        self.pipeline.expire.return_value = self.pipeline
+        patcher = patch.dict('redisutils.connections', master=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_database(self):
+        store = DatabaseNonceStore()
+        assert store.add('client', self.timestamp, 'nonce')
+        assert not store.add('client', self.timestamp, 'nonce')
+        assert store.add('client', self.timestamp, 'nonce',
+                         access_token='token')
+        eq_(Nonce.objects.count(), 2)
+
+    def test_redis(self):
+        self.pipeline.execute.return_value = [True, True]
+        assert RedisNonceStore(600).add('client', self.timestamp, 'nonce')
+        key, value = self.pipeline.setnx.call_args[0]
+        eq_(self.pipeline.expire.call_args[0][0], key)
+        assert 590 < self.pipeline.expire.call_args[0][1] <= 600
+        eq_(Nonce.objects.count(), 0)
+
+    def test_redis_seen(self):
+        self.pipeline.execute.return_value = [False, True]
+        assert not RedisNonceStore(600).add('client', self.timestamp,
+                                            'nonce')
+
+    def test_redis_keys(self):
+        self.pipeline.execute.return_value = [True, True]
+        store = RedisNonceStore(600)
+        store.add('client', self.timestamp, 'nonce')
+        store.add('client', self.timestamp, 'nonce', access_token='token')
+        store.add('client', self.timestamp, 'nonce')
+        keys = [c[0][0] for c in self.pipeline.setnx.call_args_list]
+        eq_(len(set(keys)), 2)
+        eq_(keys[0], keys[2])
+
+    def test_redis_future_timestamp(self):
+        self.pipeline.execute.return_value = [True, True]
+        RedisNonceStore(600).add('client', str(int(time.time()) + 600),
+                                 'nonce')
+        assert self.pipeline.expire.call_args[0][1] > 600
+
+    def test_redis_down(self):
+        self.pipeline.execute.side_effect = ConnectionError
+        store = RedisNonceStore(600)
+        assert store.add('client', self.timestamp, 'nonce')
+        assert not store.add('client', self.timestamp, 'nonce')
+        eq_(Nonce.objects.count(), 1)
+
+    @override_settings(OAUTH_NONCE_BACKEND='redis')
+    def test_server(self):
+        self.pipeline.execute.return_value = [True, True]
+        assert OAuthServer().validate_timestamp_and_nonce(
+            'client', self.timestamp, 'nonce')
+        assert self.pipeline.setnx.called
+
+
+@override_settings(OAUTH_CACHE_TIMEOUT=60)
+class TestCredentialsCache(TestCase):
+    fixtures = fixture('user_2519', 'user_999')
+
+    def setUp(self):
+        self.user = User.objects.get(pk=2519)
+        self.access = Access.objects.create(key=generate(), secret=generate(),
+                                            user=self.user)
+        self.token = Token.generate_new(ACCESS_TOKEN, creds=self.access,
+                                        user=User.objects.get(pk=999))
+        connection.use_debug_cursor = True
+
+    def tearDown(self):
+        connection.use_debug_cursor = None
+
+    def lookups(self, func, *args):
+        before = len(connection.queries)
+        value = func(*args)
+        return value, len(connection.queries) - before
+
+    def test_access(self):
+        eq_(self.lookups(get_access, self.access.key),
+            ((self.access.secret, self.user.pk), 1))
+        eq_(self.lookups(get_access, self.access.key),
+            ((self.access.secret, self.user.pk), 0))
+
+    def test_unknown_access(self):
+        key = generate()
+        eq_(self.lookups(get_access, key), ((), 1))
+        eq_(self.lookups(get_access, key), ((), 0))
+
+    def test_access_saved(self):
+        get_access(self.access.key)
+        self.access.update(secret='new')
+        eq_(get_access(self.access.key), ('new', self.user.pk))
+        self.access.delete()
+        eq_(get_access(self.access.key), ())
+
+    def test_access_created(self):
+        key = generate()
+        get_access(key)
+        Access.objects.create(key=key, secret='s', user=self.user)
+        eq_(get_access(key), ('s', self.user.pk))
+
+    def test_token(self):
+        eq_(self.lookups(get_access_token, self.access.key, self.token.key),
+            ((self.token.secret, 999), 1))
+        eq_(self.lookups(get_access_token, self.access.key, self.token.key),
+            ((self.token.secret, 999), 0))
+
+    def test_token_other_consumer(self):
+        eq_(get_access_token('other', self.token.key), ())
+
+    def test_request_token(self):
+        token = Token.generate_new(REQUEST_TOKEN, creds=self.access)
+        eq_(get_access_token(self.access.key, token.key), ())
+
+    def test_token_deleted(self):
+        get_access_token(self.access.key, self.token.key)
+        self.token.delete()
+        eq_(get_access_token(self.access.key, self.token.key), ())
@@ -1,3 +1,4 @@
+from datetime import date, datetime
 from decimal import Decimal
 import json
 import urllib
@@ -6,10 +7,13 @@ from django.test import TestCase
 
 from nose.tools import eq_
 from simplejson import JSONDecodeError
+from tastypie.bundle import Bundle
 from tastypie.exceptions import UnsupportedFormat
+from tastypie.serializers import Serializer as TastypieSerializer
+from tower import ugettext_lazy as _lazy
 
 from mkt.api.exceptions import DeserializationError
-from mkt.api.serializers import Serializer
+from mkt.api.serializers import Serializer, SimpleJSONSerializer
 
 
 class TestSerializer(TestCase):
@@ -42,3 +46,16 @@ class TestSerializer(TestCase):
             self.assertIsInstance(e.original, JSONDecodeError)
         else:
             self.fail('DeserializationError not raised')
+
+
+class TestSimpleJSONSerializer(TestCase):
+
+    def test_same_as_tastypie(self):
+        bundle = Bundle(data={'name': u'\u0107', 'price': Decimal('0.99'),
+                              'created': datetime(2013, 5, 1, 12, 30)})
+        data = {'objects': [bundle, bundle],
+                'meta': {'limit': 25, 'next': None, 'ok': True,
+                         'ratio': .5, 'label': _lazy('Apps'),
+                         'day': date(2013, 5, 1), 'ids': (1, 2L)}}
+        eq_(SimpleJSONSerializer(formats=['json']).serialize(data),
+            TastypieSerializer(formats=['json']).serialize(data))
@@ -1,10 +1,14 @@
 from django.test.client import RequestFactory
 
-from mock import patch
+from mock import Mock, patch
+from nose.tools import eq_
+from redis.exceptions import ConnectionError
 from tastypie.exceptions import ImmediateHttpResponse
 
+from amo.tests import TestCase
 from mkt.api.base import HttpTooManyRequests, MarketplaceResource
 from mkt.api.tests.test_oauth import BaseOAuth
+from mkt.api.throttle import SlidingWindowThrottle
 
 
 class ThrottleTests(object):
@@ -37,3 +41,133 @@ class ThrottleTests(object):
 
 class TestThrottle(ThrottleTests, BaseOAuth):
     resource = MarketplaceResource()
+
+
+class TestSlidingWindowThrottle(TestCase):
+
+    def setUp(self):
+        self.throttle = SlidingWindowThrottle(throttle_at=3, timeframe=60)
+        patcher = patch('mkt.api.throttle.time')
+        self.time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.time.time.return_value = 6000.0
+
+    def check(self, count=True, scope='app', identifier='127.0.0.1_'):
+        return self.throttle.should_be_throttled(identifier, scope=scope,
+                                                 count=count)
+
+    def test_throttle_at(self):
+        eq_([self.check() for i in range(4)], [False, False, False, True])
+
+    def test_not_counted(self):
+        for i in range(5):
+            assert not self.check(count=False)
+        self.check()
+        self.check()
+        assert not self.check(count=False)
+        self.check()
+        assert self.check(count=False)
+
+    def test_next_window(self):
+        for i in range(3):
+            self.check()
+        # The previous window still weighs 3 * 0.5.
+        self.time.time.return_value = 6090.0
+        eq_([self.check(), self.check()], [False, True])
+        # And it's gone once the sliding window is past it.
+        self.time.time.return_value = 6240.0
+        eq_([self.check() for i in range(4)], [False, False, False, True])
+
+    def test_identifiers(self):
+        for i in range(3):
+            self.check()
+        assert self.check()
+        assert not self.check(identifier='127.0.0.2_')
+
+    def test_scopes(self):
+        for i in range(3):
+            self.check()
+        assert self.check()
+        assert not self.check(scope='feedback')
+
+    def test_rates(self):
+        with self.settings(API_THROTTLE_RATES={'app': (1, 60)}):
+            eq_([self.check(), self.check()], [False, True])
+            assert not self.check(scope='feedback')
+
+
+class TestSlidingWindowThrottleRedis(TestCase):
+
+    def setUp(self):
+        self.throttle = SlidingWindowThrottle(throttle_at=3, timeframe=60)
+        self.redis = Mock()
+        self.pipeline = self.redis.pipeline.return_value
+        for method in ('incr', 'expire', 'get'):
+            getattr(self.pipeline, method).return_value = self.pipeline
+        patcher = patch.dict('redisutils.connections', master=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def check(self, count=True):
+        with self.settings(API_THROTTLE_BACKEND='redis'):
+            return self.throttle.should_be_throttled('127.0.0.1_',
+                                                     scope='app',
+                                                     count=count)
+
+    @patch('mkt.api.throttle.time')
+    def test_counted(self, time):
+        time.time.return_value = 6000.0
+        self.pipeline.execute.return_value = [3, True, None]
+        assert not self.check()
+        key = self.pipeline.incr.call_args[0][0]
+        assert key.endswith(':100')
+        self.pipeline.expire.assert_called_with(key, 120)
+        assert self.pipeline.get.call_args[0][0].endswith(':99')
+        eq_(self.redis.pipeline.call_count, 1)
+
+        self.pipeline.execute.return_value = [4, True, None]
+        assert self.check()
+
+    def test_previous_window(self):
+        self.pipeline.execute.return_value = [1, True, '1000']
+        assert self.check()
+
+    def test_not_counted(self):
+        self.pipeline.execute.return_value = ['2', None]
+        assert not self.check(count=False)
+        assert not self.pipeline.incr.called
+        self.pipeline.execute.return_value = ['3', None]
+        assert self.check(count=False)
+
+    def test_redis_down(self):
+        self.pipeline.execute.side_effect = ConnectionError
+        assert not self.check()
+
+
+class CountedResource(MarketplaceResource):
+
+    class Meta(object):
+        resource_name = 'counted'
+        throttle = SlidingWindowThrottle(throttle_at=1)
+
+    def throttle_counts(self, request):
+        return request.method == 'POST'
+
+
+class TestThrottleCounts(TestCase):
+
+    def setUp(self):
+        self.resource = CountedResource()
+
+    def test_counts(self):
+        request = RequestFactory().post('/')
+        self.resource.throttle_check(request)
+        with self.assertImmediate(HttpTooManyRequests):
+            self.resource.throttle_check(RequestFactory().post('/'))
+        with self.assertImmediate(HttpTooManyRequests):
+            self.resource.throttle_check(RequestFactory().get('/'))
+
+    def test_not_counted(self):
+        for i in range(3):
+            self.resource.throttle_check(RequestFactory().get('/'))
+        self.resource.throttle_check(RequestFactory().post('/'))
@@ -0,0 +1,86 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import smart_str
+
+import commonware.log
+import redisutils
+from redis.exceptions import RedisError
+from tastypie.throttle import BaseThrottle
+
+import amo
+
+log = commonware.log.getLogger('z.api')
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Throttles each identifier at `throttle_at` requests to a resource in any
+    `timeframe` seconds, or at the limits `API_THROTTLE_RATES` has for the
+    resource.
+
+    The requests are counted in fixed windows of `timeframe` seconds, and
+    the count of the previous window is weighted by how much of it is still
+    in the sliding window. That's two counters per identifier and resource,
+    however many requests it makes. They are kept in redis, or in the cache
+    with `API_THROTTLE_BACKEND = 'cache'`, so that all the web nodes share
+    them.
+
+    A request is counted as it's checked, in the same round-trip, so
+    `accessed` has nothing left to do. Throttled requests count too.
+    """
+
+    def get_rate(self, scope):
+        return settings.API_THROTTLE_RATES.get(
+            scope, (self.throttle_at, self.timeframe))
+
+    def should_be_throttled(self, identifier, scope=None, count=True, **kw):
+        """
+        Returns whether the identifier made too many requests to the resource
+        `scope` lately. If `count` is True, this request is counted first.
+        """
+        throttle_at, timeframe = self.get_rate(scope)
+        now = time.time()
+        window = int(now // timeframe)
+        key = amo.API_THROTTLE_KEY % (
+            scope or '', hashlib.md5(smart_str(identifier)).hexdigest(), '%s')
+        try:
+            current, previous = self.get_counts(
+                key % window, key % (window - 1), count, timeframe * 2)
+        except RedisError:
+            log.error('Could not check the API throttle in redis',
+                      exc_info=True)
+            return False
+        weight = 1 - (now % timeframe) / float(timeframe)
+        requests = current + previous * weight
+        if count:
+            return requests > throttle_at
+        return requests >= throttle_at
+
+    def get_counts(self, current, previous, count, expires):
+        """
+        Returns the counts of the `current` and `previous` windows, after
+        incrementing the current one if `count` is True.
+        """
+        if settings.API_THROTTLE_BACKEND == 'cache':
+            if count:
+                cache.add(current, 0, expires)
+                counts = {current: cache.incr(current)}
+                counts[previous] = cache.get(previous)
+            else:
+                counts = cache.get_many([current, previous])
+            return (int(counts.get(current) or 0),
+                    int(counts.get(previous) or 0))
+
+        pipe = redisutils.connections['master'].pipeline()
+        if count:
+            pipe.incr(current).expire(current, expires)
+        else:
+            pipe.get(current)
+        counts = pipe.get(previous).execute()
+        return int(counts[0] or 0), int(counts[-1] or 0)
+
+    def accessed(self, identifier, **kwargs):
+        pass
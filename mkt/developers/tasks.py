@@ -340,11 +340,19 @@ def get_preview_sizes(ids, **kw):
                           % (addon.pk, err))
 
 
-def _fetch_content(url):
+class NotModified(Exception):
+    """The resource didn't change since the validators that were sent."""
+
+
+def _fetch_content(url, headers=None):
     with statsd.timer('developers.tasks.fetch_content'):
         try:
-            return urllib2.urlopen(url, timeout=30)
+            return urllib2.urlopen(
+                urllib2.Request(url, headers=headers) if headers else url,
+                timeout=30)
         except urllib2.HTTPError, e:
+            if e.code == 304:
+                raise NotModified(url)
             raise Exception(
                 _('%s responded with %s (%s).') % (url, e.code, e.msg))
         except urllib2.URLError, e:
@@ -460,7 +468,13 @@ def failed_validation(*messages, **kwargs):
 
 
 CT_URL = 'https://developer.mozilla.org/en/Apps/Manifest#Serving_manifests'
-def _fetch_manifest(url, upload=None):
+def _fetch_manifest(url, upload=None, validators=None):
+    """
+    Returns the content of the manifest at `url`. If given, the 'etag' and
+    'last_modified' of the `validators` dict are sent along to only get the
+    manifest if it changed, NotModified is raised otherwise. They're updated
+    with those of the response.
+    """
     def fail(message, upload=None):
         if upload is None:
             # If `upload` is None, that means we're using one of @washort's old
@@ -468,14 +482,27 @@ def _fetch_manifest(url, upload=None):
             raise Exception(message)
         upload.update(validation=failed_validation(message, upload=upload))
 
+    headers = {}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
     try:
-        response = _fetch_content(url)
+        response = _fetch_content(url, headers=headers)
+    except NotModified:
+        raise
     except Exception, e:
         log.error('Failed to fetch manifest from %r: %s' % (url, e))
         fail(_('No manifest was found at that URL. Check the address and try '
                'again.'), upload=upload)
         return
 
+    if validators is not None:
+        validators['etag'] = response.headers.get('ETag')
+        validators['last_modified'] = response.headers.get('Last-Modified')
+
     ct = response.headers.get('Content-Type', '')
     if not ct.startswith('application/x-web-app-manifest+json'):
         fail(_('Manifests must be served with the HTTP header '
@@ -192,5 +192,9 @@ def serve(request, viewer, key):
         log.error(u'Couldn\'t find %s in %s (%d entries) for file %s' %
                   (key, files.keys()[:10], len(files.keys()), viewer.file.id))
         raise http.Http404()
+    if viewer.zip_native:
+        # Streamed straight out of the archive.
+        return http.HttpResponse(viewer.index.iter_chunks(obj['full']),
+                                 content_type=obj['mimetype'])
     return HttpResponseSendFile(request, obj['full'],
                                 content_type=obj['mimetype'])
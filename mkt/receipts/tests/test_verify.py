@@ -1,9 +1,11 @@
 # -*- coding: utf8 -*-
 import calendar
 import json
+from StringIO import StringIO
 import time
 from urllib import urlencode
 
+from django.core.cache import cache
 from django.db import connection
 from django.conf import settings
 
@@ -325,6 +327,214 @@ class TestVerify(amo.tests.TestCase):
         assert ('Cache-Control', 'no-cache') in hdrs, 'No cache header needed'
 
 
+@mock.patch.object(verify, 'CACHE_TIMEOUT', 60)
+class TestVerifyCache(TestVerify):
+    """All of TestVerify again, with the verification cache on."""
+
+    def setUp(self):
+        super(TestVerifyCache, self).setUp()
+        cache.clear()
+
+    def premium(self):
+        self.addon.update(premium_type=amo.ADDON_PREMIUM)
+        self.make_install()
+        # Saving the contribution creates the purchase.
+        contribution = self.make_contribution()
+        eq_(self.get(self.user_data)['status'], 'ok')
+        return contribution
+
+    def refund_quietly(self):
+        # Queryset updates don't send signals, only an explicit
+        # invalidation can let the verifier know.
+        AddonPurchase.objects.filter(addon=self.addon).update(
+            type=amo.CONTRIB_REFUND)
+
+    def test_cached(self):
+        self.premium()
+        self.refund_quietly()
+        with self.assertNumQueries(0):
+            eq_(self.get(self.user_data)['status'], 'ok')
+
+    def test_enqueue_refund(self):
+        contribution = self.premium()
+        self.refund_quietly()
+        contribution.enqueue_refund(amo.REFUND_APPROVED, self.user)
+        eq_(self.get(self.user_data)['status'], 'refunded')
+
+    def test_chargeback(self):
+        contribution = self.premium()
+        self.refund_quietly()
+        contribution.handle_chargeback('reversal')
+        eq_(self.get(self.user_data)['status'], 'refunded')
+
+    def test_purchase_saved(self):
+        self.premium()
+        AddonPurchase.objects.get(addon=self.addon).update(
+            type=amo.CONTRIB_CHARGEBACK)
+        eq_(self.get(self.user_data)['status'], 'refunded')
+
+    def test_install_deleted(self):
+        self.make_install()
+        eq_(self.get(self.user_data)['status'], 'ok')
+        Installed.objects.all().delete()
+        eq_(self.get(self.user_data)['status'], 'invalid')
+
+    def test_not_found_not_cached(self):
+        eq_(self.get(self.user_data)['status'], 'invalid')
+        Installed.objects.create(addon=self.addon, user=self.user)
+        Installed.objects.filter(addon=self.addon).update(uuid='some-uuid')
+        eq_(self.get(self.user_data)['status'], 'ok')
+
+    @mock.patch.object(verify, '_decode_receipt')
+    def test_decode_memoized(self, _decode_receipt):
+        decoded = {'typ': 'purchase-receipt'}
+        _decode_receipt.return_value = decoded
+        eq_(verify.decode_receipt('some.receipt'), decoded)
+        eq_(verify.decode_receipt('some.receipt'), decoded)
+        eq_(_decode_receipt.call_count, 1)
+        verify.decode_receipt('other.receipt')
+        eq_(_decode_receipt.call_count, 2)
+
+    @mock.patch.object(verify, '_decode_receipt')
+    def test_decode_failure_not_memoized(self, _decode_receipt):
+        _decode_receipt.side_effect = verify.VerificationError
+        for x in range(2):
+            self.assertRaises(verify.VerificationError,
+                              verify.decode_receipt, 'some.receipt')
+        eq_(_decode_receipt.call_count, 2)
+
+
+@mock.patch.object(utils.settings, 'WEBAPPS_RECEIPT_KEY',
+                   amo.tests.AMOPaths.sample_key())
+@mock.patch.object(settings, 'WEBAPPS_RECEIPT_KEY',
+                   amo.tests.AMOPaths.sample_key())
+@mock.patch.object(utils.settings, 'WEBAPPS_RECEIPT_URL', 'http://foo.com')
+class TestBatchVerify(amo.tests.TestCase):
+    fixtures = fixture('webapp_337141', 'user_999')
+
+    def setUp(self):
+        self.addon = Addon.objects.get(pk=337141)
+        self.addon.update(premium_type=amo.ADDON_PREMIUM)
+        self.user = UserProfile.objects.get(pk=999)
+        self.other = UserProfile.objects.create(email='other@example.com',
+                                                username='other')
+        self.install(self.user, 'some-uuid')
+        self.install(self.other, 'other-uuid')
+        AddonPurchase.objects.create(addon=self.addon, user=self.user)
+        AddonPurchase.objects.create(addon=self.addon, user=self.other,
+                                     type=amo.CONTRIB_REFUND)
+        cache.clear()
+
+    def install(self, user, uuid):
+        install = Installed.objects.create(addon=self.addon, user=user)
+        install.update(uuid=uuid)
+
+    def receipt(self, uuid, **kw):
+        data = {'user': {'type': 'directed-identifier', 'value': uuid},
+                'product': {'url': 'http://f.com',
+                            'storedata': urlencode({'id': 337141})},
+                'verify': 'https://foo.com/verifyme/',
+                'exp': calendar.timegm(time.gmtime()) + 1000,
+                'typ': 'purchase-receipt'}
+        data.update(kw)
+        return data
+
+    @mock.patch.object(verify, 'decode_receipt')
+    def check(self, receipts, decode_receipt):
+        def decode(receipt):
+            return receipts[int(receipt)]
+        decode_receipt.side_effect = decode
+        batch = verify.BatchVerify(
+            [str(i) for i in range(len(receipts))],
+            RequestFactory().post('/verifyme/batch/').META)
+        batch.cursor = connection.cursor()
+        return [r['status'] for r in json.loads(batch.check())]
+
+    def test_statuses(self):
+        eq_(self.check([self.receipt('some-uuid'),
+                        self.receipt('other-uuid'),
+                        self.receipt('no-uuid'),
+                        self.receipt('some-uuid', typ='test-receipt'),
+                        self.receipt('some-uuid',
+                                     verify='https://foo.com/other/'),
+                        self.receipt('some-uuid', user={})]),
+            ['ok', 'refunded', 'invalid', 'invalid', 'invalid', 'invalid'])
+
+    def test_free(self):
+        Installed.objects.update(premium_type=amo.ADDON_FREE)
+        receipts = [self.receipt('some-uuid'), self.receipt('other-uuid')]
+        eq_(self.check(receipts), ['ok', 'ok'])
+
+    def test_not_purchased(self):
+        AddonPurchase.objects.filter(user=self.other).delete()
+        eq_(self.check([self.receipt('other-uuid')]), ['invalid'])
+
+    def test_wrong_app(self):
+        receipt = self.receipt('some-uuid')
+        receipt['product']['storedata'] = urlencode({'id': 123})
+        eq_(self.check([receipt]), ['invalid'])
+
+    def test_one_query_each(self):
+        receipts = [self.receipt('some-uuid'), self.receipt('other-uuid'),
+                    self.receipt('no-uuid')] * 5
+        with self.assertNumQueries(2):
+            eq_(self.check(receipts), ['ok', 'refunded', 'invalid'] * 5)
+
+    def test_empty(self):
+        with self.assertNumQueries(0):
+            eq_(self.check([]), [])
+
+    @mock.patch.object(verify, 'CACHE_TIMEOUT', 60)
+    def test_cached(self):
+        receipts = [self.receipt('some-uuid'), self.receipt('other-uuid')]
+        eq_(self.check(receipts), ['ok', 'refunded'])
+        with self.assertNumQueries(0):
+            eq_(self.check(receipts), ['ok', 'refunded'])
+
+    @mock.patch.object(verify, 'CACHE_TIMEOUT', 60)
+    def test_cache_shared_with_single(self):
+        eq_(self.check([self.receipt('some-uuid')]), ['ok'])
+        v = verify.Verify('', RequestFactory().get('/verifyme/').META)
+        v.cursor = connection.cursor()
+        v.decoded = self.receipt('some-uuid')
+        with self.assertNumQueries(0):
+            v.check_db()
+        eq_(v.user_id, self.user.pk)
+        eq_(v.purchase, amo.CONTRIB_PURCHASE)
+
+
+class TestBatchApplication(amo.tests.TestCase):
+
+    def call(self, body, path='/verify/batch/'):
+        start_response = mock.Mock()
+        verify.application({'PATH_INFO': path, 'REQUEST_METHOD': 'POST',
+                            'wsgi.input': StringIO(body)}, start_response)
+        return start_response.call_args[0][0]
+
+    @mock.patch.object(verify, 'BatchVerify')
+    def test_batch(self, BatchVerify):
+        BatchVerify.return_value.check.return_value = '[]'
+        eq_(self.call('["a", "b"]'), '200 OK')
+        eq_(BatchVerify.call_args[0][0], ['a', 'b'])
+
+    @mock.patch.object(verify, 'receipt_check')
+    def test_single(self, receipt_check):
+        receipt_check.return_value = 200, ''
+        self.call('a', path='/verify/')
+        assert receipt_check.called
+
+    def test_bad_json(self):
+        eq_(self.call('a'), '400 Bad Request')
+
+    def test_not_receipts(self):
+        eq_(self.call('{"a": "b"}'), '400 Bad Request')
+        eq_(self.call('[1, 2]'), '400 Bad Request')
+
+    @mock.patch.object(verify, 'BATCH_SIZE', 1)
+    def test_too_many(self):
+        eq_(self.call('["a", "b"]'), '413 Request Entity Too Large')
+
+
 class TestBase(amo.tests.TestCase):
 
     def create(self, data, request=None):
@@ -9,6 +9,7 @@ from tower import ugettext as _, ugettext_lazy as _lazy
 import amo
 import mkt.constants.reviewers as rvw
 from addons.models import AddonDeviceType, Persona
+from addons.tasks import build_theme_update
 from amo.utils import raise_required
 from editors.forms import NonValidatingChoiceField, ReviewLogForm
 from editors.models import CannedResponse
@@ -163,6 +164,8 @@ class ThemeReviewForm(happyforms.Form):
         if action == rvw.ACTION_APPROVE:
             if is_rereview:
                 approve_rereview(theme)
+                # The status doesn't change, but the images did.
+                build_theme_update.delay([theme.addon_id])
             theme.addon.update(status=amo.STATUS_PUBLIC)
             theme.approve = datetime.datetime.now()
             theme.save()
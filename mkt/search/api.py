@@ -1,7 +1,6 @@
 import json
 
 from django.conf.urls import url
-from django.core.exceptions import ObjectDoesNotExist
 
 from tastypie import http
 from tastypie.authorization import ReadOnlyAuthorization
@@ -15,16 +14,18 @@ from access import acl
 from addons.models import Category
 from amo.helpers import absolutify
 from editors.models import EscalationQueue
+from files.models import File
 from versions.models import Version
 
 import mkt
 from mkt.api.authentication import OptionalOAuthAuthentication
 from mkt.api.base import CORSResource, MarketplaceResource
 from mkt.api.resources import AppResource
+from mkt.api.serializers import SimpleJSONSerializer
 from mkt.search.views import _get_query, _filter_search
 from mkt.search.forms import ApiSearchForm
 from mkt.webapps.models import Webapp
-from mkt.webapps.utils import es_app_to_dict
+from mkt.webapps.utils import es_app_to_dict, es_apps_to_dicts
 
 
 class SearchResource(CORSResource, MarketplaceResource):
@@ -39,6 +40,7 @@ class SearchResource(CORSResource, MarketplaceResource):
         slug_lookup = None
         # Override CacheThrottle with a no-op.
         throttle = BaseThrottle()
+        serializer = SimpleJSONSerializer(formats=['json'])
 
     def get_resource_uri(self, bundle):
         # Link to the AppResource URI.
@@ -90,6 +92,7 @@ class SearchResource(CORSResource, MarketplaceResource):
         for obj in page['objects']:
             obj.pk = obj.id
             objs.append(self.build_bundle(obj=obj, request=request))
+        self.prefetch(request, objs, uses_es)
 
         if uses_es:
             page['objects'] = [self.full_dehydrate(bundle)
@@ -103,6 +106,68 @@ class SearchResource(CORSResource, MarketplaceResource):
         to_be_serialized = self.alter_list_data_to_serialize(request, page)
         return self.create_response(request, to_be_serialized)
 
+    def prefetch(self, request, bundles, uses_es):
+        """
+        Look up what `dehydrate` needs for a whole page of results at once,
+        instead of once per result, and attach it to the bundles.
+        """
+        if uses_es:
+            amo_user = getattr(request, 'amo_user', None)
+            dicts = es_apps_to_dicts(
+                [bundle.obj for bundle in bundles],
+                currency=request.REGION.default_currency, profile=amo_user)
+            for bundle, data in zip(bundles, dicts):
+                bundle.app_data = data
+
+        if acl.action_allowed(request, 'Apps', 'Review'):
+            reviewer_data = self.get_reviewer_data(
+                [self.get_app_id(bundle, uses_es) for bundle in bundles],
+                uses_es)
+            for bundle in bundles:
+                bundle.reviewer_data = reviewer_data[
+                    self.get_app_id(bundle, uses_es)]
+
+    def get_app_id(self, bundle, uses_es):
+        # The ids of ES results are strings.
+        return int(bundle.obj._id) if uses_es else bundle.obj.id
+
+    def get_reviewer_data(self, ids, uses_es):
+        """
+        The reviewer flags of the latest version of the apps `ids`, and the
+        status of its latest file unless the apps come from ES, by app id.
+        """
+        # Going up by date, the last version of an app is its latest.
+        versions = {}
+        for version in (Version.objects.no_cache().filter(addon__in=ids)
+                        .order_by('created')
+                        .values('id', 'addon', 'has_editor_comment',
+                                'has_info_request')):
+            versions[version['addon']] = version
+        escalated = set(EscalationQueue.objects.no_cache()
+                        .filter(addon__in=ids)
+                        .values_list('addon', flat=True))
+        statuses = {}
+        if not uses_es and versions:
+            statuses = dict(File.objects.no_cache()
+                            .filter(version__in=[v['id'] for v in
+                                                 versions.values()])
+                            .order_by('created')
+                            .values_list('version', 'status'))
+
+        data = {}
+        for id_ in ids:
+            version = versions.get(id_, {})
+            data[id_] = {
+                'latest_version_status': statuses.get(version.get('id')),
+                'reviewer_flags': {
+                    'has_comment': version.get('has_editor_comment', False),
+                    'has_info_request': version.get('has_info_request',
+                                                    False),
+                    'is_escalated': id_ in escalated,
+                },
+            }
+        return data
+
     def dehydrate(self, bundle):
         obj = bundle.obj
         amo_user = getattr(bundle.request, 'amo_user', None)
@@ -110,9 +175,12 @@ class SearchResource(CORSResource, MarketplaceResource):
         uses_es = waffle.switch_is_active('search-api-es')
 
         if uses_es:
-            bundle.data.update(es_app_to_dict(
-                obj, currency=bundle.request.REGION.default_currency,
-                profile=amo_user))
+            data = getattr(bundle, 'app_data', None)
+            if data is None:
+                data = es_app_to_dict(
+                    obj, currency=bundle.request.REGION.default_currency,
+                    profile=amo_user)
+            bundle.data.update(data)
         else:
             bundle = AppResource().dehydrate(bundle)
             bundle.data['absolute_url'] = absolutify(
@@ -121,27 +189,19 @@ class SearchResource(CORSResource, MarketplaceResource):
         # Add extra data for reviewers. Used in reviewer tool search.
         # TODO: Reviewer flags in ES (bug 848446)
         if acl.action_allowed(bundle.request, 'Apps', 'Review'):
-            addon_id = bundle.obj._id if uses_es else bundle.obj.id
-            version = Version.objects.filter(addon_id=addon_id).latest()
-            escalated = EscalationQueue.objects.filter(
-                addon_id=addon_id).exists()
+            reviewer_data = getattr(bundle, 'reviewer_data', None)
+            if reviewer_data is None:
+                addon_id = self.get_app_id(bundle, uses_es)
+                reviewer_data = self.get_reviewer_data(
+                    [addon_id], uses_es)[addon_id]
 
             if uses_es:
                 bundle.data['latest_version_status'] = (
                     obj.latest_version_status)
             else:
-                try:
-                    file_ = version and version.files.latest()
-                    bundle.data['latest_version_status'] = (
-                        file_.status if file_ else None)
-                except ObjectDoesNotExist:
-                    bundle.data['latest_version_status'] = None
-
-            bundle.data['reviewer_flags'] = {
-                'has_comment': version.has_editor_comment,
-                'has_info_request': version.has_info_request,
-                'is_escalated': escalated,
-            }
+                bundle.data['latest_version_status'] = (
+                    reviewer_data['latest_version_status'])
+            bundle.data['reviewer_flags'] = reviewer_data['reviewer_flags']
 
         return bundle
 
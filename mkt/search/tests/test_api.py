@@ -2,21 +2,35 @@ import json
 from datetime import datetime
 
 from django.contrib.auth.models import User
+from django.db import connection
 
 from nose.tools import eq_, ok_
 
 import amo
+import amo.tests
 import mkt.regions
 from addons.models import AddonCategory, AddonDeviceType, Category, Flag
-from amo.tests import ESTestCase
+from amo.tests import app_factory, ESTestCase
+from editors.models import EscalationQueue
 from mkt.api.base import list_url
 from mkt.api.models import Access, generate
 from mkt.api.tests.test_oauth import BaseOAuth, OAuthClient
+from mkt.search.api import SearchResource
 from mkt.search.forms import DEVICE_CHOICES_IDS
 from mkt.site.fixtures import fixture
 from mkt.webapps.models import Webapp
 
 
+def count_queries(func):
+    connection.use_debug_cursor = True
+    try:
+        before = len(connection.queries)
+        res = func()
+        return len(connection.queries) - before, res
+    finally:
+        connection.use_debug_cursor = None
+
+
 class TestApi(BaseOAuth, ESTestCase):
     fixtures = fixture('webapp_337141')
 
@@ -211,6 +225,16 @@ class TestApi(BaseOAuth, ESTestCase):
         objs = json.loads(res.content)['objects']
         eq_(len(objs), 0)
 
+    def test_queries_per_page(self):
+        one, res = count_queries(lambda: self.client.get(self.url))
+        eq_(len(json.loads(res.content)['objects']), 1)
+        for i in range(3):
+            app_factory()
+        self.refresh('webapp')
+        many, res = count_queries(lambda: self.client.get(self.url))
+        eq_(len(json.loads(res.content)['objects']), 4)
+        eq_(many, one)
+
 
 class TestApiReviewer(BaseOAuth, ESTestCase):
     fixtures = fixture('webapp_337141', 'user_2519')
@@ -295,6 +319,51 @@ class TestApiReviewer(BaseOAuth, ESTestCase):
         eq_(obj['reviewer_flags']['has_info_request'], True)
         eq_(obj['reviewer_flags']['is_escalated'], False)
 
+    def test_queries_per_page(self):
+        one, res = count_queries(lambda: self.client.get(self.url))
+        eq_(len(json.loads(res.content)['objects']), 1)
+        apps = [app_factory() for i in range(3)]
+        EscalationQueue.objects.create(addon=apps[0])
+        self.refresh('webapp')
+        many, res = count_queries(lambda: self.client.get(self.url))
+        objs = json.loads(res.content)['objects']
+        eq_(len(objs), 4)
+        eq_(many, one)
+        flags = dict((obj['id'], obj['reviewer_flags']['is_escalated'])
+                     for obj in objs)
+        eq_(flags[str(apps[0].id)], True)
+        eq_(flags[str(self.webapp.id)], False)
+
+
+class TestReviewerData(amo.tests.TestCase):
+    fixtures = fixture('webapp_337141')
+
+    def setUp(self):
+        self.webapp = Webapp.objects.get(pk=337141)
+        self.other = app_factory()
+
+    def test_reviewer_data(self):
+        version = self.webapp.versions.latest()
+        version.update(has_editor_comment=True)
+        EscalationQueue.objects.create(addon=self.other)
+        ids = [self.webapp.id, self.other.id, 404]
+        with self.assertNumQueries(3):
+            data = SearchResource().get_reviewer_data(ids, uses_es=False)
+        eq_(data[self.webapp.id], {
+            'latest_version_status': version.files.latest().status,
+            'reviewer_flags': {'has_comment': True,
+                               'has_info_request': False,
+                               'is_escalated': False}})
+        eq_(data[self.other.id]['reviewer_flags']['is_escalated'], True)
+        eq_(data[404], {'latest_version_status': None,
+                        'reviewer_flags': {'has_comment': False,
+                                           'has_info_request': False,
+                                           'is_escalated': False}})
+
+    def test_es_skips_files(self):
+        with self.assertNumQueries(2):
+            SearchResource().get_reviewer_data([self.webapp.id], uses_es=True)
+
 
 class TestCategoriesWithFeatured(BaseOAuth, ESTestCase):
     fixtures = fixture('user_2519', 'webapp_337141')
@@ -41,6 +41,6 @@ def index_latest_mkt_stats(index=None, aliased=True):
 
 
 @cronjobs.register
-def index_mkt_stats(index=None, aliased=True):
+def index_mkt_stats(index=None, aliased=True, inline=False):
     cron_log.info('index_mkt_stats')
-    call_command('index_mkt_stats', addons=None, date=None)
+    call_command('index_mkt_stats', addons=None, date=None, inline=inline)
@@ -48,6 +48,9 @@ class Command(BaseCommand):
                     help='Find and index rows we missed.'),
         make_option('--index',
                     help='The name of the index to use.'),
+        make_option('--inline', action='store_true',
+                    help='Index from this process instead of through '
+                         'celery.'),
     )
     help = HELP
 
@@ -57,6 +60,7 @@ class Command(BaseCommand):
 
         from mkt.webapps.models import Installed
         addons, dates, index = kw['addons'], kw['date'], kw.get('index')
+        inline = kw.get('inline', False)
 
         queries = [
             (Webapp.objects, tasks.index_finance_total,
@@ -119,12 +123,16 @@ class Command(BaseCommand):
                                   today - timedelta(days=start))
                     create_tasks(task, list(qs.filter(**{
                                             '%s__range' % date_field:
-                                            date_range})))
+                                            date_range})), inline=inline)
             else:
-                create_tasks(task, list(qs))
+                create_tasks(task, list(qs), inline=inline)
 
 
-def create_tasks(task, qs):
+def create_tasks(task, qs, inline=False):
+    if inline:
+        for chunk in chunked(qs, 50):
+            task(chunk)
+        return
     ts = [task.subtask(args=[chunk]) for chunk in chunked(qs, 50)]
     TaskSet(ts).apply_async()
 
@@ -0,0 +1,91 @@
+import json
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from elasticutils.contrib.django import F, S
+
+import amo
+import mkt
+from mkt.webapps.models import Webapp, WebappIndexer
+
+
+class Command(BaseCommand):
+    """
+    Compare the ways apps excluded from a region are filtered out of search
+    and browse pages.
+
+    The excluded ids are looked up from the database and from a warm cache,
+    then filtered out of the ES query with a list of `--excluded` ids, or
+    with a term on the `region_exclusions` field of the apps. With
+    `--execute` the queries are sent to ES as well.
+    """
+    help = 'Benchmark region exclusions with and without cache and field.'
+    option_list = BaseCommand.option_list + (
+        make_option('--region', action='store', type='string',
+                    dest='region', default='br',
+                    help='Slug of the region to exclude apps from.'),
+        make_option('--excluded', action='store', type='int',
+                    dest='excluded', default=20000,
+                    help='Number of excluded ids the ES filter gets.'),
+        make_option('--requests', action='store', type='int',
+                    dest='requests', default=200,
+                    help='Number of requests per mode.'),
+        make_option('--execute', action='store_true', dest='execute',
+                    default=False, help='Send the queries to ES.'),
+    )
+
+    def handle(self, *args, **options):
+        region = mkt.regions.REGIONS_DICT.get(options['region'])
+        if not region:
+            raise CommandError('Unknown region %s.' % options['region'])
+        requests = options['requests']
+
+        connection.use_debug_cursor = True
+        original = settings.EXCLUDED_REGIONS_CACHE_TIMEOUT
+        timeout = original or 60
+        try:
+            for mode, mode_timeout in (('database', 0), ('cache', timeout)):
+                settings.EXCLUDED_REGIONS_CACHE_TIMEOUT = mode_timeout
+                Webapp.get_excluded_in(region)
+                before = len(connection.queries)
+                start = time.time()
+                for i in xrange(requests):
+                    excluded = Webapp.get_excluded_in(region)
+                took = time.time() - start
+                self.stdout.write(
+                    'lookup from %s: %s ids, %.1f queries, %.2fms per '
+                    'request\n' % (mode, len(excluded),
+                                   float(len(connection.queries) - before) /
+                                   requests, took * 1000 / requests))
+        finally:
+            settings.EXCLUDED_REGIONS_CACHE_TIMEOUT = original
+            connection.use_debug_cursor = None
+
+        # Ids that aren't apps filter just as much as real ones.
+        excluded = range(1, options['excluded'] + 1)
+        filters = (
+            ('ids', lambda: ~F(id__in=excluded)),
+            ('term', lambda: ~F(region_exclusions=region.id)),
+        )
+        for mode, f in filters:
+            start = time.time()
+            for i in xrange(requests):
+                srch = (S(WebappIndexer)
+                        .filter(type=amo.ADDON_WEBAPP,
+                                status=amo.STATUS_PUBLIC, is_disabled=False)
+                        .filter(f()).order_by('-popularity'))
+                body = json.dumps(srch._build_query())
+            took = time.time() - start
+            self.stdout.write('%s filter: %s bytes, built in %.2fms\n' %
+                              (mode, len(body), took * 1000 / requests))
+            if options['execute']:
+                start = time.time()
+                for i in xrange(requests):
+                    srch[:20].execute()
+                took = time.time() - start
+                self.stdout.write('%s filter: executed in %.2fms\n' %
+                                  (mode, took * 1000 / requests))
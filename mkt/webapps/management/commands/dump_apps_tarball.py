@@ -0,0 +1,57 @@
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from zadmin.models import set_config, unmemoized_get_config
+
+from mkt.webapps.tasks import dump_apps_tarball
+
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+LAST_DUMP = 'last_apps_dump'
+
+HELP = """\
+Dump the public apps into a tarball of DUMPED_APPS_PATH/tarballs, without
+going through celery nor writing a JSON file per app.
+
+Only dump the apps that changed since the last tarball, or a date:
+
+    `--since=last`
+    `--since="2013-05-01 00:00:00"`
+"""
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--since', action='store', type='string', dest='since',
+                    help='Only dump the apps that changed since then.'),
+        make_option('--processes', action='store', type='int',
+                    dest='processes', default=None,
+                    help='Number of processes dehydrating apps.'),
+    )
+
+    help = HELP
+
+    def handle(self, *args, **options):
+        since = options['since']
+        if since == 'last':
+            since = unmemoized_get_config(LAST_DUMP)
+            if not since:
+                raise CommandError('No tarball recorded yet, pass a date to '
+                                   '--since.')
+        if since:
+            for fmt in (DATE_FORMAT, '%Y-%m-%d'):
+                try:
+                    since = datetime.datetime.strptime(since, fmt)
+                    break
+                except ValueError:
+                    pass
+            else:
+                raise CommandError('Invalid date for --since: %r' % since)
+
+        started = datetime.datetime.now()
+        target = dump_apps_tarball(since=since,
+                                   processes=options['processes'])
+        set_config(LAST_DUMP, started.strftime(DATE_FORMAT))
+        self.stdout.write('Dumped the apps to %s\n' % target)
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import collections
+import contextlib
 import datetime
 import json
 import os
@@ -19,6 +21,7 @@ from django.utils.http import urlquote
 
 import commonware.log
 import waffle
+from django_statsd.clients import statsd
 from elasticutils.contrib.django import F, Indexable, MappingType, S
 from tower import ugettext as _
 
@@ -26,9 +29,10 @@ import amo
 import amo.models
 from access.acl import action_allowed, check_reviewer
 from addons import query
-from addons.models import (Addon, AddonDeviceType, attach_categories,
-                           attach_devices, attach_prices, attach_translations,
-                           Category, Flag,
+from addons.models import (Addon, AddonCategory, AddonDeviceType,
+                           AddonUpsell, AddonUser, attach_categories,
+                           attach_devices, attach_prices,
+                           attach_translations, Category, Flag, Preview,
                            update_search_index as amo_update_search_index)
 from addons.signals import version_changed
 from amo.decorators import skip_cache
@@ -41,9 +45,9 @@ from constants.applications import DEVICE_TYPES
 from files.models import File, nfd_str, Platform
 from files.utils import parse_addon, WebAppParser
 from lib.crypto import packaged
-from market.models import AddonPremium
-from stats.models import ClientData
+from market.models import AddonPremium, AddonPurchase
 from translations.fields import save_signal
+from users.models import UserProfile
 from versions.models import Version
 
 import mkt
@@ -187,8 +191,9 @@ class Webapp(Addon):
         """Attach everything we need to index apps."""
         transforms = (attach_categories, attach_devices, attach_prices,
                       attach_translations)
+        qs = apps
         for t in transforms:
-            qs = apps.transform(t)
+            qs = qs.transform(t)
         return qs
 
     def get_api_url(self, action=None, api=None, resource=None):
@@ -541,8 +546,8 @@ class Webapp(Addon):
             all_ids = mkt.regions.ALL_REGION_IDS
         else:
             all_ids = mkt.regions.REGION_IDS
-        excluded = list(self.addonexcludedregion
-                            .values_list('region', flat=True))
+        # Not a values_list(), to use the regions prefetched by the dumps.
+        excluded = [r.region for r in self.addonexcludedregion.all()]
         return sorted(list(set(all_ids) - set(excluded)))
 
     def get_regions(self):
@@ -595,7 +600,28 @@ class Webapp(Addon):
 
     @classmethod
     def get_excluded_in(cls, region):
-        """Return IDs of Webapp objects excluded from a particular region."""
+        """
+        Return IDs of Webapp objects excluded from a particular region.
+
+        They're cached for `EXCLUDED_REGIONS_CACHE_TIMEOUT` seconds, or until
+        an exclusion or a content flag changes.
+        """
+        timeout = settings.EXCLUDED_REGIONS_CACHE_TIMEOUT
+        if not timeout:
+            return cls._get_excluded_in(region)
+        version = cache.get(amo.EXCLUDED_REGIONS_KEYVERSION)
+        if version is None:
+            cache.add(amo.EXCLUDED_REGIONS_KEYVERSION, 1)
+            version = cache.get(amo.EXCLUDED_REGIONS_KEYVERSION)
+        key = amo.EXCLUDED_REGIONS_KEY % (version, region.id)
+        excluded = cache.get(key)
+        if excluded is None:
+            excluded = cls._get_excluded_in(region)
+            cache.set(key, excluded, timeout)
+        return excluded
+
+    @classmethod
+    def _get_excluded_in(cls, region):
         excluded = list(AddonExcludedRegion.objects.filter(region=region.id)
                         .values_list('addon', flat=True))
         q = models.Q()
@@ -608,7 +634,7 @@ class Webapp(Addon):
             excluded += list(Flag.objects.filter(q)
                              .values_list('addon', flat=True))
 
-        return list(set(excluded))
+        return sorted(set(excluded))
 
     @classmethod
     def from_search(cls, cat=None, region=None, gaia=False, mobile=False,
@@ -632,12 +658,17 @@ class Webapp(Addon):
         if cat:
             filters.update(category=cat.id)
 
-        if new_idx and waffle.switch_is_active('search-api-es'):
+        uses_es = new_idx and waffle.switch_is_active('search-api-es')
+        if uses_es:
             srch = S(WebappIndexer).filter(**filters)
         else:
             srch = TempS(cls).filter(**filters)
 
-        if region:
+        if (region and uses_es and
+            waffle.switch_is_active('search-region-exclusions')):
+            # The apps know the regions they're excluded from.
+            srch = srch.filter(~F(region_exclusions=region.id))
+        elif region:
             excluded = cls.get_excluded_in(region)
             if excluded:
                 log.info('Excluding the following IDs based on region %s: %s'
@@ -870,6 +901,15 @@ class Webapp(Addon):
         )
 
 
+@contextlib.contextmanager
+def _index_phase(timings, name):
+    start = time.time()
+    yield
+    took = time.time() - start
+    timings[name] = timings.get(name, 0) + took
+    statsd.timing('webapps.index.%s' % name, took * 1000)
+
+
 class WebappIndexer(MappingType, Indexable):
     """
     Mapping type for Webapp models.
@@ -975,6 +1015,7 @@ class WebappIndexer(MappingType, Indexable):
                             'count': {'type': 'short'},
                         }
                     },
+                    'region_exclusions': {'type': 'short'},
                     'status': {'type': 'byte'},
                     'support_email': {'type': 'string'},
                     'support_url': {'type': 'string'},
@@ -1008,22 +1049,126 @@ class WebappIndexer(MappingType, Indexable):
     def extract_document(cls, pk, obj=None):
         """Extracts the ElasticSearch index document for this instance."""
         if obj is None:
-            obj = cls.get_model().uncached.get(pk=pk)
+            docs = cls.extract_documents([pk])
+            if not docs:
+                raise Webapp.DoesNotExist(
+                    'Webapp matching query does not exist.')
+            return docs[0]
+        return cls.extract_documents([pk], objs=[obj])[0]
 
-        version = obj.current_version
-        try:
-            file_ = version and version.files.latest()
-        except ObjectDoesNotExist:
-            file_ = None
+    @classmethod
+    def extract_documents(cls, ids, objs=None, timings=None):
+        """
+        Extracts the ElasticSearch index documents of the apps `ids`, or of
+        `objs` if the apps are already loaded, in the same order.
 
+        Each relation is fetched once for all the apps with an `IN` query,
+        and the popularity by region with one grouped query. The seconds
+        each phase took go to statsd, and are added to `timings` if given.
+        """
+        timings = {} if timings is None else timings
+
+        with _index_phase(timings, 'apps'):
+            if objs is None:
+                objs = list(Webapp.indexing_transformer(
+                    Webapp.uncached.filter(id__in=ids)))
+            ids = [obj.id for obj in objs]
+        if not ids:
+            return []
+
+        with _index_phase(timings, 'versions'):
+            vids = filter(None, (obj._current_version_id for obj in objs))
+            versions = dict((v.id, v) for v in
+                            Version.uncached.filter(id__in=vids))
+            for obj in objs:
+                if obj._current_version_id in versions:
+                    obj._current_version = versions[obj._current_version_id]
+            # Apps without a current version yet look for one themselves.
+            current = dict((obj.id, obj.current_version) for obj in objs)
+            # Going up by date, the last file of a version is its latest.
+            files = dict((f.version_id, f) for f in
+                         File.uncached.filter(version__in=[
+                             v.id for v in current.values() if v])
+                         .order_by('created'))
+
+        with _index_phase(timings, 'installs'):
+            installs = dict(Installed.objects.no_cache()
+                            .filter(addon__in=ids).values_list('addon')
+                            .annotate(models.Count('id')))
+            region_installs = collections.defaultdict(dict)
+            qs = (Installed.objects.no_cache()
+                  .filter(addon__in=ids, client_data__region__isnull=False)
+                  .values_list('addon', 'client_data__region')
+                  .annotate(models.Count('id')))
+            for addon, region, count in qs:
+                region_installs[addon][region] = count
+
+        with _index_phase(timings, 'content_ratings'):
+            content_ratings = collections.defaultdict(dict)
+            for cr in ContentRating.objects.no_cache().filter(addon__in=ids):
+                content_ratings[cr.addon_id][cr.get_body().name] = {
+                    'name': cr.get_rating().name,
+                    'description': unicode(cr.get_rating().description)}
+
+        with _index_phase(timings, 'authors'):
+            authors = collections.defaultdict(list)
+            qs = (UserProfile.objects.no_cache()
+                  .filter(addons__in=ids, addonuser__listed=True)
+                  .extra(select={'addon_id': 'addons_users.addon_id',
+                                 'position': 'addons_users.position'}))
+            for user in sorted(qs, key=lambda u: (u.addon_id, u.position)):
+                authors[user.addon_id].append(user.name)
+            owners = collections.defaultdict(list)
+            qs = (AddonUser.objects.no_cache()
+                  .filter(addon__in=ids, role=amo.AUTHOR_ROLE_OWNER)
+                  .values_list('addon', 'user'))
+            for addon, user in qs:
+                owners[addon].append(user)
+
+        with _index_phase(timings, 'flags'):
+            flags = dict((f.addon_id, f) for f in
+                         Flag.objects.no_cache().filter(addon__in=ids))
+
+        with _index_phase(timings, 'previews'):
+            previews = collections.defaultdict(list)
+            for p in Preview.objects.no_cache().filter(addon__in=ids):
+                previews[p.addon_id].append(p)
+
+        with _index_phase(timings, 'region_exclusions'):
+            exclusions = collections.defaultdict(set)
+            qs = (AddonExcludedRegion.objects.no_cache()
+                  .filter(addon__in=ids).values_list('addon', 'region'))
+            for addon, region in qs:
+                exclusions[addon].add(region)
+
+        with _index_phase(timings, 'prices'):
+            prices = dict((ap.addon_id, ap.price.name if ap.price else None)
+                          for ap in AddonPremium.objects.no_cache()
+                          .filter(addon__in=ids).select_related('price'))
+
+        # The analyzers each locale is indexed with.
+        analyzers = collections.defaultdict(list)
+        for analyzer, languages in amo.SEARCH_ANALYZER_MAP.iteritems():
+            for language in languages:
+                analyzers[language].append(analyzer)
+
+        with _index_phase(timings, 'documents'):
+            docs = []
+            for obj in objs:
+                version = current[obj.id]
+                docs.append(cls._document(
+                    obj, version, version and files.get(version.id),
+                    installs.get(obj.id, 0), region_installs[obj.id],
+                    content_ratings[obj.id], authors[obj.id],
+                    owners[obj.id], flags.get(obj.id), previews[obj.id],
+                    prices.get(obj.id), exclusions[obj.id], analyzers))
+        return docs
+
+    @classmethod
+    def _document(cls, obj, version, file_, installed, region_installs,
+                  content_ratings, authors, owners, flag, previews,
+                  price_tier, exclusions, analyzers):
         translations = obj.translations
-        installed_ids = list(Installed.objects.filter(addon=obj)
-                             .values_list('id', flat=True))
-        content_ratings = dict(
-            (cr.get_body().name, {
-                'name': cr.get_rating().name,
-                'description': unicode(cr.get_rating().description)})
-            for cr in obj.content_ratings.all())
 
         attrs = ('app_slug', 'average_daily_users', 'bayesian_rating',
                  'created', 'id', 'is_disabled', 'last_updated',
@@ -1033,7 +1178,7 @@ class WebappIndexer(MappingType, Indexable):
 
         d['app_type'] = (amo.ADDON_WEBAPP_PACKAGED if obj.is_packaged else
                          amo.ADDON_WEBAPP_HOSTED)
-        d['authors'] = [a.name for a in obj.listed_authors]
+        d['authors'] = authors
         d['category'] = getattr(obj, 'category_ids', [])
         d['content_ratings'] = content_ratings if content_ratings else None
         if version:
@@ -1051,11 +1196,8 @@ class WebappIndexer(MappingType, Indexable):
         d['description'] = list(set(string for _, string
                                     in translations[obj.description_id]))
         d['device'] = getattr(obj, 'device_ids', [])
-        try:
-            d['flag_adult'] = obj.flag.adult_content
-            d['flag_child'] = obj.flag.child_content
-        except Flag.DoesNotExist:
-            d['flag_adult'] = d['flag_child'] = False
+        d['flag_adult'] = flag.adult_content if flag else False
+        d['flag_child'] = flag.child_content if flag else False
         d['has_public_stats'] = obj.public_stats
         # TODO: Store all localizations of homepage.
         d['homepage'] = unicode(obj.homepage) if obj.homepage else ''
@@ -1066,22 +1208,25 @@ class WebappIndexer(MappingType, Indexable):
         d['name'] = list(set(string for _, string
                              in translations[obj.name_id]))
         d['name_sort'] = unicode(obj.name).lower()
-        d['owners'] = [au.user.id for au in
-                       obj.addonuser_set.filter(role=amo.AUTHOR_ROLE_OWNER)]
-        d['popularity'] = d['_boost'] = len(installed_ids)
+        d['owners'] = owners
+        d['popularity'] = d['_boost'] = installed
         d['previews'] = [{'filetype': p.filetype,
                           'caption': unicode(p.caption),
                           'image_url': p.image_url,
                           'thumbnail_url': p.thumbnail_url}
-                         for p in obj.previews.all()]
-        try:
-            d['price_tier'] = obj.addonpremium.price.name
-        except AddonPremium.DoesNotExist:
-            d['price_tier'] = None
+                         for p in previews]
+        d['price_tier'] = price_tier
         d['ratings'] = {
             'average': obj.average_rating,
             'count': obj.total_reviews,
         }
+        # The regions the app is excluded from, see `get_excluded_in`.
+        exclusions = set(exclusions)
+        if flag and flag.adult_content:
+            exclusions.update(regions.ADULT_EXCLUDED_IDS)
+        if flag and flag.child_content:
+            exclusions.update(regions.CHILD_EXCLUDED_IDS)
+        d['region_exclusions'] = sorted(exclusions)
         d['support_email'] = (unicode(obj.support_email)
                               if obj.support_email else None)
         d['support_url'] = (unicode(obj.support_url)
@@ -1089,32 +1234,30 @@ class WebappIndexer(MappingType, Indexable):
 
         # Calculate regional popularity for "mature regions"
         # (installs + reviews/installs from that region).
-        installs = dict(ClientData.objects.filter(installed__in=installed_ids)
-                        .annotate(region_counts=models.Count('region'))
-                        .values_list('region', 'region_counts').distinct())
         for region in mkt.regions.ALL_REGION_IDS:
-            cnt = installs.get(region, 0)
+            cnt = region_installs.get(region, 0)
             if cnt:
                 # Magic number (like all other scores up in this piece).
                 d['popularity_%s' % region] = d['popularity'] + cnt * 10
             else:
-                d['popularity_%s' % region] = len(installed_ids)
+                d['popularity_%s' % region] = installed
             d['_boost'] += cnt * 10
 
         # Bump the boost if the add-on is public.
         if obj.status == amo.STATUS_PUBLIC:
             d['_boost'] = max(d['_boost'], 1) * 4
 
-        # Indices for each language. languages is a list of locales we want to
-        # index with analyzer if the string's locale matches.
-        for analyzer, languages in amo.SEARCH_ANALYZER_MAP.iteritems():
-            d['name_' + analyzer] = list(
-                set(string for locale, string in translations[obj.name_id]
-                    if locale.lower() in languages))
-            d['description_' + analyzer] = list(
-                set(string for locale, string
-                    in translations[obj.description_id]
-                    if locale.lower() in languages))
+        # Indices for each language. `analyzers` has the analyzers we want
+        # to index a string with for its locale.
+        for field, id_ in (('name', obj.name_id),
+                           ('description', obj.description_id)):
+            strings = dict((analyzer, set())
+                           for analyzer in amo.SEARCH_ANALYZER_MAP)
+            for locale, string in translations[id_]:
+                for analyzer in analyzers.get(locale.lower(), []):
+                    strings[analyzer].add(string)
+            for analyzer, values in strings.iteritems():
+                d['%s_%s' % (field, analyzer)] = list(values)
 
         return d
 
@@ -1244,6 +1387,38 @@ def add_uuid(sender, **kw):
             install.save()
 
 
+def invalidate_verify_cache(addon_id, user_id):
+    """
+    Drop what services/verify.py cached about the installs of the app by the
+    user, so the next verification of their receipts sees a refund or a
+    purchase straight away.
+    """
+    uuids = (Installed.objects.no_cache()
+             .filter(addon=addon_id, user=user_id)
+             .values_list('uuid', flat=True))
+    keys = [amo.verify_key(addon_id, uuid) for uuid in uuids if uuid]
+    if keys:
+        cache.delete_many(keys)
+
+
+@receiver(dbsignals.post_save, sender=Installed,
+          dispatch_uid='installed_verify_cache')
+@receiver(dbsignals.post_delete, sender=Installed,
+          dispatch_uid='installed_verify_cache_delete')
+def installed_verify_cache(sender, instance, **kw):
+    if not kw.get('raw') and instance.uuid:
+        cache.delete(amo.verify_key(instance.addon_id, instance.uuid))
+
+
+@receiver(dbsignals.post_save, sender=AddonPurchase,
+          dispatch_uid='purchase_verify_cache')
+@receiver(dbsignals.post_delete, sender=AddonPurchase,
+          dispatch_uid='purchase_verify_cache_delete')
+def purchase_verify_cache(sender, instance, **kw):
+    if not kw.get('raw'):
+        invalidate_verify_cache(instance.addon_id, instance.user_id)
+
+
 class AddonExcludedRegion(amo.models.ModelBase):
     """
     Apps are listed in all regions by default.
@@ -1266,6 +1441,31 @@ class AddonExcludedRegion(amo.models.ModelBase):
         return mkt.regions.REGIONS_CHOICES_ID_DICT.get(self.region)
 
 
+def invalidate_excluded_regions(sender, instance, **kw):
+    """
+    Bump the generation of the ids cached by `Webapp.get_excluded_in`, and
+    reindex the app, its `region_exclusions` changed.
+    """
+    if kw.get('raw'):
+        return
+    cache.add(amo.EXCLUDED_REGIONS_KEYVERSION, 1)
+    cache.incr(amo.EXCLUDED_REGIONS_KEYVERSION)
+    if (waffle.switch_is_active('search-api-es') and
+        Webapp.objects.filter(id=instance.addon_id).exists()):
+        from . import tasks
+        tasks.index_webapps.delay([instance.addon_id])
+
+
+for _sender in (AddonExcludedRegion, Flag):
+    dbsignals.post_save.connect(invalidate_excluded_regions, sender=_sender,
+                                dispatch_uid='excluded_regions_%s' %
+                                _sender._meta.db_table)
+    dbsignals.post_delete.connect(invalidate_excluded_regions,
+                                  sender=_sender,
+                                  dispatch_uid='excluded_regions_%s' %
+                                  _sender._meta.db_table)
+
+
 class ContentRating(amo.models.ModelBase):
     """
     Ratings body information about an app.
@@ -1293,6 +1493,33 @@ class ContentRating(amo.models.ModelBase):
         return u'%s - %s' % (self.get_body().name, self.get_rating().name)
 
 
+def touch_apps(sender, instance, **kw):
+    """
+    Bump the `modified` of the apps `instance` is part of, so that
+    `changed_addons` finds them: they are dumped and indexed along with it,
+    see `dump_apps_tarball`.
+    """
+    if kw.get('raw'):
+        return
+    ids = [getattr(instance, f, None)
+           for f in ('addon_id', 'free_id', 'premium_id')]
+    ids = [id for id in ids if id]
+    if ids:
+        # Only apps are dumped, leave the other add-ons alone.
+        Addon.with_deleted.filter(id__in=ids, type=amo.ADDON_WEBAPP).update(
+            modified=datetime.datetime.now())
+
+
+for _sender in (Preview, AddonCategory, AddonExcludedRegion, ContentRating,
+                AddonUpsell):
+    dbsignals.post_save.connect(touch_apps, sender=_sender,
+                                dispatch_uid='touch_apps_%s' %
+                                _sender._meta.db_table)
+    dbsignals.post_delete.connect(touch_apps, sender=_sender,
+                                  dispatch_uid='touch_apps_%s' %
+                                  _sender._meta.db_table)
+
+
 # The AppFeatures table is created with dynamic fields based on
 # mkt.constants.features, which requires some setup work before we call `type`.
 class AppFeaturesBase(amo.models.ModelBase):
@@ -1,16 +1,28 @@
+import collections
 import datetime
 import hashlib
+import itertools
 import json
 import logging
 import os
+import StringIO
 import subprocess
+import tarfile
+import threading
+import time
+import urlparse
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.storage import default_storage as storage
+from django.db import connection
 from django.template import Context, loader
 
 from celery.exceptions import RetryTaskError
 from celeryutils import task
+from django_statsd.clients import statsd
 from pyelasticsearch.exceptions import ElasticHttpNotFoundError
 from test_utils import RequestFactory
 
@@ -25,7 +37,7 @@ from lib.es.utils import get_indices
 from users.utils import get_task_user
 
 from mkt.constants.regions import WORLDWIDE
-from mkt.developers.tasks import _fetch_manifest, validator
+from mkt.developers.tasks import _fetch_manifest, NotModified, validator
 from mkt.webapps.models import Webapp, WebappIndexer
 from mkt.webapps.utils import get_locale_properties
 
@@ -69,6 +81,121 @@ def _open_manifest(webapp, file_):
         _log(webapp, u'JSON decoding error', exc_info=True)
 
 
+class ManifestFetcher(object):
+    """
+    Fetch the manifests of hosted apps in a pool of `threads` threads, with
+    at most `per_host` requests to the same host at once, so that a slow
+    origin only holds up its own apps.
+
+    The ETag and Last-Modified of the manifests are kept in the cache and
+    sent along, manifests that didn't change come back as a 304 without
+    being downloaded, hashed or validated. Failed fetches are tried again up
+    to `retries` times, waiting longer every time. The throughput and the
+    latency of the slowest hosts go to the log, every fetch to statsd.
+    """
+
+    def __init__(self, threads=None, per_host=None, retries=None):
+        self.threads = threads or settings.MANIFEST_FETCH_THREADS
+        self.per_host = per_host or settings.MANIFEST_FETCH_PER_HOST
+        self.retries = retries if retries is not None else \
+            settings.MANIFEST_FETCH_RETRIES
+        self.lock = threading.Lock()
+        self.hosts = {}
+        self.latencies = {}
+
+    def fetch_all(self, apps, conditional=True):
+        """
+        Fetch the manifests of `apps`, a list of (id, manifest_url). Returns
+        {id: (content, validators)}, where `content` is the exception the
+        fetch failed with, NotModified included, or the manifest. The
+        `validators` are to be saved once the manifest is taken in.
+        """
+        keys = dict((id, amo.MANIFEST_VALIDATORS_KEY % id) for id, url in apps)
+        stored = cache.get_many(keys.values()) if conditional else {}
+        jobs = []
+        for id, url in apps:
+            validators = stored.get(keys[id]) or {}
+            if validators.get('url') != url:
+                validators = {}
+            jobs.append((id, url, dict(validators, url=url)))
+
+        start = time.time()
+        if self.threads > 1 and len(jobs) > 1:
+            pool = ThreadPool(min(self.threads, len(jobs)))
+            try:
+                results = pool.map(self.fetch, self.interleave(jobs),
+                                   chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(self.fetch, jobs)
+        self.report(len(jobs), time.time() - start)
+        return dict(results)
+
+    def interleave(self, jobs):
+        """
+        Order the jobs round-robin over their hosts, so that threads don't
+        pile up waiting on the same host.
+        """
+        by_host = collections.OrderedDict()
+        for job in jobs:
+            host = urlparse.urlparse(job[1]).netloc
+            by_host.setdefault(host, []).append(job)
+        return [job for row in itertools.izip_longest(*by_host.values())
+                for job in row if job]
+
+    def get_host(self, url):
+        host = urlparse.urlparse(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = threading.Semaphore(self.per_host)
+                self.latencies[host] = []
+        return host
+
+    def fetch(self, job):
+        id, url, validators = job
+        host = self.get_host(url)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(2 ** (attempt - 1))
+            with self.hosts[host]:
+                start = time.time()
+                try:
+                    content = _fetch_manifest(url, validators=validators)
+                    return id, (content, validators)
+                except NotModified, e:
+                    statsd.incr('webapps.update_manifests.not_modified')
+                    return id, (e, validators)
+                except Exception, e:
+                    error = e
+                    _log(id, u'Attempt %s to fetch %s failed' %
+                         (attempt + 1, url), exc_info=True)
+                finally:
+                    took = (time.time() - start) * 1000
+                    self.latencies[host].append(took)
+                    statsd.timing('webapps.update_manifests.fetch', took)
+        return id, (error, validators)
+
+    def report(self, count, took, slowest=5):
+        task_log.info('Fetched %s manifests in %.2fs (%.0f manifests/min).' %
+                      (count, took, count * 60 / took if took else 0))
+        hosts = sorted(((sorted(times)[len(times) // 2], host, times)
+                        for host, times in self.latencies.items() if times),
+                       reverse=True)
+        for median, host, times in hosts[:slowest]:
+            task_log.info('%s: %s requests, p50 %.0fms, max %.0fms.' %
+                          (host, len(times), median, max(times)))
+
+
+def _save_validators(webapp, validators, hash_):
+    """Keep the validators of a manifest once its content is taken in."""
+    if validators and (validators.get('etag') or
+                       validators.get('last_modified')):
+        cache.set(amo.MANIFEST_VALIDATORS_KEY % webapp.pk,
+                  dict(validators, hash=hash_), 60 * 60 * 24 * 30)
+
+
 @task
 @write
 def update_manifests(ids, **kw):
@@ -81,23 +208,43 @@ def update_manifests(ids, **kw):
     # we'll need to log in as user.
     amo.set_user(get_task_user())
 
+    # Manifests are only fetched again if they changed when their hash is
+    # checked.
+    apps = Webapp.objects.filter(pk__in=ids).values_list('pk', 'manifest_url')
+    fetched = ManifestFetcher().fetch_all(list(apps), conditional=check_hash)
     for id in ids:
-        _update_manifest(id, check_hash, retries)
-    if retries:
+        _update_manifest(id, check_hash, retries, fetched.get(id))
+
+    # The apps that failed are retried later every time they fail again.
+    failures = {}
+    for id, count in retries.items():
+        failures.setdefault(count, []).append(id)
+    for count, failed in sorted(failures.items()):
+        secs = retry_secs * 2 ** (count - 1)
         try:
-            update_manifests.retry(args=(retries.keys(),),
+            # Called directly, the task raises RetryTaskError whatever
+            # `throw` is, without retrying anything.
+            update_manifests.retry(args=(failed,),
                                    kwargs={'check_hash': check_hash,
-                                           'retries': retries},
+                                           'retries': dict.fromkeys(failed,
+                                                                    count)},
                                    eta=datetime.datetime.now() +
-                                       datetime.timedelta(seconds=retry_secs),
-                                   max_retries=4)
+                                       datetime.timedelta(seconds=secs),
+                                   max_retries=4, throw=False)
         except RetryTaskError:
-            _log(id, 'Retrying task in %d seconds.' % retry_secs)
+            pass
+        _log(', '.join(map(str, failed)),
+             'Retrying task in %d seconds.' % secs)
 
     return retries
 
 
-def _update_manifest(id, check_hash, failed_fetches):
+def _update_manifest(id, check_hash, failed_fetches, fetched=None):
+    """
+    Update the manifest of the app `id`. `fetched` is what
+    `ManifestFetcher.fetch_all` got for it, the manifest is fetched here if
+    not given.
+    """
     webapp = Webapp.objects.get(pk=id)
     version = webapp.versions.latest()
     file_ = version.files.latest()
@@ -107,28 +254,46 @@ def _update_manifest(id, check_hash, failed_fetches):
         _log(webapp, u'Ignoring, no existing file')
         return
 
-    # Fetch manifest, catching and logging any exception.
-    try:
-        content = _fetch_manifest(webapp.manifest_url)
-    except Exception, e:
+    content, validators = fetched or (None, None)
+    if isinstance(content, NotModified):
+        if validators.get('hash') == file_.hash:
+            _log(webapp, u'Manifest not modified')
+            return
+        # The manifest changed some other way since the validators were
+        # saved, take all of it again.
+        content = None
+
+    if content is None:
+        validators = {'url': webapp.manifest_url}
+        try:
+            content = _fetch_manifest(webapp.manifest_url,
+                                      validators=validators)
+        except Exception, e:
+            _log(webapp, u'Failed to fetch %s' % webapp.manifest_url,
+                 exc_info=True)
+            content = e
+
+    # Log any exception the fetch failed with.
+    if isinstance(content, Exception):
         msg = u'Failed to get manifest from %s. Error: %s' % (
-            webapp.manifest_url, e)
+            webapp.manifest_url, content)
         failed_fetches[id] = failed_fetches.get(id, 0) + 1
         if failed_fetches[id] >= 3:
-            _log(webapp, msg, rereview=True, exc_info=True)
+            _log(webapp, msg, rereview=True)
             if webapp.status in amo.WEBAPPS_APPROVED_STATUSES:
                 RereviewQueue.flag(webapp, amo.LOG.REREVIEW_MANIFEST_CHANGE,
                                    msg)
             del failed_fetches[id]
         else:
-            _log(webapp, msg, rereview=False, exc_info=True)
+            _log(webapp, msg, rereview=False)
         return
 
     # Check hash.
+    hash_ = _get_content_hash(content)
     if check_hash:
-        hash_ = _get_content_hash(content)
         if file_.hash == hash_:
             _log(webapp, u'Manifest the same')
+            _save_validators(webapp, validators, hash_)
             return
         _log(webapp, u'Manifest different')
 
@@ -164,6 +329,7 @@ def _update_manifest(id, check_hash, failed_fetches):
     # New manifest is different and validates, update version/file.
     try:
         webapp.manifest_updated(content, upload)
+        _save_validators(webapp, validators, hash_)
     except:
         _log(webapp, u'Failed to create version', exc_info=True)
 
@@ -260,11 +426,9 @@ def index_webapps(ids, **kw):
     indices = get_indices(index)
 
     es = WebappIndexer.get_es(urls=settings.ES_URLS)
-    qs = Webapp.indexing_transformer(Webapp.uncached.filter(id__in=ids))
-    for obj in qs:
-        doc = WebappIndexer.extract_document(obj.id, obj)
+    for doc in WebappIndexer.extract_documents(ids):
         for idx in indices:
-            WebappIndexer.index(doc, id_=obj.id, es=es, index=idx)
+            WebappIndexer.index(doc, id_=doc['id'], es=es, index=idx)
 
 
 @task(acks_late=True)
@@ -345,3 +509,115 @@ def zip_apps(*args, **kw):
     task_log.info(u'Creating app dump {0}'.format(target_file))
     subprocess.call(cmd)
     return target_file
+
+
+# What the API dehydrates for every app, looked up once per chunk of apps.
+DUMP_PREFETCH = ('_upsell_from', 'addonexcludedregion', 'categories',
+                 'content_ratings', 'image_assets', 'previews')
+
+
+def _dehydrate_apps(ids):
+    """
+    Return (id, json) of the apps `ids`, like `dump_app` dumps them but all
+    dehydrated together.
+    """
+    from mkt.api.resources import AppResource
+    req = RequestFactory().get('/')
+    req.REGION = WORLDWIDE
+    apps = list(Webapp.objects.no_cache().filter(pk__in=ids)
+                .prefetch_related(*DUMP_PREFETCH))
+    data = AppResource().dehydrate_objects(apps, request=req)
+    return [(app.id, json.dumps(d, cls=JSONEncoder))
+            for app, d in zip(apps, data)]
+
+
+def _add_to_tarball(tar, name, content):
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    info.mtime = time.time()
+    tar.addfile(info, StringIO.StringIO(content))
+
+
+# The dates in the names of the incremental tarballs.
+INCREMENTAL_FORMAT = '%Y-%m-%d-%H%M%S'
+
+
+def dump_apps_tarball(since=None, processes=None, chunk_size=100):
+    """
+    Dump the public apps straight into a tarball, in the layout `zip_apps`
+    gives them: no JSON file gets written on the way. The apps are
+    dehydrated `chunk_size` at a time, in a pool of `processes` processes.
+
+    With `since`, only the apps that changed since then are dumped, and the
+    ids of those that aren't public anymore go in deleted.json. Those
+    tarballs are named after the range they cover.
+    """
+    # Circular import.
+    from addons.cron import changed_addons
+
+    processes = processes or settings.DUMPED_APPS_PROCESSES
+    now = datetime.datetime.now()
+    today = now.strftime('%Y-%m-%d')
+    target_dir = os.path.join(settings.DUMPED_APPS_PATH, 'tarballs')
+    if since:
+        # Several of them can be made in a day, each covers its own range.
+        name = '%s-to-%s-incremental.tgz' % (
+            since.strftime(INCREMENTAL_FORMAT),
+            now.strftime(INCREMENTAL_FORMAT))
+    else:
+        name = today + '.tgz'
+    target_file = os.path.join(target_dir, name)
+    if not os.path.exists(target_dir):
+        os.makedirs(target_dir)
+
+    ids = list(Webapp.objects.filter(status=amo.STATUS_PUBLIC)
+                             .values_list('id', flat=True).order_by('id'))
+    deleted = []
+    if since:
+        changed = changed_addons(since, addon_type=amo.ADDON_WEBAPP)
+        deleted = sorted(changed.difference(ids))
+        ids = [id for id in ids if id in changed]
+
+    task_log.info(u'Dumping {0} apps to {1}'.format(len(ids), target_file))
+    start = time.time()
+    pool = None
+    if processes > 1 and len(ids) > chunk_size:
+        # Each process opens its own database and cache connections, not
+        # copies of these ones.
+        connection.close()
+        if hasattr(cache, 'close'):
+            cache.close()
+        pool = Pool(processes)
+    # Written next to the target, which only shows up once it's complete.
+    tmp = target_file + '.tmp'
+    try:
+        with tarfile.open(tmp, 'w:gz') as tar:
+            chunks = chunked(ids, chunk_size)
+            dumped = (pool.imap(_dehydrate_apps, chunks) if pool
+                      else itertools.imap(_dehydrate_apps, chunks))
+            for chunk in dumped:
+                for id, data in chunk:
+                    _add_to_tarball(tar, 'apps/%s/%s.json' % (id / 1000, id),
+                                    data)
+
+            if since:
+                _add_to_tarball(tar, 'deleted.json', json.dumps(deleted))
+            context = Context({'date': today, 'url': settings.SITE_URL})
+            for f in ['license.txt', 'readme.txt']:
+                template = loader.get_template('webapps/dump/' + f)
+                _add_to_tarball(tar, f,
+                                template.render(context).encode('utf-8'))
+        os.rename(tmp, target_file)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    took = time.time() - start
+    task_log.info(u'Dumped {0} apps in {1:.2f}s ({2:.0f} apps/sec).'.format(
+        len(ids), took, len(ids) / took if took else 0))
+    return target_file
@@ -10,6 +10,7 @@ from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.core.files.storage import default_storage as storage
+from django.db import connection
 from django.db.models.signals import post_delete, post_save
 
 import mock
@@ -19,8 +20,8 @@ from nose.tools import eq_, raises
 
 import amo
 from addons.models import (Addon, AddonCategory, AddonDeviceType,
-                           BlacklistedSlug, Category, Flag, Preview,
-                           version_changed)
+                           AddonUpsell, BlacklistedSlug, Category, Flag,
+                           Preview, version_changed)
 from addons.signals import version_changed as version_changed_signal
 from amo.helpers import absolutify
 from amo.tests import app_factory, version_factory
@@ -38,8 +39,10 @@ import mkt
 from mkt.constants import APP_FEATURES, apps
 from mkt.site.fixtures import fixture
 from mkt.submit.tests.test_views import BasePackagedAppTest, BaseWebAppTest
-from mkt.webapps.models import (AddonExcludedRegion, AppFeatures, Installed,
-                                Webapp)
+from mkt.webapps.models import (AddonExcludedRegion, AppFeatures,
+                                ContentRating, Installed, Webapp,
+                                WebappIndexer)
+from stats.models import ClientData
 
 
 class TestWebapp(amo.tests.TestCase):
@@ -441,6 +444,46 @@ class TestWebapp(amo.tests.TestCase):
         Flag.objects.create(addon=app2, adult_content=True)
         eq_(Webapp.get_excluded_in(region), [app1.id, app2.id])
 
+    @mock.patch.object(settings, 'EXCLUDED_REGIONS_CACHE_TIMEOUT', 60)
+    def test_excluded_in_cached(self):
+        app1 = app_factory()
+        app2 = app_factory()
+        region = list(mkt.regions.ADULT_EXCLUDED)[0]
+        AddonExcludedRegion.objects.create(addon=app1, region=region.id)
+        eq_(Webapp.get_excluded_in(region), [app1.id])
+        with self.assertNumQueries(0):
+            eq_(Webapp.get_excluded_in(region), [app1.id])
+
+        flag = Flag.objects.create(addon=app2, adult_content=True)
+        eq_(Webapp.get_excluded_in(region), [app1.id, app2.id])
+        flag.delete()
+        eq_(Webapp.get_excluded_in(region), [app1.id])
+        AddonExcludedRegion.objects.filter(addon=app1).delete()
+        eq_(Webapp.get_excluded_in(region), [])
+
+    @mock.patch('mkt.webapps.tasks.index_webapps')
+    def test_excluded_in_reindexes(self, index_webapps):
+        self.create_switch('search-api-es')
+        app = app_factory()
+        AddonExcludedRegion.objects.create(addon=app, region=mkt.regions.BR.id)
+        index_webapps.delay.assert_called_with([app.id])
+
+    @mock.patch.object(Webapp, 'get_excluded_in')
+    def test_from_search_region_exclusions(self, get_excluded_in):
+        get_excluded_in.return_value = [1234]
+        self.create_switch('search-api-es')
+        query = json.dumps(Webapp.from_search(region=mkt.regions.BR,
+                                              new_idx=True)._build_query())
+        assert get_excluded_in.called
+        assert 'region_exclusions' not in query
+
+        get_excluded_in.reset_mock()
+        self.create_switch('search-region-exclusions')
+        query = json.dumps(Webapp.from_search(region=mkt.regions.BR,
+                                              new_idx=True)._build_query())
+        assert not get_excluded_in.called
+        assert 'region_exclusions' in query
+
     def test_supported_locale_property(self):
         app = app_factory()
         app.versions.latest().update(supported_locales='de,fr', _signal=False)
@@ -792,6 +835,91 @@ class TestTransformer(amo.tests.TestCase):
             eq_(webapp.device_types, [])
 
 
+class TestWebappIndexer(amo.tests.TestCase):
+    fixtures = ['webapps/337141-steamcube']
+
+    def setUp(self):
+        self.app = Webapp.objects.get(pk=337141)
+        self.other = amo.tests.app_factory()
+        self.br = ClientData.objects.create(region=mkt.regions.BR.id)
+        self.us = ClientData.objects.create(region=mkt.regions.US.id)
+
+    def install(self, app, client_data=None):
+        user = UserProfile.objects.create(email='%s@f.com' % uuid.uuid4())
+        Installed.objects.create(addon=app, user=user,
+                                 client_data=client_data)
+
+    def test_same_as_one_by_one(self):
+        self.install(self.app, self.br)
+        self.install(self.other)
+        docs = WebappIndexer.extract_documents([self.other.id, self.app.id])
+        eq_(sorted(d['id'] for d in docs), [self.app.id, self.other.id])
+        for doc in docs:
+            eq_(doc, WebappIndexer.extract_document(doc['id']))
+
+    def test_missing(self):
+        with self.assertRaises(Webapp.DoesNotExist):
+            WebappIndexer.extract_document(self.app.id + self.other.id)
+
+    def test_popularity(self):
+        self.install(self.app, self.br)
+        self.install(self.app, self.br)
+        self.install(self.app, self.us)
+        self.install(self.app)
+        self.install(self.other, self.br)
+        doc = WebappIndexer.extract_document(self.app.id)
+        eq_(doc['popularity'], 4)
+        eq_(doc['popularity_%s' % mkt.regions.BR.id], 4 + 2 * 10)
+        eq_(doc['popularity_%s' % mkt.regions.US.id], 4 + 10)
+        eq_(doc['popularity_%s' % mkt.regions.UK.id], 4)
+
+    def test_categories(self):
+        cat = Category.objects.create(type=amo.ADDON_WEBAPP, slug='games')
+        AddonCategory.objects.create(addon=self.app, category=cat)
+        doc = WebappIndexer.extract_document(self.app.id)
+        eq_(doc['category'], [cat.id])
+
+    def test_region_exclusions(self):
+        AddonExcludedRegion.objects.create(addon=self.app,
+                                           region=mkt.regions.BR.id)
+        Flag.objects.create(addon=self.app, child_content=True)
+        doc = WebappIndexer.extract_document(self.app.id)
+        eq_(doc['region_exclusions'],
+            sorted(set([mkt.regions.BR.id]) |
+                   set(mkt.regions.CHILD_EXCLUDED_IDS)))
+        eq_(WebappIndexer.extract_document(self.other.id)
+            ['region_exclusions'], [])
+
+    def test_owners(self):
+        doc = WebappIndexer.extract_document(self.app.id)
+        eq_(doc['owners'], [au.user_id for au in self.app.addonuser_set
+                            .filter(role=amo.AUTHOR_ROLE_OWNER)])
+        eq_(doc['authors'], [u.name for u in self.app.listed_authors])
+
+    def count_queries(self, ids):
+        connection.use_debug_cursor = True
+        try:
+            before = len(connection.queries)
+            WebappIndexer.extract_documents(ids)
+            return len(connection.queries) - before
+        finally:
+            connection.use_debug_cursor = None
+
+    def test_queries_per_batch(self):
+        for app in (self.app, self.other):
+            self.install(app, self.br)
+        ids = [self.app.id, self.other.id]
+        more = [amo.tests.app_factory().id for i in range(3)]
+        eq_(self.count_queries(ids + more), self.count_queries(ids))
+
+    def test_timings(self):
+        timings = {}
+        WebappIndexer.extract_documents([self.app.id], timings=timings)
+        eq_(sorted(timings), ['apps', 'authors', 'content_ratings',
+                              'documents', 'flags', 'installs', 'prices',
+                              'previews', 'region_exclusions', 'versions'])
+
+
 class TestIsComplete(amo.tests.TestCase):
 
     def setUp(self):
@@ -854,6 +982,54 @@ class TestAddonExcludedRegion(amo.tests.WebappTestCase):
         eq_(unicode(self.er), '%s: %s' % (self.app, mkt.regions.UK.slug))
 
 
+class TestTouchApps(amo.tests.WebappTestCase):
+
+    def setUp(self):
+        super(TestTouchApps, self).setUp()
+        self.old = datetime.now() - timedelta(days=1)
+        Addon.objects.filter(pk=self.app.pk).update(modified=self.old)
+
+    def modified(self):
+        return Addon.objects.no_cache().get(pk=self.app.pk).modified
+
+    def test_preview(self):
+        preview = Preview.objects.create(addon=self.app)
+        assert self.modified() > self.old
+        Addon.objects.filter(pk=self.app.pk).update(modified=self.old)
+        preview.delete()
+        assert self.modified() > self.old
+
+    def test_category(self):
+        cat = Category.objects.create(slug='games', type=amo.ADDON_WEBAPP)
+        AddonCategory.objects.create(addon=self.app, category=cat)
+        assert self.modified() > self.old
+
+    def test_excluded_region(self):
+        AddonExcludedRegion.objects.create(addon=self.app,
+                                           region=mkt.regions.BR.id)
+        assert self.modified() > self.old
+
+    def test_content_rating(self):
+        ContentRating.objects.create(addon=self.app, ratings_body=0,
+                                     rating=2)
+        assert self.modified() > self.old
+
+    def test_not_app(self):
+        addon = Addon.objects.create(type=amo.ADDON_EXTENSION)
+        Addon.objects.filter(pk=addon.pk).update(modified=self.old)
+        Preview.objects.create(addon=addon)
+        modified = Addon.objects.no_cache().get(pk=addon.pk).modified
+        assert modified < self.old + timedelta(minutes=1)
+
+    def test_upsell(self):
+        premium = app_factory()
+        Addon.objects.filter(pk=premium.pk).update(modified=self.old)
+        AddonUpsell.objects.create(free=self.app, premium=premium)
+        assert self.modified() > self.old
+        assert (Addon.objects.no_cache().get(pk=premium.pk).modified >
+                self.old)
+
+
 class TestIsVisible(amo.tests.WebappTestCase):
     fixtures = amo.tests.WebappTestCase.fixtures + ['base/users']
 
@@ -3,17 +3,21 @@ import datetime
 import json
 import os
 import stat
+import tarfile
+import urllib2
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.storage import default_storage as storage
 from django.core.management import call_command
+from django.core.management.base import CommandError
 
 import mock
 from nose.tools import eq_, ok_
 
 import amo
 import amo.tests
-from addons.models import Addon
+from addons.models import Addon, Preview
 from devhub.models import ActivityLog
 from editors.models import RereviewQueue
 from files.models import File, FileUpload
@@ -22,7 +26,8 @@ from versions.models import Version
 
 from mkt.site.fixtures import fixture
 from mkt.webapps.models import Webapp
-from mkt.webapps.tasks import dump_app, update_manifests, zip_apps
+from mkt.webapps.tasks import (dump_app, dump_apps_tarball, ManifestFetcher,
+                               update_manifests, zip_apps)
 
 
 original = {
@@ -247,6 +252,61 @@ class TestUpdateManifest(amo.tests.TestCase):
         assert not retry.called
         assert RereviewQueue.objects.filter(addon=self.addon).exists()
 
+    @mock.patch('mkt.webapps.tasks._fetch_manifest')
+    @mock.patch('mkt.webapps.tasks.update_manifests.retry')
+    def test_manifest_fetch_fail_backoff(self, retry, fetch):
+        later = datetime.datetime.now() + datetime.timedelta(seconds=7200)
+        fetch.side_effect = RuntimeError
+        update_manifests(ids=(self.addon.pk,), retries={self.addon.pk: 1})
+        eq_(retry.call_args[1]['kwargs']['retries'], {self.addon.pk: 2})
+        self.assertCloseToNow(retry.call_args[1]['eta'], later)
+
+    @mock.patch('mkt.webapps.tasks._fetch_manifest')
+    def test_manifest_fetch_fail_called_directly(self, fetch):
+        # The developer edit view runs the task synchronously.
+        fetch.side_effect = RuntimeError
+        eq_(update_manifests(ids=(self.addon.pk,)), {self.addon.pk: 1})
+
+    def set_validators(self, **kw):
+        self.addon.update(manifest_url='http://ballin.com/manifest.webapp')
+        validators = {'url': self.addon.manifest_url, 'etag': '"abc"',
+                      'last_modified': None, 'hash': ohash}
+        validators.update(kw)
+        cache.set(amo.MANIFEST_VALIDATORS_KEY % self.addon.pk, validators)
+
+    def test_save_validators(self):
+        self.response_mock.headers['ETag'] = '"abc"'
+        self._hash = ohash
+        self._run()
+        validators = cache.get(amo.MANIFEST_VALIDATORS_KEY % self.addon.pk)
+        eq_(validators['etag'], '"abc"')
+        eq_(validators['hash'], ohash)
+
+    def test_not_modified(self):
+        self.set_validators()
+        self.urlopen_mock.side_effect = urllib2.HTTPError(
+            'url', 304, 'Not Modified', {}, None)
+        self._run()
+        request = self.urlopen_mock.call_args[0][0]
+        eq_(request.get_header('If-none-match'), '"abc"')
+        eq_(FileUpload.objects.count(), 0)
+        eq_(RereviewQueue.objects.count(), 0)
+
+    def test_not_modified_other_hash(self):
+        # The file changed since, the manifest is taken in again.
+        self.set_validators(hash=nhash)
+        self.urlopen_mock.side_effect = [
+            urllib2.HTTPError('url', 304, 'Not Modified', {}, None),
+            self.response_mock]
+        self._run()
+        eq_(self.urlopen_mock.call_count, 2)
+        eq_(FileUpload.objects.count(), 1)
+
+    def test_no_validators_without_check_hash(self):
+        self.set_validators()
+        self._run(check_hash=False)
+        eq_(self.urlopen_mock.call_args[0][0], self.addon.manifest_url)
+
     @mock.patch('mkt.webapps.tasks._open_manifest')
     def test_manifest_name_change_rereview(self, open_manifest):
         # Mock original manifest file lookup.
@@ -397,6 +457,58 @@ class TestUpdateManifest(amo.tests.TestCase):
         eq_(ver.supported_locales, 'de,es,fr')
 
 
+class TestManifestFetcher(amo.tests.TestCase):
+
+    def setUp(self):
+        self.apps = [(1, 'http://a.com/manifest.webapp'),
+                     (2, 'http://a.com/other.webapp'),
+                     (3, 'http://b.com/manifest.webapp')]
+
+    @mock.patch('mkt.webapps.tasks._fetch_manifest')
+    def test_fetch_all(self, fetch):
+        fetch.side_effect = lambda url, validators: url
+        fetched = ManifestFetcher(threads=3).fetch_all(self.apps)
+        eq_(sorted(fetched), [1, 2, 3])
+        eq_(fetched[3], ('http://b.com/manifest.webapp',
+                         {'url': 'http://b.com/manifest.webapp'}))
+
+    @mock.patch('mkt.webapps.tasks._fetch_manifest')
+    def test_hosts(self, fetch):
+        fetch.return_value = '{}'
+        fetcher = ManifestFetcher(threads=3)
+        fetcher.fetch_all(self.apps)
+        eq_(sorted((host, len(times))
+                   for host, times in fetcher.latencies.items()),
+            [('a.com', 2), ('b.com', 1)])
+
+    @mock.patch('mkt.webapps.tasks._fetch_manifest')
+    def test_validators(self, fetch):
+        fetch.return_value = '{}'
+        cache.set(amo.MANIFEST_VALIDATORS_KEY % 1,
+                  {'url': self.apps[0][1], 'etag': '"a"'})
+        cache.set(amo.MANIFEST_VALIDATORS_KEY % 2,
+                  {'url': 'http://a.com/moved.webapp', 'etag': '"b"'})
+        fetched = ManifestFetcher().fetch_all(self.apps)
+        eq_(fetched[1][1]['etag'], '"a"')
+        assert 'etag' not in fetched[2][1]
+        eq_(ManifestFetcher().fetch_all(self.apps, conditional=False)[1][1],
+            {'url': self.apps[0][1]})
+
+    @mock.patch('mkt.webapps.tasks.time.sleep')
+    @mock.patch('mkt.webapps.tasks._fetch_manifest')
+    def test_retries(self, fetch, sleep):
+        fetch.side_effect = [RuntimeError, RuntimeError, '{}']
+        fetched = ManifestFetcher(retries=2).fetch_all(self.apps[:1])
+        eq_(fetched[1][0], '{}')
+        eq_([c[0][0] for c in sleep.call_args_list], [1, 2])
+
+    @mock.patch('mkt.webapps.tasks._fetch_manifest')
+    def test_fail(self, fetch):
+        fetch.side_effect = RuntimeError
+        fetched = ManifestFetcher(retries=0).fetch_all(self.apps[:1])
+        assert isinstance(fetched[1][0], RuntimeError)
+
+
 class TestDumpApps(amo.tests.TestCase):
     fixtures = fixture('webapp_337141')
 
@@ -423,3 +535,92 @@ class TestDumpApps(amo.tests.TestCase):
     def test_public(self, dump_app):
         call_command('process_addons', task='dump_apps')
         assert dump_app.called
+
+
+class TestDumpAppsTarball(amo.tests.TestCase):
+    fixtures = fixture('webapp_337141')
+
+    def open(self, fn):
+        tar = tarfile.open(fn)
+        return dict((name, tar.extractfile(name).read())
+                    for name in tar.getnames())
+
+    def test_dump(self):
+        files = self.open(dump_apps_tarball())
+        eq_(sorted(files), ['apps/337/337141.json', 'license.txt',
+                            'readme.txt'])
+        eq_(json.loads(files['apps/337/337141.json']),
+            json.load(open(dump_app(337141))))
+
+    def test_no_tmp(self):
+        fn = dump_apps_tarball()
+        eq_([f for f in os.listdir(os.path.dirname(fn)) if f.endswith('.tmp')],
+            [])
+
+    def test_not_public(self):
+        Addon.objects.get(pk=337141).update(status=amo.STATUS_PENDING)
+        assert 'apps/337/337141.json' not in self.open(dump_apps_tarball())
+
+    def test_since(self):
+        Addon.objects.filter(pk=337141).update(
+            modified=datetime.datetime.now())
+        fn = dump_apps_tarball(since=datetime.datetime.now() -
+                                     datetime.timedelta(days=1))
+        assert fn.endswith('-incremental.tgz')
+        files = self.open(fn)
+        assert 'apps/337/337141.json' in files
+        eq_(json.loads(files['deleted.json']), [])
+
+    def test_since_same_day(self):
+        since = datetime.datetime(2013, 5, 1)
+        first = dump_apps_tarball(since=since)
+        assert os.path.basename(first).startswith(
+            '2013-05-01-000000-to-')
+        with mock.patch('mkt.webapps.tasks.datetime') as dt:
+            dt.datetime.now.return_value = (datetime.datetime.now() +
+                                            datetime.timedelta(seconds=1))
+            second = dump_apps_tarball(since=since)
+        assert first != second
+        assert os.path.exists(first)
+
+    def test_since_preview(self):
+        yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
+        Addon.objects.filter(pk=337141).update(
+            modified=yesterday - datetime.timedelta(days=1))
+        Preview.objects.create(addon_id=337141)
+        files = self.open(dump_apps_tarball(since=yesterday))
+        assert 'apps/337/337141.json' in files
+
+    @mock.patch('mkt.webapps.tasks.Pool')
+    @mock.patch('mkt.webapps.tasks.cache')
+    @mock.patch('mkt.webapps.tasks.connection')
+    def test_pool_own_connections(self, connection, cache, Pool):
+        Pool.return_value.imap.return_value = []
+        dump_apps_tarball(processes=2, chunk_size=0)
+        assert connection.close.called
+        assert cache.close.called
+        eq_(Pool.call_args[0], (2,))
+
+    def test_since_unchanged(self):
+        files = self.open(dump_apps_tarball(
+            since=datetime.datetime.now() + datetime.timedelta(days=1)))
+        eq_(sorted(files), ['deleted.json', 'license.txt', 'readme.txt'])
+
+    def test_since_deleted(self):
+        Addon.objects.filter(pk=337141).update(
+            status=amo.STATUS_DISABLED, modified=datetime.datetime.now())
+        files = self.open(dump_apps_tarball(
+            since=datetime.datetime.now() - datetime.timedelta(days=1)))
+        assert 'apps/337/337141.json' not in files
+        eq_(json.loads(files['deleted.json']), [337141])
+
+    @mock.patch('mkt.webapps.management.commands.dump_apps_tarball.'
+                'dump_apps_tarball')
+    def test_command_since_last(self, dump):
+        dump.return_value = 'dump.tgz'
+        with self.assertRaises(CommandError):
+            call_command('dump_apps_tarball', since='last')
+        call_command('dump_apps_tarball')
+        eq_(dump.call_args[1]['since'], None)
+        call_command('dump_apps_tarball', since='last')
+        self.assertCloseToNow(dump.call_args[1]['since'])
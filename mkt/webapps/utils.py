@@ -64,7 +64,7 @@ def app_to_dict(app, currency=None, profile=None):
 
     data = {
         'app_type': app.app_type,
-        'categories': list(app.categories.values_list('pk', flat=True)),
+        'categories': [c.pk for c in app.categories.all()],
         'content_ratings': dict([(cr.get_body().name, {
             'name': cr.get_rating().name,
             'description': unicode(cr.get_rating().description),
@@ -137,67 +137,105 @@ def es_app_to_dict(obj, currency=None, profile=None):
     """
     Return app data as dict for API where `app` is the elasticsearch result.
     """
+    return es_apps_to_dicts([obj], currency=currency, profile=profile)[0]
+
+
+def es_apps_to_dicts(objs, currency=None, profile=None):
+    """
+    Return the data of a list of elasticsearch results as dicts for the API,
+    like `es_app_to_dict` does. The payment accounts, prices and user data
+    are looked up once for all of them.
+    """
     # Circular import.
     from mkt.developers.api import AccountResource
     from mkt.developers.models import AddonPaymentAccount
     from mkt.webapps.models import Installed, Webapp
     from stats.models import Contribution
 
-    src = obj._source
-    # The following doesn't perform a database query, but gives us useful
-    # methods like `get_detail_url`. If you use `obj` make sure the calls
-    # don't query the database.
-    is_packaged = src['app_type'] == amo.ADDON_WEBAPP_PACKAGED
-    app = Webapp(app_slug=obj.app_slug, is_packaged=is_packaged)
-
-    attrs = ('content_ratings', 'current_version', 'homepage', 'manifest_url',
-             'previews', 'ratings', 'status', 'support_email', 'support_url')
-    data = dict(zip(attrs, attrgetter(*attrs)(obj)))
-    data.update({
-        'absolute_url': absolutify(app.get_detail_url()),
-        'app_type': app.app_type,
-        'categories': [c for c in obj.category],
-        'description': get_attr_lang(src, 'description'),
-        'device_types': [DEVICE_TYPES[d].api_name for d in src['device']],
-        'icons': dict((i['size'], i['url']) for i in src['icons']),
-        'id': str(obj._id),
-        'is_packaged': is_packaged,
-        'listed_authors': [{'name': name} for name in src['authors']],
-        'name': get_attr_lang(src, 'name'),
-        'premium_type': amo.ADDON_PREMIUM_API[src['premium_type']],
-        'public_stats': obj.has_public_stats,
-        'slug': obj.app_slug,
-    })
-
-    if src['premium_type'] in amo.ADDON_PREMIUMS:
-        acct = list(AddonPaymentAccount.objects.filter(addon=app))
-        if acct and acct.payment_account:
-            data['payment_account'] = AccountResource().get_resource_uri(
-                acct.payment_account)
-    else:
-        data['payment_account'] = None
-
-    try:
-        price = Price.objects.get(name=src['price_tier'])
-        data['price'] = price.get_price(currency=currency)
-        data['price_locale'] = price.get_price_locale(currency=currency)
-    except Price.DoesNotExist:
-        data['price'] = data['price_locale'] = None
-
-    # TODO: Let's get rid of these from the API to avoid db hits.
+    if not objs:
+        return []
+    ids = [obj.id for obj in objs]
+
+    premium_ids = [obj.id for obj in objs
+                   if obj._source['premium_type'] in amo.ADDON_PREMIUMS]
+    accounts = {}
+    if premium_ids:
+        accounts = dict(
+            (acct.addon_id, acct.payment_account) for acct in
+            AddonPaymentAccount.objects.filter(addon__in=premium_ids)
+                                       .select_related('payment_account'))
+
+    tiers = set(obj._source['price_tier'] for obj in objs) - set([None])
+    prices = {}
+    if tiers:
+        prices = dict((p.name, p) for p in
+                      Price.objects.filter(name__in=tiers))
+
+    user = None
     if profile and isinstance(profile, UserProfile):
-        data['user'] = {
+        installed = set(Installed.objects.filter(user=profile, addon__in=ids)
+                                         .values_list('addon', flat=True))
+        purchased = set(Contribution.objects
+                        .filter(user=profile, addon__in=ids,
+                                type=amo.CONTRIB_PURCHASE)
+                        .values_list('addon', flat=True))
+        user = {
             'developed': AddonUser.objects.filter(
                 user=profile, role=amo.AUTHOR_ROLE_OWNER).exists(),
-            'installed': Installed.objects.filter(
-                user=profile, addon_id=obj.id).exists(),
+            'installed': installed,
+            'purchased': purchased,
         }
-        try:
-            contribution = Contribution.objects.get(
-                user=profile, addon_id=obj.id)
-            data['user']['purchased'] = (
-                contribution.type == amo.CONTRIB_PURCHASE)
-        except Contribution.DoesNotExist:
-            data['user']['purchased'] = False
 
-    return data
+    attrs = ('content_ratings', 'current_version', 'homepage', 'manifest_url',
+             'previews', 'ratings', 'status', 'support_email', 'support_url')
+    get_attrs = attrgetter(*attrs)
+    dicts = []
+    for obj in objs:
+        src = obj._source
+        # The following doesn't perform a database query, but gives us useful
+        # methods like `get_detail_url`. If you use `obj` make sure the calls
+        # don't query the database.
+        is_packaged = src['app_type'] == amo.ADDON_WEBAPP_PACKAGED
+        app = Webapp(app_slug=obj.app_slug, is_packaged=is_packaged)
+
+        data = dict(zip(attrs, get_attrs(obj)))
+        data.update({
+            'absolute_url': absolutify(app.get_detail_url()),
+            'app_type': app.app_type,
+            'categories': [c for c in obj.category],
+            'description': get_attr_lang(src, 'description'),
+            'device_types': [DEVICE_TYPES[d].api_name for d in src['device']],
+            'icons': dict((i['size'], i['url']) for i in src['icons']),
+            'id': str(obj._id),
+            'is_packaged': is_packaged,
+            'listed_authors': [{'name': name} for name in src['authors']],
+            'name': get_attr_lang(src, 'name'),
+            'premium_type': amo.ADDON_PREMIUM_API[src['premium_type']],
+            'public_stats': obj.has_public_stats,
+            'slug': obj.app_slug,
+        })
+
+        if src['premium_type'] in amo.ADDON_PREMIUMS:
+            if obj.id in accounts:
+                data['payment_account'] = (
+                    AccountResource().get_resource_uri(accounts[obj.id]))
+        else:
+            data['payment_account'] = None
+
+        price = prices.get(src['price_tier'])
+        if price:
+            data['price'] = price.get_price(currency=currency)
+            data['price_locale'] = price.get_price_locale(currency=currency)
+        else:
+            data['price'] = data['price_locale'] = None
+
+        # TODO: Let's get rid of these from the API to avoid db hits.
+        if user:
+            data['user'] = {
+                'developed': user['developed'],
+                'installed': obj.id in user['installed'],
+                'purchased': obj.id in user['purchased'],
+            }
+
+        dicts.append(data)
+    return dicts
@@ -6,6 +6,9 @@ HOME=/tmp
 * * * * * %(z_cron)s fast_current_version
 * * * * * %(z_cron)s migrate_collection_users
 
+# Every 5 minutes.
+*/5 * * * * %(z_cron)s build_update_index
+
 # Every 30 minutes.
 */30 * * * * %(z_cron)s tag_jetpacks
 */30 * * * * %(z_cron)s update_addons_current_version
@@ -44,6 +47,7 @@ HOME=/tmp
 #once per day
 05 0 * * * %(z_cron)s email_daily_ratings --settings=settings_local_mkt
 30 1 * * * %(z_cron)s update_user_ratings
+35 1 * * * %(z_cron)s build_theme_updates
 40 1 * * * %(z_cron)s update_weekly_downloads
 50 1 * * * %(z_cron)s gc
 45 1 * * * %(z_cron)s mkt_gc --settings=settings_local_mkt
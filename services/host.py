@@ -0,0 +1,42 @@
+"""
+All of the services in one WSGI application, so that they share a process
+and the database connection pool (see `utils.get_pool`) instead of each
+running their own.
+
+    gunicorn -w 4 -k sync services.wsgi.host:application
+    gunicorn -w 4 -k gevent services.wsgi.host:application
+
+With the gevent worker the sockets are patched before the services get
+imported, so their MySQL queries go through PyMySQL and only block the
+greenlet running them. Don't combine it with --preload, the services would
+be imported before the patching.
+"""
+import re
+
+import pfs
+import theme_update
+import update
+import verify
+
+
+# The first mount whose pattern matches PATH_INFO answers the request.
+MOUNTS = (
+    (re.compile(r'^/services/status/$|^/verify/'), verify.application),
+    (theme_update.url_re, theme_update.application),
+    (re.compile(r'^/update/'), update.application),
+    (re.compile(r'^/pfs'), pfs.application),
+)
+
+
+def get_app(path):
+    for pattern, app in MOUNTS:
+        if pattern.search(path):
+            return app
+
+
+def application(environ, start_response):
+    app = get_app(environ.get('PATH_INFO', ''))
+    if app is None:
+        start_response('404 Not Found', [('Content-Length', '0')])
+        return ['']
+    return app(environ, start_response)
@@ -0,0 +1,196 @@
+"""
+Drive synthetic update, receipt verification, pfs and theme update traffic
+at the services host (services/host.py) and report the p50 and p99 latency
+and the requests/sec, for each number of gunicorn workers.
+
+    python services/loadtest.py --workers=1,2,4,8 --worker-class=gevent
+
+A gunicorn serving `services.wsgi.host:application` is started for every
+worker count and stopped once its run is over. To load a host that is
+already running instead::
+
+    python services/loadtest.py --url=http://127.0.0.1:9000
+
+The add-on guids and theme ids requested are random unless given with
+--guids and --themes (files with one per line), so most update and theme
+requests are misses, they still go through the database. Receipts are
+garbage unless given with --receipts, they are refused without a query.
+
+This script doesn't import Django or zamboni.
+"""
+import httplib
+import optparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib
+import urlparse
+import uuid
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIREFOX = '{ec8030f7-c20a-464f-9b0e-13a3a9e97384}'
+
+
+def lines(path, default):
+    if not path:
+        return default
+    with open(path) as fp:
+        return [line.strip() for line in fp if line.strip()]
+
+
+class Traffic(object):
+    """Builds the synthetic requests, as (kind, method, path, body)."""
+
+    def __init__(self, opts):
+        self.guids = lines(opts.guids, ['{%s}' % uuid.uuid4()
+                                        for i in range(100)])
+        self.themes = lines(opts.themes, [str(random.randint(1, 500000))
+                                          for i in range(100)])
+        self.receipts = lines(opts.receipts, ['garbage'])
+        self.mix = []
+        for part in opts.mix.split(','):
+            kind, weight = part.split('=')
+            self.mix.extend([getattr(self, kind)] * int(weight))
+
+    def next(self):
+        return random.choice(self.mix)()
+
+    def update(self):
+        qs = urllib.urlencode({
+            'reqVersion': 2, 'id': random.choice(self.guids),
+            'version': '1.0', 'appID': FIREFOX, 'appVersion': '17.0',
+            'appOS': 'Linux', 'compatMode': 'normal'})
+        return 'update', 'GET', '/update/VersionCheck.php?' + qs, None
+
+    def verify(self):
+        return 'verify', 'POST', '/verify/', random.choice(self.receipts)
+
+    def pfs(self):
+        qs = urllib.urlencode({
+            'mimetype': 'application/x-shockwave-flash', 'appID': FIREFOX,
+            'appVersion': '2008052906', 'clientOS': 'Windows NT 5.1',
+            'chromeLocale': 'en-US', 'appRelease': '17.0'})
+        return 'pfs', 'GET', '/pfs.php?' + qs, None
+
+    def theme(self):
+        return ('theme', 'GET',
+                '/en-US/themes/update-check/%s' % random.choice(self.themes),
+                None)
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(netloc, traffic, requests, concurrency):
+    """Sends `requests` requests over `concurrency` connections."""
+    timings, errors = {}, {}
+    lock = threading.Lock()
+    left = [requests]
+
+    def client():
+        conn = httplib.HTTPConnection(netloc, timeout=60)
+        while True:
+            with lock:
+                if not left[0]:
+                    return
+                left[0] -= 1
+            kind, method, path, body = traffic.next()
+            start = time.time()
+            try:
+                conn.request(method, path, body)
+                response = conn.getresponse()
+                response.read()
+                failed = response.status >= 500
+            except (socket.error, httplib.HTTPException):
+                conn.close()
+                conn = httplib.HTTPConnection(netloc, timeout=60)
+                failed = True
+            took = time.time() - start
+            with lock:
+                timings.setdefault(kind, []).append(took)
+                if failed:
+                    errors[kind] = errors.get(kind, 0) + 1
+
+    threads = [threading.Thread(target=client) for i in range(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start, timings, errors
+
+
+def report(label, took, timings, errors):
+    every = sorted(t for ts in timings.values() for t in ts)
+    print '%s: %s requests in %.2fs, %.0f req/s, p50 %.1fms, p99 %.1fms' % (
+        label, len(every), took, len(every) / took,
+        percentile(every, .5) * 1000, percentile(every, .99) * 1000)
+    for kind, values in sorted(timings.items()):
+        values.sort()
+        print '    %-7s %6s requests, p50 %.1fms, p99 %.1fms, %s errors' % (
+            kind, len(values), percentile(values, .5) * 1000,
+            percentile(values, .99) * 1000, errors.get(kind, 0))
+
+
+def wait_for(netloc, timeout=30):
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            conn = httplib.HTTPConnection(netloc, timeout=1)
+            conn.request('GET', '/services/status/')
+            conn.getresponse().read()
+            return
+        except (socket.error, httplib.HTTPException):
+            time.sleep(.2)
+    raise RuntimeError('The host at %s never came up.' % netloc)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--url', help='Load this host, don\'t start any.')
+    parser.add_option('--workers', default='1,2,4',
+                      help='Worker counts to run gunicorn with.')
+    parser.add_option('--worker-class', default='sync',
+                      help='sync or gevent.')
+    parser.add_option('--bind', default='127.0.0.1:9123')
+    parser.add_option('--requests', type='int', default=2000)
+    parser.add_option('--concurrency', type='int', default=16)
+    parser.add_option('--mix', default='update=70,verify=10,pfs=10,theme=10',
+                      help='Weights of each kind of request.')
+    parser.add_option('--guids', help='File of add-on guids.')
+    parser.add_option('--themes', help='File of theme ids.')
+    parser.add_option('--receipts', help='File of receipts.')
+    opts, args = parser.parse_args()
+
+    traffic = Traffic(opts)
+    if opts.url:
+        netloc = urlparse.urlparse(opts.url).netloc
+        report(netloc, *run(netloc, traffic, opts.requests,
+                            opts.concurrency))
+        return
+
+    for workers in [int(w) for w in opts.workers.split(',')]:
+        server = subprocess.Popen(
+            ['gunicorn', '-w', str(workers), '-k', opts.worker_class,
+             '-b', opts.bind, 'services.wsgi.host:application'], cwd=ROOT)
+        try:
+            wait_for(opts.bind)
+            # Warm up the connection pools and caches of every worker.
+            run(opts.bind, traffic, workers * opts.concurrency,
+                opts.concurrency)
+            report('%s %s workers' % (workers, opts.worker_class),
+                   *run(opts.bind, traffic, opts.requests, opts.concurrency))
+        finally:
+            server.terminate()
+            server.wait()
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
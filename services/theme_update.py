@@ -1,4 +1,6 @@
 import base64
+from email.utils import mktime_tz, parsedate_tz
+import hashlib
 import json
 import os
 import posixpath
@@ -9,7 +11,7 @@ from wsgiref.handlers import format_date_time
 from django.core.management import setup_environ
 
 from constants import base
-from utils import log_configure, log_exception, mypool
+from utils import get_pool, log_configure, log_exception
 
 from services.utils import settings
 setup_environ(settings)
@@ -18,13 +20,20 @@ setup_environ(settings)
 log_configure()
 
 # This has to be imported after the settings (utils).
+from django.core.cache import cache
 from django_statsd.clients import statsd
 
+mypool = get_pool('theme_update')
+
+# Seconds the documents built by `store` are kept, 0 is off.
+DOC_TIMEOUT = getattr(settings, 'SERVICES_THEME_UPDATE_TIMEOUT', 0)
+locale_re = re.compile(r'^[\w-]+$')
+
 
 class ThemeUpdate(object):
 
-    def __init__(self, locale, id_, qs=None):
-        self.conn, self.cursor = None, None
+    def __init__(self, locale, id_, qs=None, cursor=None):
+        self.conn, self.cursor = None, cursor
         self.from_gp = qs == 'src=gp'
         self.data = {
             'locale': locale,
@@ -35,6 +44,8 @@ class ThemeUpdate(object):
             'atype': base.ADDON_PERSONA,
             'row': {}
         }
+
+    def setup_db(self):
         if not self.cursor:
             self.conn = mypool.connect()
             self.cursor = self.conn.cursor()
@@ -51,13 +62,6 @@ class ThemeUpdate(object):
                 log_exception('I/O error({0}): {1}'.format(e[0], e[1]))
             return ''
 
-    def get_headers(self, length):
-        return [('Cache-Control', 'public, max-age=3600'),
-                ('Content-Length', str(length)),
-                ('Content-Type', 'application/json'),
-                ('Expires', format_date_time(time() + 3600)),
-                ('Last-Modified', format_date_time(time()))]
-
     def get_update(self):
         """
         TODO:
@@ -91,6 +95,7 @@ class ThemeUpdate(object):
             a.addontype_id=%(atype)s AND a.status=4 AND a.inactive=0
         """.format(primary_key=self.data['primary_key'])
 
+        self.setup_db()
         self.cursor.execute(sql, self.data)
         row = self.cursor.fetchone()
 
@@ -159,6 +164,18 @@ class ThemeUpdate(object):
 
         return json.dumps(data)
 
+    def get_document(self):
+        """
+        Returns the JSON, its ETag and the modified timestamp of the theme,
+        or None if it isn't found.
+        """
+        output = self.get_json()
+        if not output:
+            return None
+        modified = self.data['row']['modified']
+        return (output, '"%s"' % hashlib.md5(output).hexdigest(),
+                int(modified) if modified else 0)
+
     def image_path(self, filename):
         row = self.data['row']
 
@@ -191,6 +208,98 @@ class ThemeUpdate(object):
         return '%s/%s%s' % (domain, self.data.get('locale', 'en-US'), url)
 
 
+def get_headers(length, etag, modified):
+    return [('Cache-Control', 'public, max-age=3600'),
+            ('Content-Length', str(length)),
+            ('Content-Type', 'application/json'),
+            ('ETag', etag),
+            ('Expires', format_date_time(time() + 3600)),
+            ('Last-Modified', format_date_time(modified or time()))]
+
+
+def doc_keys(id_, qs):
+    kind = 'gp' if qs == 'src=gp' else 'addon'
+    return (base.THEME_UPDATE_LOCALES_KEY % (kind, id_),
+            lambda locale: base.THEME_UPDATE_KEY % (kind, id_, locale))
+
+
+def store(cursor, addon_id):
+    """
+    Builds the documents of the theme for every locale it has a name in,
+    looked up by add-on id and by getpersonas.com id, and caches them. If
+    the theme isn't served anymore they are dropped. Returns the number of
+    documents built.
+    """
+    cursor.execute('SELECT persona_id FROM personas WHERE addon_id=%(id)s',
+                   {'id': addon_id})
+    row = cursor.fetchone()
+    ids = [(addon_id, None)]
+    if row and row[0]:
+        ids.append((row[0], 'src=gp'))
+
+    # Any other locale falls back to en-US, see `ThemeUpdate.get_update`.
+    cursor.execute("""
+        SELECT DISTINCT t.locale FROM addons AS a
+        INNER JOIN translations AS t ON t.id=a.name
+        WHERE a.id=%(id)s AND t.localized_string != ''""", {'id': addon_id})
+    locales = set(r[0] for r in cursor.fetchall()) | set(['en-US'])
+
+    docs, drop, count = {}, [], 0
+    for id_, qs in ids:
+        locales_key, doc_key = doc_keys(id_, qs)
+        built = []
+        for locale in sorted(locales):
+            doc = ThemeUpdate(locale, id_, qs, cursor=cursor).get_document()
+            if doc is None:
+                break
+            docs[doc_key(locale)] = doc
+            built.append(locale)
+            count += 1
+        if built:
+            docs[locales_key] = built
+        else:
+            drop.append(locales_key)
+
+    if docs:
+        cache.set_many(docs, DOC_TIMEOUT)
+    if drop:
+        cache.delete_many(drop)
+    return count
+
+
+def get_document(locale, id_, qs):
+    """
+    Returns the document `store` built for the request with a single cache
+    lookup, or None if the request has to go to the database.
+    """
+    if not DOC_TIMEOUT:
+        return None
+    locales_key, doc_key = doc_keys(id_, qs)
+    keys = [locales_key, doc_key('en-US')]
+    # Anything else can't be a locale documents were built for.
+    if locale_re.match(locale):
+        keys.append(doc_key(locale))
+    found = cache.get_many(keys)
+
+    locales = found.get(locales_key)
+    if locales is None:
+        return None
+    if locale in locales:
+        return found.get(doc_key(locale))
+    if locale.lower() in [l.lower() for l in locales]:
+        # MySQL would have matched it, the URLs in the document would not.
+        return None
+    return found.get(doc_key('en-US'))
+
+
+def is_not_modified(environ, etag, modified):
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        return etag in [e.strip() for e in if_none_match.split(',')]
+    since = parsedate_tz(environ.get('HTTP_IF_MODIFIED_SINCE') or '')
+    return bool(since and modified and modified <= mktime_tz(since))
+
+
 url_re = re.compile('(?P<locale>.+)?/themes/update-check/(?P<id>\d+)$')
 
 
@@ -215,12 +324,25 @@ def application(environ, start_response):
             return ['']
 
         try:
-            update = ThemeUpdate(locale, id_, environ.get('QUERY_STRING'))
-            output = update.get_json()
-            if not output:
-                start_response('404 Not Found', [])
+            qs = environ.get('QUERY_STRING')
+            doc = get_document(locale, id_, qs)
+            if doc is None:
+                statsd.incr('services.theme_update.miss')
+                update = ThemeUpdate(locale, id_, qs)
+                doc = update.get_document()
+                if not doc:
+                    start_response('404 Not Found', [])
+                    return ['']
+            else:
+                statsd.incr('services.theme_update.hit')
+            output, etag, modified = doc
+            headers = get_headers(len(output), etag, modified)
+            if is_not_modified(environ, etag, modified):
+                start_response('304 Not Modified',
+                               [h for h in headers if not
+                                h[0].startswith('Content-')])
                 return ['']
-            start_response(status, update.get_headers(len(output)))
+            start_response(status, headers)
         except:
             log_exception(data)
             raise
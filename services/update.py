@@ -1,14 +1,15 @@
+from collections import OrderedDict
 from email.Utils import formatdate
 from email.mime.text import MIMEText
+import operator
+import re
 import smtplib
 import sys
+import threading
 from time import time
 import traceback
 from urlparse import parse_qsl
 
-import MySQLdb as mysql
-import sqlalchemy.pool as pool
-
 import commonware.log
 from django.core.management import setup_environ
 from django.utils.http import urlencode
@@ -17,6 +18,7 @@ import settings_local as settings
 setup_environ(settings)
 # This has to be imported after the settings so statsd knows where to log to.
 from django_statsd.clients import statsd
+from django.core.cache import cache
 
 try:
     from compare import version_int
@@ -24,7 +26,8 @@ except ImportError:
     from apps.versions.compare import version_int
 
 from constants import applications, base
-from utils import (get_mirror, log_configure, APP_GUIDS, PLATFORMS,
+import update_index
+from utils import (get_mirror, get_pool, log_configure, APP_GUIDS, PLATFORMS,
                    STATUSES_PUBLIC)
 
 # Go configure the log.
@@ -75,23 +78,123 @@ no_updates_rdf = """<?xml version="1.0"?>
 </RDF:RDF>"""
 
 
+class Template(object):
+    """
+    A `%(name)s` template compiled once into a positional one, so rendering
+    doesn't have to parse the format and look up every name by hand.
+    """
+
+    def __init__(self, template):
+        names = re.findall(r'%\((\w+)\)s', template)
+        self.format = re.sub(r'%\((\w+)\)s', '%s', template)
+        self.getter = operator.itemgetter(*names)
+
+    def render(self, data):
+        return self.format % self.getter(data)
+
+
+good_template = Template(good_rdf)
+no_updates_template = Template(no_updates_rdf)
+
+
+class ResponseCache(object):
+    """
+    A bounded LRU of rendered responses, each entry also expires after
+    `timeout` seconds. Keys include the update key version, so bumping it
+    (see `addons.models.invalidate_update_cache`) invalidates everything.
+    The version is read from memcache at most every `check` seconds.
+    """
+    # Fields that decide the response, see `Update.is_valid`.
+    fields = ('id', 'version', 'appID', 'appVersion', 'appOS')
+
+    def __init__(self, size, timeout, check=5):
+        self.size = size
+        self.timeout = timeout
+        self.check = check
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self._version = (None, 0)
+
+    def version(self):
+        """The update key version, as of `check` seconds ago at most."""
+        version, checked = self._version
+        now = time()
+        if version is None or now - checked >= self.check:
+            version = cache.get(base.UPDATE_KEYVERSION)
+            if version is None:
+                cache.add(base.UPDATE_KEYVERSION, 1)
+                version = cache.get(base.UPDATE_KEYVERSION)
+            self._version = (version, now)
+        return version
+
+    def key(self, data, compat_mode):
+        """The normalized key for a query, None if it can't be cached."""
+        if not self.size:
+            return None
+        # Watermarked downloads are unique to the purchaser.
+        if any(k in data for k in base.WATERMARK_KEYS):
+            return None
+        return (self.version(), compat_mode,
+                'reqVersion' in data) + tuple(data.get(f) for f in self.fields)
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self.lock:
+            value = self.data.pop(key, None)
+            if value is None or value[0] < time():
+                statsd.incr('services.update.cache.miss')
+                return None
+            # Move it back to the end, it's the most recently used now.
+            self.data[key] = value
+        statsd.incr('services.update.cache.hit')
+        return value[1]
+
+    def set(self, key, output):
+        if key is None:
+            return
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (time() + self.timeout, output)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+
+response_cache = ResponseCache(
+    getattr(settings, 'SERVICES_UPDATE_CACHE_SIZE', 0),
+    getattr(settings, 'SERVICES_UPDATE_CACHE_TIMEOUT', 60),
+    getattr(settings, 'SERVICES_UPDATE_CACHE_CHECK', 5))
+
+
 timing_log = commonware.log.getLogger('z.timer')
 error_log = commonware.log.getLogger('z.services')
 
 
-def getconn():
-    db = settings.SERVICES_DATABASE
-    return mysql.connect(host=db['HOST'], user=db['USER'],
-                         passwd=db['PASSWORD'], db=db['NAME'])
+mypool = get_pool('update')
+
+
+def get_index():
+    """The update index snapshot, if index mode is turned on and built."""
+    path = getattr(settings, 'SERVICES_UPDATE_INDEX', None)
+    if not path:
+        return None
+    return update_index.get_index(
+        path, getattr(settings, 'SERVICES_UPDATE_INDEX_CHECK', 30))
 
 
-mypool = pool.QueuePool(getconn, max_overflow=10, pool_size=5, recycle=300)
+def _le(a, b):
+    # Comparing against NULL in SQL is never true.
+    return a is not None and b is not None and a <= b
 
 
 class Update(object):
 
-    def __init__(self, data, compat_mode='strict'):
+    def __init__(self, data, compat_mode='strict', index=None):
         self.conn, self.cursor = None, None
+        # If an index is given, the lookups are answered from it and
+        # the database is never touched.
+        self.index = index
+        self.record = None
         self.data = data.copy()
         self.data['row'] = {}
         self.flags = {'use_version': False, 'multiple_status': False}
@@ -102,7 +205,7 @@ class Update(object):
     def is_valid(self):
         # If you accessing this from unit tests, then before calling
         # is valid, you can assign your own cursor.
-        if not self.cursor:
+        if not self.cursor and self.index is None:
             self.conn = mypool.connect()
             self.cursor = self.conn.cursor()
 
@@ -117,14 +220,7 @@ class Update(object):
         if not data['app_id']:
             return False
 
-        sql = """SELECT id, status, addontype_id, guid FROM addons
-                 WHERE guid = %(guid)s AND
-                       inactive = 0 AND
-                       status != %(STATUS_DELETED)s
-                 LIMIT 1;"""
-        self.cursor.execute(sql, {'guid': self.data['id'],
-                                  'STATUS_DELETED': base.STATUS_DELETED})
-        result = self.cursor.fetchone()
+        result = self.get_addon()
         if result is None:
             return False
 
@@ -142,6 +238,38 @@ class Update(object):
         self.is_beta_version = base.VERSION_BETA.search(data['version'])
         return True
 
+    def get_addon(self):
+        if self.index is not None:
+            self.record = self.index.get(self.data['id'])
+            if self.record is None:
+                return None
+            return self.record['addon'][:4]
+
+        sql = """SELECT id, status, addontype_id, guid FROM addons
+                 WHERE guid = %(guid)s AND
+                       inactive = 0 AND
+                       status != %(STATUS_DELETED)s
+                 LIMIT 1;"""
+        self.cursor.execute(sql, {'guid': self.data['id'],
+                                  'STATUS_DELETED': base.STATUS_DELETED})
+        return self.cursor.fetchone()
+
+    def get_beta_status(self):
+        """The status of the files of the version the client is on."""
+        if self.record is not None:
+            return self.record['beta'].get(
+                update_index.key(self.data['version']))
+
+        sql = """
+            SELECT versions.id, status
+            FROM files INNER JOIN versions
+            ON files.version_id = versions.id
+            WHERE versions.addon_id = %(id)s
+                  AND versions.version = %(version)s LIMIT 1;"""
+        self.cursor.execute(sql, self.data)
+        result = self.cursor.fetchone()
+        return result[1] if result is not None else None
+
     def get_beta(self):
         data = self.data
         data['status'] = base.STATUS_PUBLIC
@@ -150,17 +278,9 @@ class Update(object):
             # Beta channel looks at the addon name to see if it's beta.
             if self.is_beta_version:
                 # For beta look at the status of the existing files.
-                sql = """
-                    SELECT versions.id, status
-                    FROM files INNER JOIN versions
-                    ON files.version_id = versions.id
-                    WHERE versions.addon_id = %(id)s
-                          AND versions.version = %(version)s LIMIT 1;"""
-                self.cursor.execute(sql, data)
-                result = self.cursor.fetchone()
+                status = self.get_beta_status()
                 # Only change the status if there are files.
-                if result is not None:
-                    status = result[1]
+                if status is not None:
                     # If it's in Beta or Public, then we should be looking
                     # for similar. If not, find something public.
                     if status in (base.STATUS_BETA, base.STATUS_PUBLIC):
@@ -181,6 +301,38 @@ class Update(object):
         self.get_beta()
         data = self.data
 
+        if self.record is not None:
+            result = self.get_update_from_index()
+        else:
+            result = self.get_update_from_db()
+
+        if result:
+            row = dict(zip([
+                'guid', 'type', 'disabled_by_user', 'appguid', 'min', 'max',
+                'file_id', 'file_status', 'hash', 'filename', 'version_id',
+                'datestatuschanged', 'strict_compat', 'releasenotes',
+                'version', 'premium_type'],
+                list(result)))
+            if self.record is not None:
+                row['datestatuschanged'] = update_index.unpack_date(
+                    row['datestatuschanged'])
+            row['type'] = base.ADDON_SLUGS_UPDATE[row['type']]
+            if row['premium_type'] in base.ADDON_PREMIUMS:
+                qs = urlencode(dict((k, data.get(k, ''))
+                               for k in base.WATERMARK_KEYS))
+                row['url'] = (u'%s/downloads/watermarked/%s?%s' %
+                              (settings.SITE_URL, row['file_id'], qs))
+            else:
+                row['url'] = get_mirror(self.data['addon_status'],
+                                        self.data['id'], row)
+            data['row'] = row
+            return True
+
+        return False
+
+    def get_update_from_db(self):
+        data = self.data
+
         sql = ["""
             SELECT
                 addons.guid as guid, addons.addontype_id as type,
@@ -261,27 +413,78 @@ class Update(object):
         sql.append('ORDER BY versions.id DESC LIMIT 1;')
 
         self.cursor.execute(''.join(sql), data)
-        result = self.cursor.fetchone()
+        return self.cursor.fetchone()
 
-        if result:
-            row = dict(zip([
-                'guid', 'type', 'disabled_by_user', 'appguid', 'min', 'max',
-                'file_id', 'file_status', 'hash', 'filename', 'version_id',
-                'datestatuschanged', 'strict_compat', 'releasenotes',
-                'version', 'premium_type'],
-                list(result)))
-            row['type'] = base.ADDON_SLUGS_UPDATE[row['type']]
-            if row['premium_type'] in base.ADDON_PREMIUMS:
-                qs = urlencode(dict((k, data.get(k, ''))
-                               for k in base.WATERMARK_KEYS))
-                row['url'] = (u'%s/downloads/watermarked/%s?%s' %
-                              (settings.SITE_URL, row['file_id'], qs))
-            else:
-                row['url'] = get_mirror(self.data['addon_status'],
-                                        self.data['id'], row)
-            data['row'] = row
-            return True
+    def get_update_from_index(self):
+        """
+        The same as `get_update_from_db`, against the candidates in the
+        update index. Keep the two in sync.
+        """
+        data = self.data
+        # See `update_index.build` for the columns.
+        (_, _, addon_type, guid, inactive,
+         premium_type) = self.record['addon']
+        app_os = data.get('appOS')
+        wanted = update_index.key(data['version'])
+        app_version_int = data['version_int']
+        d2c_max = None
+        if self.compat_mode == 'normal':
+            d2c_max = applications.D2C_MAX_VERSIONS.get(data['app_id'])
+            if d2c_max:
+                d2c_max = data['d2c_max_version'] = version_int(d2c_max)
 
+        if self.flags['use_version']:
+            statuses = None
+        elif self.flags['multiple_status']:
+            statuses = (data['STATUS_PUBLIC'], data['STATUS_LITE'],
+                        data['STATUS_LITE_AND_NOMINATED'])
+        else:
+            statuses = (data['status'],)
+
+        # Candidates are sorted by version id, the first match wins.
+        for (version_id, version, releasenotes, file_id, platform,
+             file_status, hash_, filename, datestatuschanged, strict_compat,
+             binary_components, appguid, min_, max_, min_int, max_int,
+             incompatible) in self.record['apps'].get(data['app_id'], []):
+            if not (platform == 1 or (app_os and platform == app_os)):
+                continue
+            if statuses is None:
+                if not (file_status > data['status'] and
+                        update_index.key(version) == wanted):
+                    continue
+            elif file_status not in statuses:
+                continue
+            if not _le(min_int, app_version_int):
+                continue
+
+            if self.compat_mode == 'ignore':
+                pass
+            elif self.compat_mode == 'normal':
+                if ((strict_compat or binary_components) and
+                        not _le(app_version_int, max_int)):
+                    continue
+                if d2c_max and not _le(d2c_max, max_int):
+                    continue
+                if self.is_incompatible(incompatible, app_version_int):
+                    continue
+            elif not _le(app_version_int, max_int):
+                continue
+
+            return (guid, addon_type, inactive, appguid, min_, max_, file_id,
+                    file_status, hash_, filename, version_id,
+                    datestatuschanged, strict_compat, releasenotes, version,
+                    premium_type)
+
+    def is_incompatible(self, overrides, app_version_int):
+        # This mirrors the precedence of the incompatible_versions subquery
+        # exactly: only the first clause is restricted to the app.
+        for app_id, min_, max_, min_int, max_int in overrides:
+            first = (app_id == self.data['app_id'] and min_ == '0' and
+                     _le(app_version_int, max_int))
+            if (first or (_le(min_int, app_version_int) and max_ == '*') or
+                    (_le(min_int, app_version_int) and
+                     _le(app_version_int, max_int))):
+                return True
         return False
 
     def get_bad_rdf(self):
@@ -295,14 +498,17 @@ class Update(object):
                 rdf = self.get_no_updates_rdf()
         else:
             rdf = self.get_bad_rdf()
-        self.cursor.close()
+        if self.cursor:
+            self.cursor.close()
         if self.conn:
             self.conn.close()
         return rdf
 
     def get_no_updates_rdf(self):
         name = base.ADDON_SLUGS_UPDATE[self.data['type']]
-        return no_updates_rdf % ({'guid': self.data['guid'], 'type': name})
+        with statsd.timer('services.update.render'):
+            return no_updates_template.render({'guid': self.data['guid'],
+                                               'type': name})
 
     def get_good_rdf(self):
         data = self.data['row']
@@ -318,7 +524,8 @@ class Update(object):
                                  (settings.SITE_URL, '/versions/updateInfo/',
                                   data['version_id']))
 
-        return good_rdf % data
+        with statsd.timer('services.update.render'):
+            return good_template.render(data)
 
     def format_date(self, secs):
         return '%s GMT' % formatdate(time() + secs)[:25]
@@ -358,8 +565,12 @@ def application(environ, start_response):
         data = dict(parse_qsl(environ['QUERY_STRING']))
         compat_mode = data.pop('compatMode', 'strict')
         try:
-            update = Update(data, compat_mode)
-            output = update.get_rdf()
+            update = Update(data, compat_mode, index=get_index())
+            key = response_cache.key(data, compat_mode)
+            output = response_cache.get(key)
+            if output is None:
+                output = update.get_rdf()
+                response_cache.set(key, output)
             start_response(status, update.get_headers(len(output)))
         except:
             #mail_exception(data)
@@ -0,0 +1,196 @@
+"""
+A compiled, memory-mapped snapshot of everything `services/update.py` needs
+to answer an update ping without talking to MySQL.
+
+The snapshot is a single file:
+
+    MAGIC | index offset | addon record | addon record | ... | index
+
+Each addon record is a marshalled dict holding the add-on row, the status
+of every version (for the beta channel lookup) and, per application, the
+list of candidate files sorted the same way the update query sorts them.
+The index maps the lowercased guid to the (offset, length) of a record, so
+a lookup only unmarshals the record of the add-on being pinged.
+
+This module must not import Django or zamboni, it is loaded by the
+services and by the cron that builds the snapshot.
+"""
+from datetime import datetime
+import marshal
+import mmap
+import os
+import struct
+import threading
+import time
+
+
+MAGIC = 'ZUIDX001'
+HEADER = struct.Struct('>8sQ')
+
+
+def _pack_date(value):
+    if value is None:
+        return None
+    return (value.year, value.month, value.day, value.hour, value.minute,
+            value.second, value.microsecond)
+
+
+def unpack_date(value):
+    if value is None:
+        return None
+    return datetime(*value)
+
+
+def key(value):
+    # MySQL compares guids and versions with a case insensitive collation,
+    # the snapshot has to match what the query would have matched.
+    return value.lower() if value is not None else None
+
+
+def build(cursor, path, status_deleted):
+    """
+    Build a snapshot from `cursor` and atomically move it over `path`.
+    Returns the number of add-ons written.
+    """
+    addons = {}
+    cursor.execute("""
+        SELECT id, status, addontype_id, guid, inactive, premium_type
+        FROM addons
+        WHERE guid IS NOT NULL AND inactive = 0 AND status != %(deleted)s
+        ORDER BY id""", {'deleted': status_deleted})
+    guids = {}
+    for row in cursor.fetchall():
+        guid = key(row[3])
+        if guid in guids:
+            # `LIMIT 1` picks the first one, so do we.
+            continue
+        guids[guid] = row[0]
+        addons[row[0]] = {'addon': tuple(row), 'beta': {}, 'apps': {}}
+
+    cursor.execute("""
+        SELECT versions.addon_id, versions.version, files.status
+        FROM files INNER JOIN versions ON files.version_id = versions.id
+        ORDER BY files.id""")
+    for addon_id, version, status in cursor.fetchall():
+        if addon_id in addons:
+            addons[addon_id]['beta'].setdefault(key(version), status)
+
+    incompatible = {}
+    cursor.execute("""
+        SELECT version_id, app_id, min_app_version, max_app_version,
+               min_app_version_int, max_app_version_int
+        FROM incompatible_versions""")
+    for row in cursor.fetchall():
+        incompatible.setdefault(row[0], []).append(tuple(row[1:]))
+
+    cursor.execute("""
+        SELECT versions.addon_id, applications_versions.application_id,
+               versions.id, versions.version, versions.releasenotes,
+               files.id, files.platform_id, files.status, files.hash,
+               files.filename, files.datestatuschanged,
+               files.strict_compatibility, files.binary_components,
+               applications.guid, appmin.version, appmax.version,
+               appmin.version_int, appmax.version_int
+        FROM versions
+        INNER JOIN applications_versions
+            ON applications_versions.version_id = versions.id
+        INNER JOIN applications
+            ON applications_versions.application_id = applications.id
+        INNER JOIN appversions appmin
+            ON appmin.id = applications_versions.min
+        INNER JOIN appversions appmax
+            ON appmax.id = applications_versions.max
+        INNER JOIN files
+            ON files.version_id = versions.id
+        ORDER BY versions.id DESC, files.id""")
+    for row in cursor.fetchall():
+        record = addons.get(row[0])
+        if record is None:
+            continue
+        # Unpacked in `Update.get_update_from_index`, keep them in sync.
+        candidate = (row[2], row[3], row[4], row[5], row[6], row[7],
+                     row[8], row[9], _pack_date(row[10]), row[11], row[12],
+                     row[13], row[14], row[15], row[16], row[17],
+                     incompatible.get(row[2], []))
+        record['apps'].setdefault(row[1], []).append(candidate)
+
+    tmp = '%s.%s.tmp' % (path, os.getpid())
+    index = {}
+    with open(tmp, 'wb') as fp:
+        fp.write(HEADER.pack(MAGIC, 0))
+        for guid, addon_id in guids.iteritems():
+            blob = marshal.dumps(addons[addon_id])
+            index[guid] = (fp.tell(), len(blob))
+            fp.write(blob)
+        offset = fp.tell()
+        fp.write(marshal.dumps({'built': time.time(), 'index': index}))
+        fp.seek(0)
+        fp.write(HEADER.pack(MAGIC, offset))
+    os.rename(tmp, path)
+    return len(index)
+
+
+class UpdateIndex(object):
+    """A read only view on a snapshot written by `build`."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fp:
+            self.stat = _stat(fp.fileno())
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, offset = HEADER.unpack(self._map[:HEADER.size])
+        if magic != MAGIC:
+            raise ValueError('%s is not an update index.' % path)
+        meta = marshal.loads(self._map[offset:])
+        self.built = meta['built']
+        self._index = meta['index']
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, guid):
+        """Return the record for `guid` or None."""
+        pos = self._index.get(key(guid))
+        if pos is None:
+            return None
+        offset, length = pos
+        return marshal.loads(self._map[offset:offset + length])
+
+
+def _stat(fd_or_path):
+    st = os.fstat(fd_or_path) if isinstance(fd_or_path, int) else \
+         os.stat(fd_or_path)
+    return (st.st_ino, st.st_mtime, st.st_size)
+
+
+_lock = threading.Lock()
+_current = {'index': None, 'checked': 0}
+
+
+def get_index(path, interval=30):
+    """
+    Return the `UpdateIndex` for `path`, or None if there is no snapshot.
+
+    At most every `interval` seconds the file is stat'ed, if a new snapshot
+    has been moved into place it gets loaded and swapped in. Readers holding
+    on to the old one keep using it until they are done.
+    """
+    now = time.time()
+    if now - _current['checked'] < interval:
+        return _current['index']
+
+    with _lock:
+        _current['checked'] = now
+        try:
+            stat = _stat(path)
+        except OSError:
+            _current['index'] = None
+            return None
+        current = _current['index']
+        if current is None or current.path != path or current.stat != stat:
+            try:
+                _current['index'] = UpdateIndex(path)
+            except (IOError, ValueError, EOFError, struct.error):
+                # Half written or corrupt, keep what we've got.
+                pass
+        return _current['index']
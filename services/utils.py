@@ -15,6 +15,7 @@ if settingmodule.startswith(('zamboni',  # typical git clone destination
 import posixpath
 import re
 import sys
+import threading
 
 from cef import log_cef as _log_cef
 import MySQLdb as mysql
@@ -91,13 +92,96 @@ def get_mirror(status, id, row):
     return posixpath.join(host, str(id), row['filename'])
 
 
-def getconn():
-    db = settings.SERVICES_DATABASE
-    return mysql.connect(host=db['HOST'], user=db['USER'],
-                         passwd=db['PASSWORD'], db=db['NAME'])
+def is_green():
+    """True if sockets have been monkey patched by gevent."""
+    try:
+        from gevent import socket as green_socket
+    except ImportError:
+        return False
+    import socket
+    return socket.socket is green_socket.socket
 
 
-mypool = pool.QueuePool(getconn, max_overflow=10, pool_size=5, recycle=300)
+def getconn():
+    db = settings.SERVICES_DATABASE
+    if is_green():
+        # MySQLdb blocks the whole process while it waits on MySQL, the pure
+        # python driver goes through the patched sockets and only blocks the
+        # greenlet.
+        import pymysql
+        connect = pymysql.connect
+    else:
+        connect = mysql.connect
+    return connect(host=db['HOST'], user=db['USER'],
+                   passwd=db['PASSWORD'], db=db['NAME'])
+
+
+class LimitedConnection(object):
+    """
+    A connection from the shared pool, counted against the limit of the app
+    that checked it out until it's closed or garbage collected.
+    """
+
+    def __init__(self, conn, semaphore):
+        self._conn = conn
+        self._semaphore = semaphore
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._semaphore is not None:
+            self._conn.close()
+            self._semaphore.release()
+            self._semaphore = None
+
+    def __del__(self):
+        self.close()
+
+
+class AppPool(object):
+    """
+    The view an app has of the pool shared by all the services, an app can't
+    hold more than `limit` connections at once. None means no limit.
+    """
+
+    def __init__(self, shared, name, limit=None):
+        self.shared = shared
+        self.name = name
+        self.semaphore = threading.BoundedSemaphore(limit) if limit else None
+
+    def connect(self):
+        if self.semaphore is None:
+            return self.shared.connect()
+        self.semaphore.acquire()
+        try:
+            conn = self.shared.connect()
+        except:
+            self.semaphore.release()
+            raise
+        return LimitedConnection(conn, self.semaphore)
+
+
+_shared_pool = pool.QueuePool(getconn, **getattr(
+    settings, 'SERVICES_DATABASE_POOL',
+    {'max_overflow': 10, 'pool_size': 5, 'recycle': 300}))
+_app_pools = {}
+_app_pools_lock = threading.Lock()
+
+
+def get_pool(name):
+    """
+    The pool `name` gets its connections from. All the services share one
+    pool, each with the limit set in SERVICES_DATABASE_LIMITS.
+    """
+    with _app_pools_lock:
+        if name not in _app_pools:
+            limits = getattr(settings, 'SERVICES_DATABASE_LIMITS', {})
+            _app_pools[name] = AppPool(_shared_pool, name, limits.get(name))
+        return _app_pools[name]
+
+
+mypool = get_pool('verify')
 
 
 def log_configure():
@@ -1,5 +1,6 @@
 import calendar
 from datetime import datetime
+import hashlib
 import json
 from time import gmtime, time
 from urlparse import parse_qsl, urlparse
@@ -8,8 +9,9 @@ from wsgiref.handlers import format_date_time
 from django.core.management import setup_environ
 
 from utils import (log_configure, log_exception, log_info, mypool,
-                   ADDON_PREMIUM, CONTRIB_CHARGEBACK,
-                   CONTRIB_PURCHASE, CONTRIB_REFUND)
+                   ADDON_PREMIUM, CONTRIB_CHARGEBACK, CONTRIB_PURCHASE,
+                   CONTRIB_REFUND)
+from constants.base import verify_key, VERIFY_RECEIPT_KEY
 
 from services.utils import settings
 setup_environ(settings)
@@ -25,11 +27,14 @@ from lib.cef_loggers import receipt_cef
 # This has to be imported after the settings (utils).
 import receipts  # used for patching in the tests
 from receipts import certs
+from django.core.cache import cache
 from django_statsd.clients import statsd
 
 status_codes = {
     200: '200 OK',
+    400: '400 Bad Request',
     405: '405 Method Not Allowed',
+    413: '413 Request Entity Too Large',
     500: '500 Internal Server Error',
 }
 
@@ -46,6 +51,16 @@ class RefundedReceipt(Exception):
     pass
 
 
+# Seconds decoded receipts, installs and purchases are cached, 0 is off.
+CACHE_TIMEOUT = getattr(settings, 'SERVICES_VERIFY_CACHE_TIMEOUT', 0)
+# Marks a cached install whose purchase hasn't been looked up yet.
+UNKNOWN = -1
+# Receipts are verified in batches by POSTing a JSON list of them to the
+# verification URL followed by this.
+BATCH_SUFFIX = 'batch/'
+BATCH_SIZE = getattr(settings, 'SERVICES_VERIFY_BATCH_SIZE', 100)
+
+
 class Verify:
 
     def __init__(self, receipt, environ):
@@ -54,8 +69,11 @@ class Verify:
         # These will be extracted from the receipt.
         self.decoded = None
         self.addon_id = None
+        self.uuid = None
         self.user_id = None
         self.premium = None
+        # The purchase type, UNKNOWN until it's been looked up.
+        self.purchase = UNKNOWN
         # This is so the unit tests can override the connection.
         self.conn, self.cursor = None, None
 
@@ -78,6 +96,12 @@ class Verify:
         except InvalidReceipt:
             return self.invalid()
 
+        return self.check_premium()
+
+    def check_premium(self):
+        """
+        The end of `check_full`, once the install has been found.
+        """
         if self.premium != ADDON_PREMIUM:
             log_info('Valid receipt, not premium')
             return self.ok_or_expired()
@@ -173,19 +197,17 @@ class Verify:
             log_info('Receipt had the wrong path')
             raise InvalidReceipt
 
-    def check_db(self):
+    def check_install_data(self):
         """
-        Verifies the decoded receipt against the database.
+        Extracts the app and the install uuid from the decoded receipt.
 
         Requires that decode is run first.
         """
         if not self.decoded:
             raise ValueError('decode not run')
 
-        self.setup_db()
-        # Get the addon and user information from the installed table.
         try:
-            uuid = self.decoded['user']['value']
+            self.uuid = self.decoded['user']['value']
         except KeyError:
             # If somehow we got a valid receipt without a uuid
             # that's a problem. Log here.
@@ -200,6 +222,26 @@ class Verify:
             log_info('Invalid store data')
             raise InvalidReceipt
 
+    def check_db(self):
+        """
+        Verifies the decoded receipt against the database.
+
+        Requires that decode is run first.
+        """
+        self.check_install_data()
+        uuid = self.uuid
+
+        # Get the addon and user information from the installed table.
+        key = verify_key(self.addon_id, uuid)
+        cached = cache.get(key) if CACHE_TIMEOUT else None
+        if cached is not None:
+            statsd.incr('services.verify.cache.hit')
+            self.user_id, self.premium, self.purchase = cached
+            return
+
+        if CACHE_TIMEOUT:
+            statsd.incr('services.verify.cache.miss')
+        self.setup_db()
         sql = """SELECT id, user_id, premium_type FROM users_install
                  WHERE addon_id = %(addon_id)s
                  AND uuid = %(uuid)s LIMIT 1;"""
@@ -212,26 +254,43 @@ class Verify:
             raise InvalidReceipt
 
         pk, self.user_id, self.premium = result
-
-    def check_purchase(self):
+        if CACHE_TIMEOUT:
+            if self.premium == ADDON_PREMIUM:
+                # Cache the purchase along with the install.
+                self.purchase = self.get_purchase()
+            cache.set(key, (self.user_id, self.premium, self.purchase),
+                      CACHE_TIMEOUT)
+
+    def get_purchase(self):
         """
-        Verifies that the app has been purchased.
+        Returns the type of the purchase of the app by the user, None if
+        there isn't one.
         """
+        self.setup_db()
         sql = """SELECT id, type FROM addon_purchase
                  WHERE addon_id = %(addon_id)s
                  AND user_id = %(user_id)s LIMIT 1;"""
         self.cursor.execute(sql, {'addon_id': self.addon_id,
                                   'user_id': self.user_id})
         result = self.cursor.fetchone()
-        if not result:
+        return result[-1] if result else None
+
+    def check_purchase(self):
+        """
+        Verifies that the app has been purchased.
+        """
+        if self.purchase == UNKNOWN:
+            self.purchase = self.get_purchase()
+
+        if self.purchase is None:
             log_info('Invalid receipt, no purchase')
             raise InvalidReceipt
 
-        if result[-1] in [CONTRIB_REFUND, CONTRIB_CHARGEBACK]:
+        if self.purchase in [CONTRIB_REFUND, CONTRIB_CHARGEBACK]:
             log_info('Valid receipt, but refunded')
             raise RefundedReceipt
 
-        elif result[-1] == CONTRIB_PURCHASE:
+        elif self.purchase == CONTRIB_PURCHASE:
             log_info('Valid receipt')
             return
 
@@ -277,6 +336,117 @@ class Verify:
         return json.dumps({'status': 'expired'})
 
 
+class BatchVerify:
+    """
+    Verifies purchase receipts like `Verify.check_full` does, looking up the
+    installs and purchases of all of them with one query each.
+    """
+
+    def __init__(self, batch, environ):
+        # Each receipt is checked against the URL it would be verified at
+        # on its own.
+        path = environ['PATH_INFO'][:-len(BATCH_SUFFIX)]
+        environ = dict(environ, PATH_INFO=path)
+        self.verifies = [Verify(receipt, environ) for receipt in batch]
+        # This is so the unit tests can override the connection.
+        self.conn, self.cursor = None, None
+
+    def setup_db(self):
+        if not self.cursor:
+            self.conn = mypool.connect()
+            self.cursor = self.conn.cursor()
+
+    def check(self):
+        """
+        Returns a JSON list of what `Verify.check_full` would have returned
+        for each receipt, in the same order.
+        """
+        receipt_domain = urlparse(settings.WEBAPPS_RECEIPT_URL).netloc
+        results, pending = [None] * len(self.verifies), []
+        for i, verify in enumerate(self.verifies):
+            try:
+                verify.decoded = verify.decode()
+                verify.check_type('purchase-receipt')
+                verify.check_install_data()
+                verify.check_url(receipt_domain)
+            except InvalidReceipt:
+                results[i] = verify.invalid()
+            else:
+                pending.append(i)
+
+        missing = self.get_installs([self.verifies[i] for i in pending])
+        for i in pending:
+            verify = self.verifies[i]
+            if verify in missing:
+                log_info('No entry in users_install for uuid: %s'
+                         % verify.uuid)
+                results[i] = verify.invalid()
+            else:
+                results[i] = verify.check_premium()
+        return '[%s]' % ', '.join(results)
+
+    def get_installs(self, verifies):
+        """
+        Sets the install and purchase of each of `verifies`, from the cache
+        or the database. Returns those that weren't installed.
+        """
+        keys = dict((v, verify_key(v.addon_id, v.uuid)) for v in verifies)
+        cached = cache.get_many(keys.values()) if CACHE_TIMEOUT else {}
+        todo = []
+        for verify in verifies:
+            if keys[verify] in cached:
+                verify.user_id, verify.premium, verify.purchase = (
+                    cached[keys[verify]])
+            else:
+                todo.append(verify)
+        if CACHE_TIMEOUT:
+            statsd.incr('services.verify.cache.hit', len(verifies) - len(todo))
+            statsd.incr('services.verify.cache.miss', len(todo))
+        if not todo:
+            return set()
+
+        self.setup_db()
+        uuids = list(set(verify.uuid for verify in todo))
+        sql = """SELECT addon_id, uuid, user_id, premium_type
+                 FROM users_install WHERE uuid IN (%s);"""
+        self.cursor.execute(sql % ', '.join(['%s'] * len(uuids)), uuids)
+        # Like in the query, uuids compare case insensitively.
+        installs = dict(((addon_id, uuid.lower()), (user_id, premium))
+                        for addon_id, uuid, user_id, premium
+                        in self.cursor.fetchall())
+
+        missing, found = set(), []
+        for verify in todo:
+            install = installs.get((verify.addon_id,
+                                    unicode(verify.uuid).lower()))
+            if install:
+                verify.user_id, verify.premium = install
+                found.append(verify)
+            else:
+                missing.add(verify)
+
+        premium = [v for v in found if v.premium == ADDON_PREMIUM]
+        if premium:
+            addons = list(set(v.addon_id for v in premium))
+            users = list(set(v.user_id for v in premium))
+            sql = """SELECT addon_id, user_id, type FROM addon_purchase
+                     WHERE addon_id IN (%s) AND user_id IN (%s);"""
+            self.cursor.execute(sql % (', '.join(['%s'] * len(addons)),
+                                       ', '.join(['%s'] * len(users))),
+                                addons + users)
+            purchases = dict(((addon_id, user_id), type_)
+                             for addon_id, user_id, type_
+                             in self.cursor.fetchall())
+            for verify in premium:
+                verify.purchase = purchases.get((verify.addon_id,
+                                                 verify.user_id))
+
+        if CACHE_TIMEOUT:
+            cache.set_many(dict((keys[v], (v.user_id, v.premium, v.purchase))
+                                for v in found), CACHE_TIMEOUT)
+        return missing
+
+
 def get_headers(length):
     return [('Access-Control-Allow-Origin', '*'),
             ('Access-Control-Allow-Methods', 'POST'),
@@ -287,6 +457,25 @@ def get_headers(length):
 
 
 def decode_receipt(receipt):
+    """
+    Cracks the receipt using the private key, or returns what it cracked
+    to last time the same receipt was verified.
+    """
+    if not CACHE_TIMEOUT:
+        return _decode_receipt(receipt)
+
+    key = VERIFY_RECEIPT_KEY % hashlib.sha1(receipt).hexdigest()
+    decoded = cache.get(key)
+    if decoded is None:
+        statsd.incr('services.decode.cache.miss')
+        decoded = _decode_receipt(receipt)
+        cache.set(key, decoded, CACHE_TIMEOUT)
+    else:
+        statsd.incr('services.decode.cache.hit')
+    return decoded
+
+
+def _decode_receipt(receipt):
     """
     Cracks the receipt using the private key. This will probably change
     to using the cert at some point, especially when we get the HSM.
@@ -337,6 +526,28 @@ def receipt_check(environ):
     return output
 
 
+def batch_check(environ):
+    with statsd.timer('services.verify.batch'):
+        try:
+            batch = json.loads(environ['wsgi.input'].read())
+        except ValueError:
+            return 400, ''
+        if (not isinstance(batch, list) or
+            not all(isinstance(r, basestring) for r in batch)):
+            return 400, ''
+        if len(batch) > BATCH_SIZE:
+            return 413, ''
+
+        statsd.incr('services.verify.batch.receipts', len(batch))
+        try:
+            verify = BatchVerify([r.encode('utf-8') for r in batch],
+                                 environ)
+            return 200, verify.check()
+        except:
+            log_exception('<batch of %s>' % len(batch))
+            return 500, ''
+
+
 def application(environ, start_response):
     body = ''
     path = environ.get('PATH_INFO', '')
@@ -346,6 +557,8 @@ def application(environ, start_response):
         # Only allow POST through as per spec.
         if environ.get('REQUEST_METHOD') != 'POST':
             status = 405
+        elif path.endswith(BATCH_SUFFIX):
+            status, body = batch_check(environ)
         else:
             status, body = receipt_check(environ)
     start_response(status_codes[status], get_headers(len(body)))
@@ -42,12 +42,35 @@ COLLECTIONS_ICON_PATH = _polite_tmpdir()
 PACKAGER_PATH = _polite_tmpdir()
 REVIEWER_ATTACHMENTS_PATH = _polite_tmpdir()
 DUMPED_APPS_PATH = _polite_tmpdir()
+EXTRACTION_CACHE_PATH = _polite_tmpdir()
+ARCHIVE_INDEX_PATH = _polite_tmpdir()
 
 # We won't actually send an email.
 SEND_REAL_EMAIL = True
 
 # Turn off search engine indexing.
 USE_ELASTIC = False
+# Extraction threads would use their own database connections, which can't
+# see the data of the test transaction.
+ES_BULK_THREADS = 1
+# Same for the processes dumping apps.
+DUMPED_APPS_PROCESSES = 1
+# Fetch manifests one at a time, and fail right away instead of sleeping
+# between retries.
+MANIFEST_FETCH_THREADS = 1
+MANIFEST_FETCH_RETRIES = 0
+# Tests roll the database back but not the cache, cached translations would
+# outlive their test. The translation tests turn it on.
+TRANSLATION_CACHE_TIMEOUT = 0
+EXCLUDED_REGIONS_CACHE_TIMEOUT = 0
+# Same for receipt verifications, the verify tests turn it on.
+SERVICES_VERIFY_CACHE_TIMEOUT = 0
+SERVICES_THEME_UPDATE_TIMEOUT = 0
+OAUTH_CACHE_TIMEOUT = 0
+# The tests don't talk to redis, the nonce store and throttle tests mock
+# the connection.
+OAUTH_NONCE_BACKEND = 'db'
+API_THROTTLE_BACKEND = 'cache'
 
 # Ensure all validation code runs in tests:
 VALIDATE_ADDONS = True